@@ -1,62 +1,318 @@
 import os
+import json
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 import boto3
 import botocore
+from botocore.config import Config
+
+
+# The arXiv bucket, its files are paid for by the requester
+BUCKET = 'arxiv'
+
+# Default size of a single ranged request and number of parallel requests
+PART_SIZE = 16 * 1024 * 1024
+WORKERS   = 8
+
+# Size of the chunks streamed from a response into the file
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadError(Exception):
+  '''Exception raised if a downloaded file does not match the object.'''
+  pass
+
+
+# Clients shared by all the downloads by their pool size, boto3 clients
+# are thread-safe
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+
+def get_s3_client(max_connections=WORKERS):
+  '''Get the authenticated S3 client with a connection pool of the given
+     size, create it on the first call for that size.
+     Set AWS_ENDPOINT_URL to use a local S3-compatible stand-in.'''
+
+  pool_size = max(max_connections, 10)
+  with _s3_clients_lock:
+    if pool_size not in _s3_clients:
+      # Load environment variables
+      load_dotenv()
+
+      endpoint_url = os.environ.get('AWS_ENDPOINT_URL')
+      config = Config(
+        max_pool_connections=pool_size,
+        retries={'max_attempts': 5, 'mode': 'standard'},
+        s3={'addressing_style': 'path'} if endpoint_url else None,
+      )
+
+      # Create authenticated S3 client
+      _s3_clients[pool_size] = boto3.client(
+        's3',
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY'],
+        aws_secret_access_key=os.environ['AWS_SECRET_KEY'],
+        region_name='eu-west-3',
+        endpoint_url=endpoint_url,
+        config=config,
+      )
+
+    return _s3_clients[pool_size]
 
 
 def update_manifest():
   '''Update the manifest file in the S3 bucket'''
 
-  # Load environment variables
-  load_dotenv()
-
-  # Create authenticated S3 client
-  s3 = boto3.client(
-    's3',
-    aws_access_key_id=os.environ['AWS_ACCESS_KEY'],
-    aws_secret_access_key=os.environ['AWS_SECRET_KEY'],
-    region_name='eu-west-3'
-  )
+  s3 = get_s3_client()
 
   # Fetch the file
-  bucket     = 'arxiv'
   file_key   = 'src/arXiv_src_manifest.xml'
   local_file = 'amazon_s3/arXiv_src_manifest.xml'
   try:
-    response = s3.get_object(Bucket=bucket, Key=file_key, RequestPayer='requester')
-    with open(local_file, 'wb') as f:
-        f.write(response['Body'].read())
+    download_object(s3, file_key, local_file, workers=1)
     print(f"Saved manifest to: {local_file}")
-  except botocore.exceptions.ClientError as e:
+  except (
+    botocore.exceptions.ClientError,
+    botocore.exceptions.BotoCoreError,
+    DownloadError,
+  ) as e:
     print(f"Failed to download manifest: {e}")
 
 
-def download_source_tarball(source_file):
-  '''Download the source tarball from the S3 bucket'''
+def _part_digests(file_path, part_size):
+  '''Get the MD5 digests of the consecutive parts of a file.'''
 
-  # Load environment variables
-  load_dotenv()
+  digests = []
+  with open(file_path, 'rb') as f:
+    while True:
+      part = hashlib.md5()
+      read = 0
+      while read < part_size:
+        chunk = f.read(min(CHUNK_SIZE, part_size - read))
+        if not chunk:
+          break
+        part.update(chunk)
+        read += len(chunk)
+      if not read:
+        break
+      digests.append(part.digest())
+
+  return digests
+
+
+def compute_etags(file_path, num_parts=0):
+  '''Compute the possible S3 ETags of a file, `num_parts` is the number
+     after the dash of a multipart ETag, 0 for a single upload.'''
+
+  size = os.path.getsize(file_path)
+
+  # Single upload, the ETag is the MD5 of the content
+  if not num_parts:
+    digests = _part_digests(file_path, max(size, 1))
+    return [digests[0].hex() if digests else hashlib.md5().hexdigest()]
+
+  # The part size of the upload is unknown, try the usual ones.
+  # Returns no ETags if none of them fits.
+  mib = 1024 * 1024
+  part_sizes = {-(-size // num_parts // mib) * mib, 8 * mib, 16 * mib}
+
+  etags = []
+  for part_size in sorted(part_sizes):
+    if -(-size // part_size) != num_parts:
+      continue
+    digests = _part_digests(file_path, part_size)
+    etags.append(f'{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}')
+
+  return etags
+
+
+def _load_progress(progress_file, etag, size, part_size):
+  '''Get the parts finished by a previous download of the same object.'''
+
+  try:
+    with open(progress_file, 'r', encoding='utf-8') as f:
+      progress = json.load(f)
+  except (FileNotFoundError, ValueError):
+    return set()
+
+  # The object or the layout changed, start from scratch
+  layout = (progress.get('etag'), progress.get('size'), progress.get('part_size'))
+  if layout != (etag, size, part_size):
+    return set()
+
+  return set(progress.get('done', []))
 
-  # Create authenticated S3 client
-  s3 = boto3.client(
-    's3',
-    aws_access_key_id=os.environ['AWS_ACCESS_KEY'],
-    aws_secret_access_key=os.environ['AWS_SECRET_KEY'],
-    region_name='eu-west-3'
-  )
+
+def _save_progress(progress_file, etag, size, part_size, done):
+  '''Remember the finished parts, atomically.'''
+
+  progress = {
+    'etag':      etag,
+    'size':      size,
+    'part_size': part_size,
+    'done':      sorted(done),
+  }
+  tmp_file = progress_file + '.tmp'
+  with open(tmp_file, 'w', encoding='utf-8') as f:
+    json.dump(progress, f)
+  os.replace(tmp_file, progress_file)
+
+
+def download_object(
+  s3,
+  file_key,
+  local_file,
+  part_size=PART_SIZE,
+  workers=WORKERS,
+  on_chunk=None,
+  verify_etag=True,
+):
+  '''Download an object with concurrent ranged requests.
+
+     The parts are streamed straight into a `.part` file which is renamed
+     once its size and ETag match the object. An interrupted download
+     continues with the missing parts only. `on_chunk` is called with the
+     size of every received chunk, e.g. to limit the bandwidth. Without
+     `verify_etag` the file is not read again, for callers which check
+     its checksum themselves.'''
+
+  # Size and version of the object
+  head = s3.head_object(Bucket=BUCKET, Key=file_key, RequestPayer='requester')
+  size = head['ContentLength']
+  etag = head['ETag'].strip('"')
+
+  local_dir = os.path.dirname(local_file)
+  if local_dir:
+    os.makedirs(local_dir, exist_ok=True)
+  part_file     = local_file + '.part'
+  progress_file = local_file + '.progress.json'
+
+  # Continue a previous download of the same object
+  done = _load_progress(progress_file, etag, size, part_size)
+  if not os.path.exists(part_file):
+    done = set()
+  with open(part_file, 'ab') as f:
+    f.truncate(size)
+
+  parts = [
+    (index, start, min(start + part_size, size) - 1)
+    for index, start in enumerate(range(0, size, part_size))
+    if index not in done
+  ]
+  if done:
+    print(f"Resuming {local_file}: {len(done)} parts already downloaded")
+
+  lock = threading.Lock()
+  fd   = os.open(part_file, os.O_WRONLY)
+
+  def fetch_part(part):
+    '''Stream a single byte range into its place in the file.'''
+    index, start, end = part
+    response = s3.get_object(
+      Bucket=BUCKET,
+      Key=file_key,
+      Range=f'bytes={start}-{end}',
+      IfMatch=head['ETag'],
+      RequestPayer='requester',
+    )
+    position = start
+    for chunk in response['Body'].iter_chunks(CHUNK_SIZE):
+      if on_chunk:
+        on_chunk(len(chunk))
+      os.pwrite(fd, chunk, position)
+      position += len(chunk)
+    if position != end + 1:
+      raise DownloadError(f"Part {index} of {file_key} is incomplete")
+
+    with lock:
+      done.add(index)
+      _save_progress(progress_file, etag, size, part_size, done)
+
+  try:
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+      # Raise the first error after all the parts have stopped
+      for future in [executor.submit(fetch_part, part) for part in parts]:
+        future.result()
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+  # Make sure the file matches the object
+  if os.path.getsize(part_file) != size:
+    raise DownloadError(f"Size of {local_file} does not match {file_key}")
+  num_parts = int(etag.split('-')[1]) if '-' in etag else 0
+  verifiable = verify_etag and len(etag) >= 32
+  etags = compute_etags(part_file, num_parts) if verifiable else []
+  if etags and etag not in etags:
+    # Corrupted beyond repair, the next attempt starts from scratch
+    os.remove(part_file)
+    if os.path.exists(progress_file):
+      os.remove(progress_file)
+    raise DownloadError(f"ETag of {local_file} does not match {file_key}")
+
+  os.replace(part_file, local_file)
+  if os.path.exists(progress_file):
+    os.remove(progress_file)
+
+  return local_file
+
+
+def download_source_tarball(source_file, part_size=PART_SIZE, workers=WORKERS):
+  '''Download the source tarball from the S3 bucket'''
+
+  s3 = get_s3_client(workers)
 
   # Fetch the file
-  bucket     = 'arxiv'
   file_key   = f'src/{source_file}'
   local_file = f'amazon_s3/files/{source_file}'
   try:
-    response = s3.get_object(Bucket=bucket, Key=file_key, RequestPayer='requester')
-    os.makedirs('files', exist_ok=True)
-    with open(local_file, 'wb') as f:
-        f.write(response['Body'].read())
+    download_object(s3, file_key, local_file, part_size, workers)
     print(f"Source tarball saved to: {local_file}")
-  except botocore.exceptions.ClientError as e:
+    return local_file
+  except (
+    botocore.exceptions.ClientError,
+    botocore.exceptions.BotoCoreError,
+    DownloadError,
+  ) as e:
     print(f"Failed to download the tarball: {e}")
+    return None
+
+
+def main():
+  '''Download source tarballs from the arXiv bucket.'''
+
+  parser = argparse.ArgumentParser(
+    description="Download arXiv source tarballs from S3."
+  )
+  parser.add_argument(
+    "tarballs", nargs="*", help="Names of the .tar files to download"
+  )
+  parser.add_argument(
+    "--manifest", action="store_true", help="Update the manifest first"
+  )
+  parser.add_argument(
+    "--part-size",
+    type=int,
+    default=PART_SIZE // (1024 * 1024),
+    help="Size of a single ranged request in MB",
+  )
+  parser.add_argument(
+    "--workers",
+    type=int,
+    default=WORKERS,
+    help="Number of parallel ranged requests",
+  )
+  args = parser.parse_args()
+
+  if args.manifest:
+    update_manifest()
+  for source_file in args.tarballs:
+    download_source_tarball(source_file, args.part_size * 1024 * 1024, args.workers)
+
 
-download_source_tarball('arXiv_src_0001_001.tar')
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,148 @@
+import os
+import re
+import hashlib
+import argparse
+from urllib.parse import urlsplit, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# Byte range of a ranged GET request
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Size of the chunks sent to the client
+CHUNK_SIZE = 1024 * 1024
+
+
+def make_handler(root_dir):
+  '''Create a request handler serving the files under the root directory.
+     The first path component is the bucket, the rest is the key.'''
+
+  etags = {}
+
+  def get_etag(path):
+    '''MD5 of the file, like an object uploaded in a single request.'''
+    stat = os.stat(path)
+    cached = etags.get(path)
+    if cached and cached[0] == (stat.st_size, stat.st_mtime):
+      return cached[1]
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+      for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    etag = f'"{digest.hexdigest()}"'
+    etags[path] = ((stat.st_size, stat.st_mtime), etag)
+    return etag
+
+  class S3StandInHandler(BaseHTTPRequestHandler):
+    '''Serve HEAD and (ranged) GET object requests with path-style addressing.'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def _object_path(self):
+      '''Local file of the requested object, None if it does not exist.'''
+      path = os.path.normpath(unquote(urlsplit(self.path).path)).lstrip('/')
+      if path.startswith('..'):
+        return None
+      path = os.path.join(root_dir, path)
+      return path if os.path.isfile(path) else None
+
+    def _send_empty(self, status):
+      self.send_response(status)
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+
+    def _serve(self, send_body):
+      path = self._object_path()
+      if path is None:
+        self._send_empty(404)
+        return
+      size = os.path.getsize(path)
+      etag = get_etag(path)
+
+      # Conditional request on the version of the object
+      if_match = self.headers.get('If-Match')
+      if if_match and if_match != etag:
+        self._send_empty(412)
+        return
+
+      # Whole object or a single byte range
+      start, end, status = 0, size - 1, 200
+      match = RANGE_PATTERN.match(self.headers.get('Range', ''))
+      if match and (match.group(1) or match.group(2)):
+        if match.group(1):
+          start = int(match.group(1))
+          end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+          start = max(size - int(match.group(2)), 0)
+        if start >= size:
+          self._send_empty(416)
+          return
+        status = 206
+
+      self.send_response(status)
+      self.send_header('Content-Length', str(end - start + 1))
+      self.send_header('ETag', etag)
+      self.send_header('Accept-Ranges', 'bytes')
+      if status == 206:
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+      self.end_headers()
+      if not send_body:
+        return
+
+      with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining:
+          chunk = f.read(min(CHUNK_SIZE, remaining))
+          if not chunk:
+            break
+          self.wfile.write(chunk)
+          remaining -= len(chunk)
+
+    def do_HEAD(self):
+      self._serve(send_body=False)
+
+    def do_GET(self):
+      self._serve(send_body=True)
+
+    def log_message(self, format, *args):
+      # Keep the console quiet
+      pass
+
+  return S3StandInHandler
+
+
+def serve(root_dir='amazon_s3/stand_in', host='127.0.0.1', port=9000):
+  '''Serve the files as S3 objects until interrupted.'''
+
+  server = ThreadingHTTPServer((host, port), make_handler(root_dir))
+  print(
+    f"Serving {root_dir} at http://{host}:{port}, "
+    f"run the downloads with AWS_ENDPOINT_URL=http://{host}:{port}"
+  )
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+
+def main():
+  '''Local S3-compatible stand-in for the arXiv bucket.'''
+
+  parser = argparse.ArgumentParser(
+    description="Serve local files as S3 objects, e.g. <root>/arxiv/src/*.tar."
+  )
+  parser.add_argument(
+    "--root", default="amazon_s3/stand_in", help="Directory with the buckets"
+  )
+  parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+  parser.add_argument("--port", type=int, default=9000, help="Port to bind")
+  args = parser.parse_args()
+
+  serve(args.root, args.host, args.port)
+
+
+if __name__ == '__main__':
+  main()
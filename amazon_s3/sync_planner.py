@@ -0,0 +1,390 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import shlex
+import hashlib
+import argparse
+import threading
+import subprocess
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+
+from amazon_s3.bucket_access import (
+  PART_SIZE,
+  WORKERS,
+  CHUNK_SIZE,
+  DownloadError,
+  get_s3_client,
+  update_manifest,
+  download_object,
+)
+from src.journal import (
+  is_journal_complete,
+)
+
+
+# Requester-pays transfer price out of the bucket region, USD per GB
+PRICE_PER_GB = 0.09
+
+# Checksums of the local tarballs, so they are hashed only once
+VERIFIED_NAME = '.verified.json'
+
+# Processing script, found next to this package whatever the working directory
+PAPERS_SCRIPT = os.path.join(
+  os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'papers.py'
+)
+
+
+def parse_manifest(manifest_file):
+  '''Parse the arXiv source manifest into a list of tarball descriptions.'''
+
+  tarballs = []
+  for _, elem in ET.iterparse(manifest_file):
+    if elem.tag != 'file':
+      continue
+    key = elem.findtext('filename')
+    tarballs.append({
+      'name':      os.path.basename(key),
+      'key':       key,
+      'size':      int(elem.findtext('size')),
+      'md5':       elem.findtext('md5sum'),
+      'yymm':      elem.findtext('yymm'),
+      'num_items': int(elem.findtext('num_items')),
+    })
+    elem.clear()
+
+  return tarballs
+
+
+def full_year_month(yymm):
+  '''Turn the manifest yymm into a sortable yyyymm, arXiv starts in 1991.'''
+  return ('19' if int(yymm[:2]) >= 91 else '20') + yymm
+
+
+def file_md5(file_path):
+  '''MD5 of a file, read in chunks.'''
+  digest = hashlib.md5()
+  with open(file_path, 'rb') as f:
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+class VerifiedFiles:
+  '''Checksums of the local tarballs, valid as long as the file is unchanged.'''
+
+  def __init__(self, files_dir):
+    self.path = os.path.join(files_dir, VERIFIED_NAME)
+    self._lock = threading.Lock()
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        self._files = json.load(f)
+    except (FileNotFoundError, ValueError):
+      self._files = {}
+
+  def md5(self, file_path):
+    '''MD5 of the local file, hashed again only if the file changed.'''
+    stat = os.stat(file_path)
+    name = os.path.basename(file_path)
+    with self._lock:
+      known = self._files.get(name)
+    if known and known[:2] == [stat.st_size, stat.st_mtime]:
+      return known[2]
+
+    digest = file_md5(file_path)
+    with self._lock:
+      self._files[name] = [stat.st_size, stat.st_mtime, digest]
+      tmp_path = self.path + '.tmp'
+      with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(self._files, f)
+      os.replace(tmp_path, self.path)
+
+    return digest
+
+
+def output_type(process_args):
+  '''Output type papers.py writes with the given arguments.'''
+  parser = argparse.ArgumentParser(add_help=False)
+  parser.add_argument('--output', default='jsonl')
+  return parser.parse_known_args(process_args)[0].output
+
+
+def bucket_status(tarball_name, database_dir, output='jsonl'):
+  '''Check how far the processing of the bucket got: 'done' once a run
+     went through the whole bucket, 'partial' if an interrupted run left
+     some output behind, None if it was never processed.'''
+
+  base = re.sub(r'^arXiv_src_(.*)\.tar$', r'\1', tarball_name)
+  base = os.path.join(database_dir, base)
+
+  # The progress journal knows if the run finished
+  journal_file = f'{base}.{output}.progress.jsonl'
+  if is_journal_complete(journal_file):
+    return 'done'
+
+  ext = {'jsonl': '.jsonl', 'sqlite': '.sqlite', 'sharded': ''}[output]
+  if os.path.exists(journal_file) or os.path.exists(base + ext):
+    return 'partial'
+
+  return None
+
+
+def plan_sync(
+  tarballs, files_dir, database_dir, verified, budget_gb=None, output='jsonl'
+):
+  '''Sort the tarballs into 'processed', 'process' (downloaded and verified)
+     and 'download' (missing or changed). The downloads stop at the budget,
+     the rest of them are 'skipped'. Interrupted runs count as unprocessed.'''
+
+  plan = {'processed': [], 'process': [], 'download': [], 'skipped': []}
+  planned_bytes = 0
+
+  for tarball in tarballs:
+    if bucket_status(tarball['name'], database_dir, output) == 'done':
+      plan['processed'].append(tarball)
+      continue
+
+    # Downloaded already and still matching the manifest
+    local_file = os.path.join(files_dir, tarball['name'])
+    if (
+      os.path.exists(local_file)
+      and os.path.getsize(local_file) == tarball['size']
+      and verified.md5(local_file) == tarball['md5']
+    ):
+      plan['process'].append(tarball)
+      continue
+
+    # Stay within the transfer budget
+    planned_gb = (planned_bytes + tarball['size']) / 1e9
+    if budget_gb is not None and planned_gb > budget_gb:
+      plan['skipped'].append(tarball)
+      continue
+    planned_bytes += tarball['size']
+    plan['download'].append(tarball)
+
+  return plan
+
+
+class BandwidthLimiter:
+  '''Token bucket shared by all the download threads.'''
+
+  def __init__(self, bytes_per_second):
+    self.rate = bytes_per_second
+    self._lock = threading.Lock()
+    self._allowance = 0.0
+    self._last = time.monotonic()
+
+  def consume(self, num_bytes):
+    '''Wait until `num_bytes` more can be transferred.'''
+    with self._lock:
+      now = time.monotonic()
+      # Allow at most a second worth of burst
+      refill = (now - self._last) * self.rate
+      self._allowance = min(self.rate, self._allowance + refill)
+      self._last = now
+      self._allowance -= num_bytes
+      wait = -self._allowance / self.rate if self._allowance < 0 else 0
+    if wait > 0:
+      time.sleep(wait)
+
+
+def process_tarballs(tasks, process_args, database_dir='database'):
+  '''Run papers.py on every tarball put into the queue, None stops.'''
+
+  output = output_type(process_args)
+  failed = []
+  while True:
+    tarball_name = tasks.get()
+    if tarball_name is None:
+      return failed
+    print(f"Processing {tarball_name}")
+    command = [sys.executable, PAPERS_SCRIPT, tarball_name] + process_args
+    # Continue an interrupted run, papers.py would ask before overwriting
+    if bucket_status(tarball_name, database_dir, output) == 'partial':
+      command.append('--resume')
+    if subprocess.run(command, stdin=subprocess.DEVNULL).returncode != 0:
+      failed.append(tarball_name)
+
+
+def sync(
+  tarballs,
+  files_dir='amazon_s3/files',
+  database_dir='database',
+  parallel_files=2,
+  part_size=PART_SIZE,
+  workers=WORKERS,
+  bandwidth=None,
+  budget_gb=None,
+  process=False,
+  process_args=(),
+  dry_run=False,
+):
+  '''Download the missing or changed tarballs and queue their processing.'''
+
+  verified = VerifiedFiles(files_dir)
+  plan = plan_sync(
+    tarballs,
+    files_dir,
+    database_dir,
+    verified,
+    budget_gb,
+    output_type(list(process_args)),
+  )
+
+  download_gb = sum(t['size'] for t in plan['download']) / 1e9
+  print(
+    f"{len(plan['processed'])} processed, {len(plan['process'])} to process, "
+    f"{len(plan['download'])} to download ({download_gb:.2f} GB, "
+    f"about ${download_gb * PRICE_PER_GB:.2f}), "
+    f"{len(plan['skipped'])} over the budget"
+  )
+  if dry_run:
+    for tarball in plan['download']:
+      print(f"  download {tarball['name']} ({tarball['size'] / 1e6:.1f} MB)")
+    return plan
+
+  # A single consumer processes the buckets as soon as they are ready
+  tasks = queue.Queue()
+  consumer = None
+  if process:
+    consumer = ThreadPoolExecutor(max_workers=1)
+    processed = consumer.submit(
+      process_tarballs, tasks, list(process_args), database_dir
+    )
+    for tarball in plan['process']:
+      tasks.put(tarball['name'])
+
+  limiter = BandwidthLimiter(bandwidth) if bandwidth else None
+  s3 = get_s3_client(parallel_files * workers)
+
+  def fetch(tarball):
+    '''Download and verify a single tarball.'''
+    local_file = os.path.join(files_dir, tarball['name'])
+    try:
+      download_object(
+        s3,
+        tarball['key'],
+        local_file,
+        part_size,
+        workers,
+        on_chunk=limiter.consume if limiter else None,
+        # The manifest checksum below covers the content already
+        verify_etag=False,
+      )
+    except (
+      botocore.exceptions.ClientError,
+      botocore.exceptions.BotoCoreError,
+      DownloadError,
+    ) as e:
+      print(f"Failed to download {tarball['name']}: {e}")
+      return False
+
+    # The manifest has the final word on the content
+    if verified.md5(local_file) != tarball['md5']:
+      print(f"Checksum of {tarball['name']} does not match the manifest")
+      os.remove(local_file)
+      return False
+
+    print(f"Downloaded and verified {tarball['name']}")
+    if process:
+      tasks.put(tarball['name'])
+    return True
+
+  try:
+    with ThreadPoolExecutor(max_workers=max(parallel_files, 1)) as executor:
+      results = list(executor.map(fetch, plan['download']))
+  finally:
+    if consumer:
+      tasks.put(None)
+      consumer.shutdown()
+
+  print(f"Downloaded {sum(results)} of {len(results)} tarballs")
+  if consumer and processed.result():
+    print(f"Processing failed for: {', '.join(processed.result())}")
+
+  return plan
+
+
+def main():
+  '''Bring the local tarballs and databases up to date with the manifest.'''
+
+  parser = argparse.ArgumentParser(
+    description="Download the missing arXiv source tarballs listed in the manifest."
+  )
+  parser.add_argument(
+    "--manifest",
+    default="amazon_s3/arXiv_src_manifest.xml",
+    help="Path to the manifest, downloaded if missing",
+  )
+  parser.add_argument(
+    "--update-manifest", action="store_true", help="Download the manifest again"
+  )
+  parser.add_argument("--from", dest="first", help="First yymm to sync, e.g. 0001")
+  parser.add_argument("--to", dest="last", help="Last yymm to sync, e.g. 0012")
+  parser.add_argument(
+    "--parallel-files", type=int, default=2, help="Tarballs downloaded at once"
+  )
+  parser.add_argument(
+    "--part-size",
+    type=int,
+    default=PART_SIZE // (1024 * 1024),
+    help="Size of a single ranged request in MB",
+  )
+  parser.add_argument(
+    "--workers",
+    type=int,
+    default=WORKERS,
+    help="Number of parallel ranged requests per tarball",
+  )
+  parser.add_argument(
+    "--bandwidth", type=float, help="Overall download limit in MB/s"
+  )
+  parser.add_argument(
+    "--budget",
+    type=float,
+    help=f"Requester-pays budget in USD, at ${PRICE_PER_GB} per GB",
+  )
+  parser.add_argument(
+    "--process",
+    action="store_true",
+    help="Run papers.py on every tarball as soon as it is verified",
+  )
+  parser.add_argument(
+    "--process-args",
+    default="",
+    help="Extra arguments for papers.py, e.g. \"--workers 4 --stream\"",
+  )
+  parser.add_argument(
+    "--dry-run", action="store_true", help="Only show what would be done"
+  )
+  args = parser.parse_args()
+
+  if args.update_manifest or not os.path.exists(args.manifest):
+    update_manifest()
+  tarballs = parse_manifest(args.manifest)
+
+  # Only the requested months
+  first = full_year_month(args.first) if args.first else ''
+  last  = full_year_month(args.last) if args.last else '999999'
+  tarballs = [t for t in tarballs if first <= full_year_month(t['yymm']) <= last]
+
+  sync(
+    tarballs,
+    parallel_files=args.parallel_files,
+    part_size=args.part_size * 1024 * 1024,
+    workers=args.workers,
+    bandwidth=args.bandwidth * 1024 * 1024 if args.bandwidth else None,
+    budget_gb=args.budget / PRICE_PER_GB if args.budget is not None else None,
+    process=args.process,
+    process_args=shlex.split(args.process_args),
+    dry_run=args.dry_run,
+  )
+
+
+if __name__ == '__main__':
+  main()
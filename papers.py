@@ -1,34 +1,414 @@
 import os
-import time
-import json
 import re
+import glob
+import shutil
+import functools
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from rich import print
-
-from src.aesthetics import (
-    sep_line,
-    header,
-    link,
-)
 from src.entries import (
     new_entry,
 )
 from src.arxiv_api import (
     fetch_paper_metadata,
-    fetch_paper_oaipmh,
-    fetch_full_month_oaipmh,
-    match_paper_metadata_xml,
+    resolve_leftover_metadata,
+    month_range,
     match_paper_metadata_json,
+    match_buckets_metadata_json,
     download_paper,
-    extract_source,
-    copy_source_tex,
-    extract_plain_text,
 )
 from src.bucket_tools import (
     get_bucket_year_month,
     extract_bucket_archive,
+    list_bucket_archive,
+    iter_bucket_archive,
+    iter_s3_bucket_archive,
+    remove_archive,
+)
+from src.http_cache import (
+    configure_http_cache,
+)
+from src.metadata_store import (
+    update_metadata_store,
+    update_harvested_metadata,
+    open_metadata_store,
+    lookup_metadata_record,
+    lookup_metadata_records,
+)
+from src.journal import (
+    JsonlSink,
+    ProgressJournal,
+    repair_jsonl,
+    read_written_ids,
+)
+from src.paper_store import (
+    PaperStore,
+    read_stored_ids,
+)
+from src.shards import (
+    ShardedJsonlSink,
+    read_shard_index,
 )
+from src.background import (
+    MetadataFetcher,
+)
+from src.pipeline import (
+    process_entries,
+)
+from src.metrics import (
+    RunMetrics,
+    timed,
+)
+from src.log import (
+    LEVELS,
+    ProgressBar,
+    configure_logging,
+    default_log_file,
+    log_info,
+    log_warning,
+    log_error,
+    log_separator,
+)
+from amazon_s3.bucket_access import (
+    download_source_tarball,
+)
+
+
+# Working directories
+DATABASE_DIR = "database"
+ARCHIVE_DIR = "papers/archives"
+EXTRACTED_DIR = "papers/extracted"
+SOURCES_DIR = "papers/sources"
+BUCKET_DIR = "amazon_s3/files"
+LOG_DIR = "logs"
+
+# Metadata database file
+METADATA_FILE = "metadata/arxiv-metadata-oai-snapshot.json"
+METADATA_STORE = "metadata/arxiv-metadata.sqlite"
+
+# Size assumed for a bucket tarball which is not downloaded yet
+ESTIMATED_BUCKET_SIZE = 1024**3
+
+
+# Months whose metadata store is ready in this run, with a lock per month
+# so that the buckets of other months are not held up
+_prepared_months = {}
+_month_locks = {}
+_month_locks_lock = threading.Lock()
+
+# The snapshot is indexed by a single bucket at a time
+_snapshot_lock = threading.Lock()
+
+
+def prepare_metadata_store(year, month, metadata_file, metadata_store):
+    """Bring the metadata store up to date for the bucket, once per month.
+
+    Returns False if there is no bulk metadata for the year and month."""
+
+    with _month_locks_lock:
+        lock = _month_locks.setdefault((year, month), threading.Lock())
+
+    with lock:
+        if (year, month) not in _prepared_months:
+            _prepared_months[(year, month)] = _prepare_metadata_store(
+                year, month, metadata_file, metadata_store
+            )
+        return _prepared_months[(year, month)]
+
+
+def _prepare_metadata_store(year, month, metadata_file, metadata_store):
+    """Update the store from the snapshot or harvest the month into it."""
+
+    # If we have the OAI-PMH metadata database file
+    if os.path.exists(metadata_file):
+        # Index the snapshot once, later runs only pick up the changes
+        with _snapshot_lock:
+            update_metadata_store(metadata_file, metadata_store)
+        return True
+
+    # If the year and month is later than the start of OAI-PMH
+    if year > 2007 or (year == 2007 and month > 4):
+        # Harvest the days not yet in the store, shared by all buckets
+        update_harvested_metadata(metadata_store, *month_range(year, month))
+        return True
+
+    return False
+
+
+def stream_bucket_entries(
+    sources, skipped, known, metadata_store, archive_dir, batch_size, emit
+):
+    """Pair the papers streaming from the bucket with their metadata.
+
+    Yields (entry, gzip bytes) pairs as soon as the papers arrive. Papers
+    without bulk metadata are parked in `archive_dir` and yielded with None
+    once the stream has ended and their metadata is resolved. `emit` receives
+    every new entry."""
+
+    # A single connection for the point lookups of the whole stream
+    conn = open_metadata_store(metadata_store) if metadata_store else None
+
+    leftovers = []
+    try:
+        for arxiv_id, data in sources:
+            if arxiv_id in skipped:
+                continue
+
+            # Reuse the known metadata or look it up in the store
+            entry = known.get(arxiv_id)
+            if entry is None and conn is not None:
+                record = lookup_metadata_record(conn, arxiv_id)
+                records = [record] if record else []
+                matched = match_buckets_metadata_json({None: {arxiv_id}}, records)
+                if matched[None]:
+                    entry = matched[None][0]
+                    emit(entry)
+
+            if entry is None:
+                # Keep the archive on disk until the metadata is resolved
+                paper = new_entry(arxiv_id)
+                archive_path = os.path.join(archive_dir, paper["safe_id"] + ".gz")
+                with open(archive_path, "wb") as f:
+                    f.write(data)
+                leftovers.append(paper)
+                continue
+
+            yield entry, data
+    finally:
+        if conn is not None:
+            conn.close()
+
+    if not leftovers:
+        return
+
+    # Deal with the rest of the papers in batches, then one by one
+    resolved = resolve_leftover_metadata(leftovers, batch_size)
+    resolved_ids = {id(paper) for paper in resolved}
+    for paper in leftovers:
+        if id(paper) not in resolved_ids:
+            remove_archive(paper["arxiv_id"], archive_dir)
+    for entry in resolved:
+        emit(entry)
+        yield entry, None
+
+
+def prepare_bucket(args, bucket_name, metrics=None):
+    """Get the bucket ready for processing.
+
+    Downloads the tarball if it is missing and asked to, unpacks it (or only
+    lists it when streaming) and brings the metadata store up to date.
+    Returns the arXiv ids of the papers and whether bulk metadata exists."""
+
+    if args.from_s3:
+        # The papers are only known once they arrive
+        papers = []
+    else:
+        bucket_path = os.path.join(BUCKET_DIR, bucket_name)
+        if args.download_missing and not os.path.exists(bucket_path):
+            if not download_source_tarball(bucket_name):
+                raise RuntimeError(f"Failed to download {bucket_name}")
+
+        # Unpack the archive with papers, or only list them when streaming
+        with timed(metrics, "tar", os.path.getsize(bucket_path)):
+            if args.stream:
+                papers = list_bucket_archive(bucket_name, bucket_dir=BUCKET_DIR)
+            else:
+                papers = extract_bucket_archive(
+                    bucket_name, bucket_dir=BUCKET_DIR, archive_dir=ARCHIVE_DIR
+                )
+        if not papers:
+            raise RuntimeError("No papers found in the bucket")
+
+    # The metadata of the month is shared by all its buckets
+    year, month = get_bucket_year_month(bucket_name)
+    if not year or not month:
+        raise RuntimeError("Failed to extract year and month from the bucket name")
+    with timed(metrics, "metadata"):
+        bulk_metadata = prepare_metadata_store(
+            year, month, METADATA_FILE, METADATA_STORE
+        )
+
+    return papers, bulk_metadata
+
+
+def has_room_for(args, bucket_name):
+    """Check if prefetching the bucket leaves enough free disk space."""
+
+    # The unpacked papers take about as much space as the tarball
+    bucket_path = os.path.join(BUCKET_DIR, bucket_name)
+    if os.path.exists(bucket_path):
+        needed = 0 if args.stream else os.path.getsize(bucket_path)
+    elif args.download_missing:
+        needed = ESTIMATED_BUCKET_SIZE * (1 if args.stream else 2)
+    else:
+        needed = 0
+
+    free = shutil.disk_usage(ARCHIVE_DIR).free
+    return free - needed >= args.min_free_gb * 1e9
+
+
+def expand_bucket_names(patterns):
+    """Turn the bucket names, glob patterns and @list files into bucket names."""
+
+    bucket_names = []
+    for pattern in patterns:
+        if pattern.startswith("@"):
+            # One bucket name or pattern per line
+            with open(pattern[1:], "r", encoding="utf-8") as f:
+                bucket_names += expand_bucket_names(
+                    [line.strip() for line in f if line.strip()]
+                )
+        elif glob.has_magic(pattern):
+            # Match the tarballs already in the bucket directory
+            local = sorted(glob.glob(os.path.join(BUCKET_DIR, pattern)))
+            bucket_names += [os.path.basename(path) for path in local]
+        else:
+            bucket_names.append(pattern)
+
+    # Keep the first occurrence of every bucket
+    return list(dict.fromkeys(bucket_names))
+
+
+def prepared_siblings(args, bucket_names, i, pending, matched):
+    """The arXiv ids of the prefetched buckets of the same month as bucket i.
+
+    Only the buckets already prepared and not yet matched are included, so
+    the metadata of the bucket never waits for the next ones."""
+
+    # The papers streamed from S3 are only known once they arrive
+    if args.from_s3:
+        return {}
+
+    month = get_bucket_year_month(bucket_names[i])
+    siblings = {}
+    for j, future in sorted(pending.items()):
+        bucket_name = bucket_names[j]
+        if (
+            not future.done()
+            or future.exception()
+            or bucket_name in matched
+            or get_bucket_year_month(bucket_name) != month
+        ):
+            continue
+        papers, bulk_metadata = future.result()
+        if bulk_metadata:
+            siblings[bucket_name] = set(papers)
+
+    return siblings
+
+
+def run_buckets(args, bucket_names):
+    """Process the buckets one after another, return the exit code.
+
+    While a bucket is being processed, the next ones are prefetched in the
+    background as long as the lookahead window and the free disk space allow."""
+
+    lookahead = args.prefetch if len(bucket_names) > 1 else 0
+
+    # Forking the processing pools next to running threads is not safe
+    start_method = "forkserver" if args.background_metadata or lookahead else None
+
+    # The metrics of a bucket include its prefetching
+    metrics = [RunMetrics(bucket_name) for bucket_name in bucket_names]
+
+    # Metadata matched ahead for the next buckets of the same month
+    matched = {}
+
+    failed = []
+    pending = {}
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        for i, bucket_name in enumerate(bucket_names):
+            # Fill the lookahead window in order, stop once the disk is full
+            for j in range(i + 1, min(i + 1 + lookahead, len(bucket_names))):
+                if j in pending:
+                    continue
+                if not has_room_for(args, bucket_names[j]):
+                    break
+                pending[j] = prefetcher.submit(
+                    prepare_bucket, args, bucket_names[j], metrics[j]
+                )
+
+            if len(bucket_names) > 1:
+                log_info(
+                    "Bucket {number} of {total}: {bucket}",
+                    "header",
+                    number=i + 1,
+                    total=len(bucket_names),
+                    bucket=bucket_name,
+                )
+            prepared = pending.pop(i, None)
+            find_siblings = functools.partial(
+                prepared_siblings, args, bucket_names, i, pending, matched
+            )
+            if run_bucket(
+                args,
+                bucket_name,
+                prepared,
+                start_method,
+                metrics[i],
+                find_siblings,
+                matched,
+            ):
+                failed.append(bucket_name)
+            # The bucket could have failed before taking its entries
+            matched.pop(bucket_name, None)
+
+    if len(bucket_names) > 1:
+        log_info(
+            "Processed {processed} of {total} buckets",
+            processed=len(bucket_names) - len(failed),
+            total=len(bucket_names),
+        )
+        if failed:
+            log_error("Failed buckets: {buckets}", buckets=", ".join(failed))
+
+    return 1 if failed else 0
+
+
+def resolve_bucket_metadata(
+    papers,
+    metadata_store,
+    batch_size,
+    emit,
+    workers=1,
+    start_method=None,
+    siblings=None,
+    matched=None,
+):
+    """Resolve the metadata of the papers, `emit` receives every new entry.
+
+    `metadata_store` is None if there is no bulk metadata for the bucket.
+    `siblings` maps the names of other buckets of the same month to their
+    arXiv ids, they are matched in the same pass and their entries are put
+    in the `matched` dictionary for later."""
+
+    if metadata_store and siblings:
+        # Look up the records of all the buckets at once
+        buckets = {None: papers, **siblings}
+        arxiv_ids = set().union(*buckets.values())
+        records = lookup_metadata_records(metadata_store, arxiv_ids)
+        entries = match_buckets_metadata_json(buckets, records, workers, start_method)
+        log_info(
+            "Successfully matched {count} papers with metadata, and {ahead} "
+            "of the next buckets",
+            count=len(entries[None]),
+            ahead=sum(len(entries[name]) for name in siblings),
+        )
+        for entry in entries.pop(None):
+            emit(entry)
+        matched.update(entries)
+    elif metadata_store:
+        # Look up only the records of the papers in the bucket
+        records = lookup_metadata_records(metadata_store, papers)
+        # Match the metadata with the papers
+        for entry in match_paper_metadata_json(papers, records, workers, start_method):
+            emit(entry)
+
+    # Deal with the rest of the papers in batches, then one by one
+    leftovers = [new_entry(arxiv_id) for arxiv_id in sorted(papers)]
+    if leftovers:
+        resolve_leftover_metadata(leftovers, batch_size, on_resolved=emit)
 
 
 def main():
@@ -38,152 +418,407 @@ def main():
     parser = argparse.ArgumentParser(
         description="Process arXiv bucket tarball and build database."
     )
-    parser.add_argument("tarball", help="Name of the .tar file to process")
+    parser.add_argument(
+        "tarballs",
+        nargs="+",
+        metavar="tarball",
+        help="Names of the .tar files to process, glob patterns matching the "
+        "downloaded ones or @file with one name per line",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes converting papers in parallel",
+    )
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="Write papers as they finish instead of in the input order",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Process the paper sources in memory without intermediate files",
+    )
+    parser.add_argument(
+        "--keep-intermediate",
+        action="store_true",
+        help="With --stream, still write the intermediate files for debugging",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of leftover papers per arXiv API query, 1 disables batching",
+    )
+    parser.add_argument(
+        "--http-cache",
+        choices=["off", "record", "replay"],
+        default="off",
+        help="Cache the arXiv responses (record) or only use the cached ones (replay)",
+    )
+    parser.add_argument(
+        "--http-cache-dir",
+        default="cache/http",
+        help="Directory of the arXiv response cache",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run, skip the papers already finished "
+        "and retry the failed ones",
+    )
+    parser.add_argument(
+        "--background-metadata",
+        action="store_true",
+        help="Resolve the metadata in the background while processing the papers",
+    )
+    parser.add_argument(
+        "--output",
+        choices=["jsonl", "sqlite", "sharded"],
+        default="jsonl",
+        help="Save the papers to a JSONL file, an SQLite database with a "
+        "full-text index or a directory of indexed JSONL shards",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=256,
+        help="With --output sharded, the maximum size of a shard in MB",
+    )
+    parser.add_argument(
+        "--partition",
+        choices=["category", "month"],
+        help="With --output sharded, split the shards by the primary category "
+        "or by the year and month of the paper",
+    )
+    parser.add_argument(
+        "--from-s3",
+        action="store_true",
+        help="Stream the bucket tarball straight from S3, implies --stream",
+    )
+    parser.add_argument(
+        "--keep-tarball",
+        action="store_true",
+        help="With --from-s3, also store the bucket tarball in amazon_s3/files",
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        default=LOG_DIR,
+        help="Directory for the per-run stage metrics files",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=1,
+        help="Number of buckets prepared ahead while processing, 0 disables",
+    )
+    parser.add_argument(
+        "--download-missing",
+        action="store_true",
+        help="Download the tarballs missing from amazon_s3/files",
+    )
+    parser.add_argument(
+        "--min-free-gb",
+        type=float,
+        default=5,
+        help="Free disk space in GB to keep when prefetching buckets",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Show a progress bar and only the errors instead of every paper",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=LEVELS,
+        help="Lowest level of the records shown on the console, "
+        "default debug, or error with --quiet",
+    )
+    parser.add_argument(
+        "--log-json",
+        action="store_true",
+        help="Also write all the records to a JSON-lines file in logs/",
+    )
     args = parser.parse_args()
+    if args.from_s3:
+        args.stream = True
+    if args.background_metadata and args.stream:
+        parser.error("--background-metadata needs the papers unpacked to disk")
+
+    # Set up the console and the log file
+    console_level = args.log_level or ("error" if args.quiet else "debug")
+    log_file = default_log_file(LOG_DIR) if args.log_json else None
+    configure_logging(console_level, log_file)
+
+    # Set up the cache of the arXiv responses
+    configure_http_cache(args.http_cache, args.http_cache_dir)
 
     # Make sure we have all the necessary directories
-    database_dir = "database"
-    archive_dir = "papers/archives"
-    extracted_dir = "papers/extracted"
-    sources_dir = "papers/sources"
-    os.makedirs(database_dir, exist_ok=True)
-    os.makedirs(archive_dir, exist_ok=True)
-    os.makedirs(extracted_dir, exist_ok=True)
-    os.makedirs(sources_dir, exist_ok=True)
-
-    # Metadata database file
-    metadata_file = "metadata/arxiv-metadata-oai-snapshot.json"
-
-    # Set the bucket name and database file name
-    bucket_name = args.tarball
-    database_name = re.sub(r"^arXiv_src_(.*)\.tar$", r"\1.jsonl", bucket_name)
-    database_file = os.path.join(database_dir, database_name)
+    os.makedirs(DATABASE_DIR, exist_ok=True)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    os.makedirs(EXTRACTED_DIR, exist_ok=True)
+    os.makedirs(SOURCES_DIR, exist_ok=True)
+
+    # Buckets given by name, glob pattern or @file with a list of names
+    bucket_names = expand_bucket_names(args.tarballs)
+    if not bucket_names:
+        log_error("Error: no buckets to process")
+        return 1
+
+    return run_buckets(args, bucket_names)
+
+
+def run_bucket(
+    args,
+    bucket_name,
+    prepared=None,
+    start_method=None,
+    metrics=None,
+    find_siblings=None,
+    matched=None,
+):
+    """Process a single bucket, return the exit code.
+
+    `prepared` is the prefetched result of `prepare_bucket`, if any. The
+    stage metrics of the run are saved to the metrics directory. The buckets
+    of a month share their metadata matching, `find_siblings` returns the
+    next ones ready to be matched along, `matched` keeps their entries."""
+
+    if metrics is None:
+        metrics = RunMetrics(bucket_name)
+    if matched is None:
+        matched = {}
+
+    # Set the database file name
+    database_ext = {"jsonl": ".jsonl", "sqlite": ".sqlite", "sharded": ""}[args.output]
+    database_name = re.sub(r"^arXiv_src_(.*)\.tar$", r"\1" + database_ext, bucket_name)
+    database_file = os.path.join(DATABASE_DIR, database_name)
+    # Every output keeps its own progress, they can be resumed independently
+    journal_name = re.sub(
+        r"^arXiv_src_(.*)\.tar$", rf"\1.{args.output}.progress.jsonl", bucket_name
+    )
+    journal_file = os.path.join(DATABASE_DIR, journal_name)
     # Guard against overwriting
-    if os.path.exists(database_file):
+    if os.path.exists(database_file) and not args.resume:
         confirm = (
             input(f"File '{database_file}' already exists. Overwrite? [y/N]: ")
             .strip()
             .lower()
         )
         if confirm != "y":
-            print("Aborting to prevent overwrite!")
-            exit(0)
+            log_warning("Aborting to prevent overwrite!")
+            return 0
 
     # Let's go!
-    entries = []
+    journal = None
+    metrics.start()
     try:
-        # Unpack the archive with papers
-        papers = extract_bucket_archive(
-            bucket_name, bucket_dir="amazon_s3/files", archive_dir=archive_dir
-        )
-        if not papers:
-            raise RuntimeError("No papers found in the bucket")
-
-        # Get the year and month from the bucket name
-        year, month = get_bucket_year_month(bucket_name)
-        if not year or not month:
-            raise RuntimeError("Failed to extract year and month from the bucket name")
-
-        # If we have the OAI-PMH metadata database file
-        if os.path.exists(metadata_file):
-            with open(metadata_file, "r", encoding="utf-8") as f:
-                # Load the records as a generator
-                records_json = (json.loads(line) for line in f)
-                # Match the metadata with the papers
-                entries += match_paper_metadata_json(papers, records_json)
+        # Unpack the archive with papers, unless it was prefetched
+        if prepared is not None:
+            papers, bulk_metadata = prepared.result()
+        else:
+            papers, bulk_metadata = prepare_bucket(args, bucket_name, metrics)
+        # Keep the ids in a set for constant time matching
+        papers = set(papers)
+
+        # Journal of the progress of every paper
+        journal = ProgressJournal(journal_file, resume=args.resume)
+        known = {}
+        finished = set()
+        if args.resume:
+            # Skip the finished papers, reuse the metadata resolved before.
+            # The failed ones could have failed for a passing reason
+            if args.output == "sqlite":
+                written = read_stored_ids(database_file)
+            elif args.output == "sharded":
+                written = set(read_shard_index(database_file))
+            else:
+                repair_jsonl(database_file)
+                written = read_written_ids(database_file)
+            finished = journal.finished_ids() | written
+            for arxiv_id in papers & finished:
+                remove_archive(arxiv_id, ARCHIVE_DIR)
+            papers -= finished
+            if args.from_s3:
+                papers = set(journal.metadata) - finished
+            known = {
+                i: journal.metadata[i] for i in sorted(papers) if i in journal.metadata
+            }
+            papers -= set(known)
+            log_info(
+                "Resuming with {finished} papers finished and "
+                "{known} with known metadata",
+                finished=len(finished),
+                known=len(known),
+            )
+
+        def resolve(emit):
+            """Resolve the metadata of the papers in the bucket."""
+
+            def emit_and_record(entry):
+                journal.record_metadata(entry)
+                emit(entry)
+
+            for entry in known.values():
+                emit(entry)
+
+            metadata_store = METADATA_STORE if bulk_metadata else None
+            if bucket_name in matched:
+                # Matched together with a previous bucket of the month, the
+                # rest of the papers is not in the store
+                for entry in matched.pop(bucket_name):
+                    if entry["arxiv_id"] in papers:
+                        papers.discard(entry["arxiv_id"])
+                        emit_and_record(entry)
+                metadata_store = None
+
+            with metrics.stage("metadata"):
+                resolve_bucket_metadata(
+                    papers,
+                    metadata_store,
+                    args.batch_size,
+                    emit_and_record,
+                    workers=args.workers,
+                    start_method=start_method,
+                    siblings=find_siblings() if find_siblings else None,
+                    matched=matched,
+                )
+
+        if args.from_s3:
+            # The metadata is looked up as the papers stream in
+            entries = None
+        elif args.background_metadata:
+            # Start processing the papers while the metadata is still coming
+            fetcher = MetadataFetcher(resolve)
+            fetcher.start()
+            entries = fetcher
         else:
-            # If the year and month is later than the start of OAI-PMH
-            if year > 2007 or (year == 2007 and month > 4):
-                # Fetch the set of metadata for the given month
-                records_xml = fetch_full_month_oaipmh(year, month)
-                # Match the metadata with the papers
-                entries += match_paper_metadata_xml(papers, records_xml)
-
-        # Manually deal with the rest of the papers one by one
-        while papers:
-            # Get the next paper
-            entry = new_entry(papers.pop(0))
-
-            try:
-                # Respect the arXiv guidelines and sleep for 3 seconds before the next request
-                time.sleep(3)
-                # Fetch the metadata using OAI-PMH
-                if fetch_paper_oaipmh(entry):
-                    entries.append(entry)
-            except Exception as e:
-                print(f"Failed to fetch metadata for {link(entry['arxiv_id'])}: {e}")
+            entries = []
+            resolve(entries.append)
+            log_info("Total papers to process: {count}", count=len(entries))
 
     except Exception as e:
-        print(f"Error: {e}")
+        log_error("Error: {error}", error=str(e))
         return 1
 
-    print(f"Total papers to process: {len(entries)}")
-
     try:
-        with open(database_file, "a", encoding="utf-8") as db_file:
+        # Stream the paper archives straight from the bucket
+        sources = None
+        if args.from_s3:
+            sources = stream_bucket_entries(
+                metrics.timed_sources(
+                    iter_s3_bucket_archive(bucket_name, BUCKET_DIR, args.keep_tarball)
+                ),
+                finished,
+                known,
+                METADATA_STORE if bulk_metadata else None,
+                ARCHIVE_DIR,
+                args.batch_size,
+                journal.record_metadata,
+            )
+        elif args.stream:
+            sources = metrics.timed_sources(
+                iter_bucket_archive(bucket_name, bucket_dir=BUCKET_DIR)
+            )
+
+        # A single writer saves the entries, to a JSONL or an SQLite database
+        if args.output == "sqlite":
+            sink = PaperStore(database_file)
+        elif args.output == "sharded":
+            sink = ShardedJsonlSink(
+                database_file, args.shard_size * 1024 * 1024, args.partition
+            )
+        else:
+            sink = JsonlSink(database_file)
+
+        # A single line of progress in place of the records of every paper
+        progress = ProgressBar(
+            bucket_name,
+            total=len(entries) if isinstance(entries, list) else None,
+            enabled=args.quiet,
+        )
 
+        try:
             # Process the entries
-            for entry in entries:
-                try:
-                    print(sep_line())
-                    print(header(f"Processing paper: {entry['arxiv_id']}"))
-
-                    # Download the paper source code archive
-                    archive_name = entry["safe_id"] + ".gz"
-                    if not archive_name:
-                        raise RuntimeError(
-                            f"Download failed for {link(entry['arxiv_id'])}"
-                        )
-
-                    # Unpack the archive containing the paper source code
-                    paper_name = extract_source(
-                        archive_name, archive_dir, extracted_dir
+            for entry, result, error in process_entries(
+                entries,
+                workers=args.workers,
+                ordered=not args.unordered,
+                archive_dir=ARCHIVE_DIR,
+                extracted_dir=EXTRACTED_DIR,
+                sources_dir=SOURCES_DIR,
+                sources=sources,
+                keep_intermediate=args.keep_intermediate,
+                start_method=start_method,
+                metrics=metrics,
+            ):
+                if error:
+                    log_warning(
+                        "Error processing paper {arxiv_id}: {error}",
+                        arxiv_id=entry["arxiv_id"],
+                        error=error,
                     )
-                    if not paper_name:
-                        raise RuntimeError(
-                            f"Unpacking failed for {link(entry['arxiv_id'])}"
-                        )
-
-                    # Copy the source .tex file to the sources directory
-                    source_name = copy_source_tex(
-                        paper_name, extracted_dir, sources_dir
-                    )
-                    if not source_name:
-                        raise RuntimeError(
-                            f"Copying a source .tex file failed for {link(entry['arxiv_id'])}"
-                        )
-
-                    # Convert the .tex source file into plain text
-                    plain_text = extract_plain_text(source_name, sources_dir)
-                    if not plain_text:
-                        continue
-
-                    # Add plain text to the paper's content
-                    entry["content"] = plain_text
-
-                    # Clean the unnecessary fields from the entry
-                    del entry["safe_id"]
-
-                    # Think about licenses, it seems that
-                    # ['CC BY 4.0', 'CC BY-SA 4.0', 'CC BY-NC-SA 4.0', 'CC BY-NC-ND 4.0', 'CC Zero']
-                    # allow for redistribution of the contents, i.e. putting it in a public database
-
-                    # Save the entry to the database file
-                    db_file.write(json.dumps(entry) + "\n")
-
-                except Exception as e:
-                    print(f"Error processing paper {entry['arxiv_id']}: {e}")
-
-            print(sep_line())
-
-        print(header(f"Processing complete. Entries saved to {link(database_file)}"))
+                    journal.record_outcome(entry["arxiv_id"], "failed", error)
+                    metrics.record_outcome(entry["arxiv_id"], "failed", error)
+                    progress.advance("failed")
+                    continue
+                if not result:
+                    journal.record_outcome(entry["arxiv_id"], "empty")
+                    metrics.record_outcome(entry["arxiv_id"], "empty")
+                    progress.advance("empty")
+                    continue
+
+                # Think about licenses, it seems that
+                # ['CC BY 4.0', 'CC BY-SA 4.0', 'CC BY-NC-SA 4.0', 'CC BY-NC-ND 4.0', 'CC Zero']
+                # allow for redistribution of the contents, i.e. putting it in a public database
+
+                # Journal the entries only once they are saved to the database
+                with metrics.stage("write", arxiv_id=entry["arxiv_id"]):
+                    written = sink.write(result)
+                for arxiv_id in written:
+                    journal.record_outcome(arxiv_id, "written")
+                    metrics.record_outcome(arxiv_id, "written")
+                progress.advance("converted")
+
+        finally:
+            progress.close()
+            for arxiv_id in sink.close():
+                journal.record_outcome(arxiv_id, "written")
+                metrics.record_outcome(arxiv_id, "written")
+
+        log_separator("info")
+
+        # The metadata could have failed half way through
+        if args.background_metadata:
+            log_info("Total papers processed: {count}", count=entries.count)
+            if entries.error:
+                raise entries.error
+
+        # Tell a later sync that the bucket needs no resuming
+        journal.record_complete()
+        log_info(
+            "Processing complete. Entries saved to {path}", "header", path=database_file
+        )
 
         return 0
 
     except Exception as e:
-        print(f"Error: {e}")
+        log_error("Error: {error}", error=str(e))
         return 1
 
+    finally:
+        if journal:
+            journal.close()
+
+        # Keep the measurements of failed runs too
+        try:
+            metrics_file = metrics.write(args.metrics_dir)
+            log_info("Run metrics saved to {path}", path=metrics_file)
+        except OSError as e:
+            log_warning("Failed to save the run metrics: {error}", error=str(e))
+
 
 if __name__ == "__main__":
-    main()
+    exit(main())
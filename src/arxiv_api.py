@@ -1,34 +1,51 @@
 import os
+import io
+import re
 import shutil
 import html
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
-import time
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-from rich import print
-import requests
 import feedparser
-import multiprocessing
 
-from src.aesthetics import (
-    link,
+from src.log import (
+    log_debug,
+    log_info,
+    log_warning,
 )
 from src.entries import (
     new_entry,
 )
+from src.http_cache import (
+    ARXIV_EXPORT_URL,
+    http_get,
+)
 from src.gzip_tools import (
     check_gzip,
+    check_gzip_bytes,
     extract_gzip,
+    extract_gzip_bytes,
 )
 from src.tex_tools import (
     find_tex_files,
     merge_tex_files,
+    merge_tex_contents,
 )
 from src.pylatexenc_tools import (
     clean_pylatexenc,
     preprocess_pylatexenc,
     postprocess_pylatexenc,
 )
+from src.worker_pool import (
+    WorkerPool,
+    WorkerTimeoutError,
+)
+from src.metrics import (
+    timed,
+)
 
 
 def fetch_paper_metadata(paper):
@@ -38,11 +55,10 @@ def fetch_paper_metadata(paper):
     arxiv_id = paper["arxiv_id"]
 
     # Access the API
-    base_url = "http://export.arxiv.org/api/query?"
-    query = f"id_list={arxiv_id}"
-    url = f"{base_url}{query}"
+    base_url = f"{ARXIV_EXPORT_URL}/api/query"
+    response = http_get(base_url, params={"id_list": arxiv_id}, delay_seconds=3)
 
-    feed = feedparser.parse(url)
+    feed = feedparser.parse(response.content)
 
     # Check if the metadata was fetched correctly
     if not feed.entries:
@@ -81,23 +97,133 @@ def fetch_paper_metadata(paper):
     return True
 
 
+def _feed_entry_id(item):
+    """Get the arXiv id without the version from an arXiv API feed entry."""
+    arxiv_id = item.get("id", "").split("/abs/")[-1]
+    return re.sub(r"v\d+$", "", arxiv_id)
+
+
+def _fill_from_feed_entry(paper, item):
+    """Fill the paper with the metadata of an arXiv API feed entry."""
+
+    # Extract the obligatory fields
+    if not item.get("title"):
+        raise ValueError(f"Missing title")
+    if not item.get("authors"):
+        raise ValueError(f"Missing authors")
+    if not item.get("summary"):
+        raise ValueError(f"Missing abstract")
+    if not item.get("tags"):
+        raise ValueError(f"Missing categories")
+    paper["title"] = " ".join(clean_pylatexenc(item.title).split())
+    paper["authors"] = [html.unescape(author.name) for author in item.authors]
+    paper["abstract"] = " ".join(clean_pylatexenc(item.summary).split())
+    paper["categories"] = [cat.term for cat in item.tags]
+
+    # Extract non-obligatory fields like the OAI-PMH does, the API has no license
+    paper["published"] = item.get("arxiv_journal_ref", None)
+    paper["comments"] = item.get("arxiv_comment", None)
+
+
+def fetch_papers_metadata_batched(papers, batch_size=100, on_resolved=None):
+    """Fetch metadata for many papers with id_list queries to the arXiv API.
+
+    `on_resolved` is called with every resolved paper as soon as its batch
+    arrives. Returns the papers which could not be resolved."""
+
+    base_url = f"{ARXIV_EXPORT_URL}/api/query"
+    missing = []
+
+    for i in range(0, len(papers), batch_size):
+        batch = papers[i : i + batch_size]
+        params = {
+            "id_list": ",".join(paper["arxiv_id"] for paper in batch),
+            "max_results": len(batch),
+        }
+        try:
+            # Respect the arXiv guidelines and wait 3 seconds between requests
+            response = http_get(base_url, params=params, timeout=30, delay_seconds=3)
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP response: {response.status_code}")
+            feed = feedparser.parse(response.content)
+        except Exception as e:
+            log_warning(
+                "Failed to fetch a batch of {count} papers: {error}",
+                count=len(batch),
+                error=str(e),
+            )
+            missing += batch
+            continue
+
+        # Map the returned entries back to the papers
+        items = {_feed_entry_id(item): item for item in feed.entries}
+        for paper in batch:
+            item = items.get(paper["arxiv_id"])
+            try:
+                if item is None:
+                    raise ValueError(f"No metadata in the response")
+                _fill_from_feed_entry(paper, item)
+            except ValueError:
+                missing.append(paper)
+                continue
+            if on_resolved is not None:
+                on_resolved(paper)
+
+    return missing
+
+
+def resolve_leftover_metadata(papers, batch_size=100, on_resolved=None):
+    """Fetch metadata for the papers not matched by the bulk sources.
+
+    The papers are resolved in batches with the arXiv API, only the ones
+    missing from the batch responses are fetched one by one via OAI-PMH.
+    `on_resolved` is called with every paper as soon as it is resolved."""
+
+    # Nothing to batch, keep the single requests
+    if batch_size > 1:
+        missing = fetch_papers_metadata_batched(papers, batch_size, on_resolved)
+    else:
+        missing = list(papers)
+    missing_ids = {id(paper) for paper in missing}
+    resolved = [paper for paper in papers if id(paper) not in missing_ids]
+
+    log_info(
+        "Resolved {resolved} papers in batches, {missing} left for single requests",
+        resolved=len(resolved),
+        missing=len(missing),
+    )
+
+    for paper in missing:
+        try:
+            # Fetch the metadata using OAI-PMH
+            if fetch_paper_oaipmh(paper):
+                resolved.append(paper)
+                if on_resolved is not None:
+                    on_resolved(paper)
+        except Exception as e:
+            log_warning(
+                "Failed to fetch metadata for {arxiv_id}: {error}",
+                arxiv_id=paper["arxiv_id"],
+                error=str(e),
+            )
+
+    return resolved
+
+
 def fetch_paper_oaipmh(paper):
     """Fetch metadata for papers using the arXiv OAI-PMH."""
 
     # arXiv id of the paper
     arxiv_id = paper["arxiv_id"]
 
-    # Access the API
-    headers = {
-        "User-Agent": "arXivPhysicsPapers/0.1 (mailto:kajetan.niewczas@gmail.com)"
+    # Access the API, respect the arXiv guidelines and wait 3 seconds between requests
+    base_url = f"{ARXIV_EXPORT_URL}/oai2"
+    params = {
+        "verb": "GetRecord",
+        "metadataPrefix": "arXiv",
+        "identifier": f"oai:arXiv.org:{arxiv_id}",
     }
-    base_url = "http://export.arxiv.org/oai2?"
-    verb = "GetRecord"
-    prefix = "arXiv"
-    url = "{}verb={}&metadataPrefix={}&identifier=oai:arXiv.org:{}".format(
-        base_url, verb, prefix, arxiv_id
-    )
-    response = requests.get(url, headers=headers, timeout=10)
+    response = http_get(base_url, params=params, timeout=10, delay_seconds=3)
 
     # Check if the query was resolved correctly
     if response.status_code != 200:
@@ -183,8 +309,8 @@ def fetch_paper_oaipmh(paper):
     return True
 
 
-def fetch_full_month_oaipmh(year, month):
-    """Fetch metadata for papers in a given month using the arXiv OAI-PMH."""
+def month_range(year, month):
+    """Get the harvesting date range covering a given month."""
 
     # Start with a few days in advance
     if month == 1:
@@ -197,9 +323,56 @@ def fetch_full_month_oaipmh(year, month):
     else:
         until_date = datetime(year, month + 1, 1) - timedelta(days=1)
 
+    return from_date, until_date
+
+
+def _parse_oai_record(record):
+    """Turn an OAI-PMH record into a compact dict in the snapshot format."""
+
+    NAMESPACE = {
+        "oai": "http://www.openarchives.org/OAI/2.0/",
+        "arxiv": "http://arxiv.org/OAI/arXiv/",
+    }
+
+    # Deleted records come without metadata
+    metadata = record.find("oai:metadata/arxiv:arXiv", NAMESPACE)
+    if metadata is None:
+        return None
+
+    # Date of the last change of the record
+    fields = {
+        "update_date": record.findtext("oai:header/oai:datestamp", None, NAMESPACE)
+    }
+
+    # Collect all the simple fields at once
+    for child in metadata:
+        tag = child.tag.rpartition("}")[2]
+        if tag != "authors":
+            fields[tag] = child.text
+
+    # Authors as [keyname, forenames, suffix] like in the snapshot
+    fields["authors_parsed"] = [
+        [
+            author.findtext("arxiv:keyname", "", NAMESPACE),
+            author.findtext("arxiv:forenames", "", NAMESPACE),
+            "",
+        ]
+        for author in metadata.iterfind("arxiv:authors/arxiv:author", NAMESPACE)
+    ]
+
+    return fields
+
+
+def harvest_oaipmh(from_date, until_date, delay_seconds=5):
+    """Yield the metadata records between two datestamps using the arXiv OAI-PMH.
+
+    Every page is parsed incrementally, so only a single page and a single
+    record are held in memory at a time. The time the consumer spends on a
+    page counts towards the delay before the next request."""
+
     # Access the API
-    NAMESPACE = {"oai": "http://www.openarchives.org/OAI/2.0/"}
-    base_url = "http://export.arxiv.org/oai2?"
+    OAI = "{http://www.openarchives.org/OAI/2.0/}"
+    base_url = f"{ARXIV_EXPORT_URL}/oai2"
     params = {
         "verb": "ListRecords",
         "metadataPrefix": "arXiv",
@@ -207,184 +380,185 @@ def fetch_full_month_oaipmh(year, month):
         "until": until_date.strftime("%Y-%m-%d"),
     }
 
-    records = []
+    count = 0
     while True:
-        response = requests.get(base_url, params=params)
-        root = ET.fromstring(response.text)
-
-        # Save all the records
-        for record in root.findall(".//oai:record", NAMESPACE):
-            records.append(record)
+        # Respect the arXiv guidelines, matching the previous page already
+        # counts towards the delay
+        response = http_get(
+            base_url, params=params, timeout=60, delay_seconds=delay_seconds
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP response: {response.status_code}")
+
+        # Parse the page incrementally, dropping every finished record
+        token = None
+        container = None
+        parser = ET.iterparse(io.BytesIO(response.content), events=("start", "end"))
+        for event, elem in parser:
+            if event == "start":
+                if elem.tag == OAI + "ListRecords":
+                    container = elem
+            elif elem.tag == OAI + "record":
+                record = _parse_oai_record(elem)
+                container.clear()
+                if record is not None:
+                    count += 1
+                    yield record
+            elif elem.tag == OAI + "resumptionToken":
+                token = elem.text
 
         # Check if we have reached the end of the records
-        token_elem = root.find(".//oai:resumptionToken", NAMESPACE)
-        if token_elem is not None and token_elem.text:
-            params = {"verb": "ListRecords", "resumptionToken": token_elem.text}
+        if token:
+            params = {"verb": "ListRecords", "resumptionToken": token}
         else:
-            print(
-                f"Successfully fetched {link(len(records))} metadata records from "
-                f'{link(from_date.strftime("%Y-%m-%d"))} till {link(until_date.strftime("%Y-%m-%d"))}'
+            log_info(
+                "Successfully fetched {count} metadata records from {start} till {end}",
+                count=count,
+                start=from_date.strftime("%Y-%m-%d"),
+                end=until_date.strftime("%Y-%m-%d"),
             )
             break
 
-        # Respect the arXiv guidelines and sleep for 3 seconds before the next request
-        time.sleep(5)
 
-    return records
+def _entry_from_json(arxiv_id, record):
+    """Build a new entry from the snapshot metadata of a paper."""
 
+    entry = new_entry(arxiv_id)
+    # Extract the title
+    title = record.get("title", "")
+    entry["title"] = " ".join(clean_pylatexenc(title).split())
+    # Extract the authors
+    authors_parsed = record.get("authors_parsed", [])
+    if authors_parsed:
+        entry["authors"] = []
+        for parts in authors_parsed:
+            surname = parts[0] if len(parts) > 0 else ""
+            forenames = parts[1] if len(parts) > 1 else ""
+            middle = parts[2] if len(parts) > 2 else ""
 
-def match_paper_metadata_xml(papers, records):
-    """Match the paper entries with their metadata."""
+            full_name = " ".join(
+                filter(
+                    None,
+                    [
+                        html.unescape(forenames) if forenames else None,
+                        html.unescape(middle) if middle else None,
+                        html.unescape(surname) if surname else None,
+                    ],
+                )
+            ).strip()
+            entry["authors"].append(full_name)
+    else:
+        entry["authors"] = [a.strip() for a in record.get("authors", "").split(",")]
+    # Extract the abstract
+    abstract = record.get("abstract", "")
+    entry["abstract"] = " ".join(clean_pylatexenc(abstract).split())
+    # Extract the categories
+    cats = record.get("categories", "")
+    entry["categories"] = cats.split() if cats else []
+    # Extract other fields
+    entry["published"] = record.get("journal-ref", None)
+    entry["comments"] = record.get("comments", None)
+    entry["license"] = record.get("license", None)
+
+    return entry
+
+
+def _is_complete(entry):
+    """Check if the entry has all the obligatory fields."""
+    return bool(
+        entry["title"] and entry["authors"] and entry["abstract"] and entry["categories"]
+    )
 
-    NAMESPACE = {"arxiv": "http://arxiv.org/OAI/arXiv/"}
 
-    entries = []
+def _index_buckets(buckets):
+    """Map every arXiv id to the names of the buckets containing it."""
+    owners = {}
+    for bucket_name, papers in buckets.items():
+        for arxiv_id in papers:
+            owners.setdefault(arxiv_id, []).append(bucket_name)
+    return owners
 
-    # Itreate over records and match them with papers
-    for record in records:
-        metadata = record.find(".//arxiv:arXiv", NAMESPACE)
-        if metadata.find("arxiv:title", NAMESPACE) is not None:
-            arxiv_id = metadata.find("arxiv:id", NAMESPACE).text.replace("/", "")
-            # Metadata matches an existing paper
-            if arxiv_id in papers:
-                entry = new_entry(arxiv_id)
-                # Extract the title
-                entry["title"] = " ".join(
-                    clean_pylatexenc(
-                        metadata.find("arxiv:title", NAMESPACE).text
-                    ).split()
-                )
-                # Extract the authors
-                entry["authors"] = [
-                    " ".join(
-                        filter(
-                            None,
-                            [
-                                (
-                                    html.unescape(
-                                        author.find("arxiv:forenames", NAMESPACE).text
-                                    )
-                                    if author.find("arxiv:forenames", NAMESPACE)
-                                    is not None
-                                    else None
-                                ),
-                                html.unescape(
-                                    author.find("arxiv:keyname", NAMESPACE).text
-                                ),
-                            ],
-                        )
-                    )
-                    for author in metadata.findall(
-                        "arxiv:authors/arxiv:author", NAMESPACE
-                    )
-                ]
-                # Extract the abstract
-                entry["abstract"] = " ".join(
-                    clean_pylatexenc(
-                        metadata.find("arxiv:abstract", NAMESPACE).text
-                    ).split()
-                )
-                # Extract the categories
-                entry["categories"] = [
-                    x for x in metadata.find("arxiv:categories", NAMESPACE).text.split()
-                ]
-                # Extract other fields
-                entry["published"] = (
-                    metadata.find("arxiv:journal-ref", NAMESPACE).text
-                    if metadata.find("arxiv:journal-ref", NAMESPACE) is not None
-                    else None
-                )
-                entry["comments"] = (
-                    metadata.find("arxiv:comments", NAMESPACE).text
-                    if metadata.find("arxiv:comments", NAMESPACE) is not None
-                    else None
-                )
-                entry["license"] = (
-                    metadata.find("arxiv:license", NAMESPACE).text
-                    if metadata.find("arxiv:license", NAMESPACE) is not None
-                    else None
-                )
-                if (
-                    entry["title"]
-                    and entry["authors"]
-                    and entry["abstract"]
-                    and entry["categories"]
-                ):
-                    entries.append(entry)
-                # Remove the paper from the list
-                papers.remove(arxiv_id)
-            else:
-                continue
 
-    print(f"Successfully matched {link(len(entries))} papers with metadata")
+def _deliver(entry, arxiv_id, owners, buckets, entries):
+    """Hand the entry over to every bucket containing the paper."""
+    for bucket_name in owners[arxiv_id]:
+        entries[bucket_name].append(entry.copy())
+        buckets[bucket_name].discard(arxiv_id)
 
-    return entries
 
+# Number of matched records normalized by a worker at a time
+NORMALIZE_BATCH_SIZE = 256
+
+
+def _normalize_json_batch(batch):
+    """Build the entries of a batch of (arxiv_id, snapshot record) pairs."""
+    return [_entry_from_json(arxiv_id, record) for arxiv_id, record in batch]
+
+
+def normalize_entries(normalize, candidates, workers=1, start_method=None):
+    """Build the entries of the matched candidates in batches.
+
+    With more than one worker the batches are spread over a process pool.
+    Returns the entries in the order of the candidates."""
 
-def match_paper_metadata_json(papers, records):
-    """Match the paper entries with their metadata."""
+    batches = [
+        candidates[i : i + NORMALIZE_BATCH_SIZE]
+        for i in range(0, len(candidates), NORMALIZE_BATCH_SIZE)
+    ]
 
-    entries = []
+    # Not worth starting the processes
+    if workers <= 1 or len(batches) <= 1:
+        return [entry for batch in batches for entry in normalize(batch)]
 
-    # Itreate over records and match them with papers
+    mp_context = multiprocessing.get_context(start_method) if start_method else None
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(batches)), mp_context=mp_context
+    ) as executor:
+        return [entry for entries in executor.map(normalize, batches) for entry in entries]
+
+
+def match_buckets_metadata_json(buckets, records, workers=1, start_method=None):
+    """Match the paper entries of many buckets in a single pass over the records.
+
+    `buckets` maps bucket names to sets of arXiv ids, matched ids are discarded
+    from the sets. Returns a dictionary mapping bucket names to their entries."""
+
+    owners = _index_buckets(buckets)
+    entries = {bucket_name: [] for bucket_name in buckets}
+
+    # Itreate over records and match them with papers by id only
+    candidates = []
     for record in records:
         arxiv_id = record.get("id")
-        if not arxiv_id:
-            continue
 
         # Metadata matches an existing paper
-        if arxiv_id in papers:
-            entry = new_entry(arxiv_id)
-            # Extract the title
-            title = record.get("title", "")
-            entry["title"] = " ".join(clean_pylatexenc(title).split())
-            # Extract the authors
-            authors_parsed = record.get("authors_parsed", [])
-            if authors_parsed:
-                entry["authors"] = []
-                for parts in authors_parsed:
-                    surname = parts[0] if len(parts) > 0 else ""
-                    forenames = parts[1] if len(parts) > 1 else ""
-                    middle = parts[2] if len(parts) > 2 else ""
-
-                    full_name = " ".join(
-                        filter(
-                            None,
-                            [
-                                html.unescape(forenames) if forenames else None,
-                                html.unescape(middle) if middle else None,
-                                html.unescape(surname) if surname else None,
-                            ],
-                        )
-                    ).strip()
-                    entry["authors"].append(full_name)
-            else:
-                entry["authors"] = [
-                    a.strip() for a in record.get("authors", "").split(",")
-                ]
-            # Extract the abstract
-            abstract = record.get("abstract", "")
-            entry["abstract"] = " ".join(clean_pylatexenc(abstract).split())
-            # Extract the categories
-            cats = record.get("categories", "")
-            entry["categories"] = cats.split() if cats else []
-            # Extract other fields
-            entry["published"] = record.get("journal-ref", None)
-            entry["comments"] = record.get("comments", None)
-            entry["license"] = record.get("license", None)
-            if (
-                entry["title"]
-                and entry["authors"]
-                and entry["abstract"]
-                and entry["categories"]
-            ):
-                entries.append(entry)
-            else:
-                continue
-            # Remove the paper from the list
-            papers.remove(arxiv_id)
+        if not arxiv_id or arxiv_id not in owners:
+            continue
+        candidates.append((arxiv_id, record))
+
+    # Clean the matched metadata
+    matched = normalize_entries(_normalize_json_batch, candidates, workers, start_method)
+
+    # An incomplete record leaves the paper open for a later one
+    for (arxiv_id, _), entry in zip(candidates, matched):
+        if arxiv_id in owners and _is_complete(entry):
+            _deliver(entry, arxiv_id, owners, buckets, entries)
+            del owners[arxiv_id]
+
+    return entries
+
+
+def match_paper_metadata_json(papers, records, workers=1, start_method=None):
+    """Match the paper entries with their metadata.
+
+    `papers` is a set of arXiv ids, matched ids are discarded from it."""
 
-    print(f"Successfully matched {link(len(entries))} papers with metadata")
+    entries = match_buckets_metadata_json(
+        {None: papers}, records, workers, start_method
+    )[None]
+
+    log_info("Successfully matched {count} papers with metadata", count=len(entries))
 
     return entries
 
@@ -394,7 +568,7 @@ def download_paper(paper, archive_dir="papers/archives"):
 
     source_url = paper["pdf_url"].replace("pdf", "src")
 
-    response = requests.get(source_url, timeout=5)
+    response = http_get(source_url, timeout=5, delay_seconds=3)
     if response.ok and len(response.content) > 0:
         archive_name = None
         if "Content-Disposition" in response.headers:
@@ -404,94 +578,192 @@ def download_paper(paper, archive_dir="papers/archives"):
                 archive_path = os.path.join(archive_dir, archive_name)
                 with open(archive_path, "wb") as f:
                     f.write(response.content)
-                print(f"Successfully downloaded {link(archive_path)}")
+                log_debug("Successfully downloaded {path}", path=archive_path)
                 return archive_name
 
     return None
 
 
 def extract_source(
-    archive_name, archive_dir="papers/archives", extracted_dir="papers/extracted"
+    archive_name,
+    archive_dir="papers/archives",
+    extracted_dir="papers/extracted",
+    metrics=None,
 ):
     """Extract the contents of the gzip archive."""
 
-    # Check if we have a gzip archive and extract it
-    if check_gzip(os.path.join(archive_dir, archive_name)):
-        paper_name = extract_gzip(archive_name, archive_dir, extracted_dir)
+    archive_path = os.path.join(archive_dir, archive_name)
+    paper_name = None
+    with timed(metrics, "gzip", os.path.getsize(archive_path)):
+        # Check if we have a gzip archive and extract it
+        if check_gzip(archive_path):
+            paper_name = extract_gzip(archive_name, archive_dir, extracted_dir)
 
     return paper_name
 
 
 def copy_source_tex(
-    paper_name, extracted_dir="papers/extracted", sources_dir="papers/sources"
+    paper_name,
+    extracted_dir="papers/extracted",
+    sources_dir="papers/sources",
+    metrics=None,
 ):
     """Copy the source .tex file to the sources directory."""
 
     # Get the list of .tex files
     paper_path = os.path.join(extracted_dir, paper_name)
-    tex_files = find_tex_files(paper_path)
+    with timed(metrics, "tex"):
+        tex_files = find_tex_files(paper_path)
     if not tex_files:
-        print(f"Warning: there no tex files to process for {link(paper_name)}")
+        log_warning("There are no tex files to process for {paper}", paper=paper_name)
         return None
 
     # Check if the source file already exists
     source_name = paper_name + ".tex"
     source_path = os.path.join(sources_dir, source_name)
     if os.path.exists(source_path):
-        print(f"Warning: {link(source_name)} already exists and will be overwritten")
+        log_warning(
+            "File {path} already exists and will be overwritten", path=source_name
+        )
 
     # Preprocess .tex files, merge then if needed and copy the result
-    merged_path = merge_tex_files(tex_files, paper_path)
-    shutil.copy(merged_path, source_path)
+    with timed(metrics, "merge"):
+        merged_path = merge_tex_files(tex_files, paper_path)
+        shutil.copy(merged_path, source_path)
 
     # Remove the extracted folder
     shutil.rmtree(paper_path)
-    print(f"Successfully copied {link(source_name)} and removed {link(paper_path)}")
+    log_debug(
+        "Successfully copied {source} and removed {path}",
+        source=source_name,
+        path=paper_path,
+    )
 
     return source_name
 
 
-def _worker_extract_tex(source_path, return_dict):
-    """Worker process to extract plain text."""
+def extract_source_bytes(archive_name, data, metrics=None):
+    """Extract the contents of the gzip archive held in memory."""
+
+    with timed(metrics, "gzip", len(data)):
+        # Check if we have a gzip archive and extract it
+        if check_gzip_bytes(archive_name, data):
+            return extract_gzip_bytes(archive_name, data)
+
+    return None
+
+
+def merge_source_tex(paper_name, files, metrics=None):
+    """Merge the .tex files of the paper held in memory into a single string."""
+
+    # Get the list of .tex files
+    with timed(metrics, "tex"):
+        tex_files = [name for name in files if name.endswith(".tex")]
+    if not tex_files:
+        log_warning("There are no tex files to process for {paper}", paper=paper_name)
+        return None
+
+    # Preprocess .tex files and merge them if needed
+    tex_bytes = sum(len(files[name]) for name in tex_files)
+    with timed(metrics, "merge", tex_bytes):
+        tex_contents = {name: files[name].decode("utf-8") for name in tex_files}
+        tex_content = merge_tex_contents(tex_contents)
+
+    log_debug("Successfully merged the source of {paper}", paper=paper_name)
+
+    return tex_content
+
+
+def _worker_convert_tex(tex_content):
+    """Worker task to convert .tex content into plain text."""
+    preprocessed = preprocess_pylatexenc(tex_content)
+    cleaned = clean_pylatexenc(preprocessed)
+    plain_text = postprocess_pylatexenc(cleaned)
+    return plain_text
+
+
+def _worker_extract_tex(source_path):
+    """Worker task to extract plain text."""
+    with open(source_path, "r", encoding="utf-8", errors="ignore") as f:
+        tex_content = f.read()
+    return _worker_convert_tex(tex_content)
+
+
+# Warm conversion workers shared by all the calls in this process
+_conversion_pool = None
+_conversion_pool_pid = None
+
+
+def get_conversion_pool():
+    """Return the conversion worker pool, start it on first use."""
+    global _conversion_pool, _conversion_pool_pid
+    # A forked process cannot use the workers of its parent
+    if _conversion_pool is None or _conversion_pool_pid != os.getpid():
+        _conversion_pool = WorkerPool(size=1)
+        _conversion_pool_pid = os.getpid()
+        atexit.register(_conversion_pool.close)
+    return _conversion_pool
+
+
+def _run_conversion(task, arg, source_name, timeout_seconds, pool, metrics=None):
+    """Run a conversion task in a warm worker process."""
+    if pool is None:
+        pool = get_conversion_pool()
+
     try:
-        with open(source_path, "r", encoding="utf-8", errors="ignore") as f:
-            tex_content = f.read()
-        preprocessed = preprocess_pylatexenc(tex_content)
-        cleaned = clean_pylatexenc(preprocessed)
-        plain_text = postprocess_pylatexenc(cleaned)
-        return_dict["text"] = plain_text
+        plain_text = pool.run(task, arg, timeout=timeout_seconds)
+    except WorkerTimeoutError:
+        log_warning(
+            "Timeout reached ({seconds}s) for {source}, terminating process",
+            seconds=timeout_seconds,
+            source=source_name,
+        )
+        if metrics is not None:
+            metrics.mark_timeout("convert")
+        plain_text = ""  # fallback empty
     except Exception as e:
-        print(f"Error in worker: {e}")
-        return_dict["text"] = ""
+        log_warning("Error in worker: {error}", error=str(e))
+        plain_text = ""
 
+    return plain_text
 
-def extract_plain_text(source_name, sources_dir, timeout_seconds=30):
-    source_path = os.path.join(sources_dir, source_name)
-    manager = multiprocessing.Manager()
-    return_dict = manager.dict()
 
-    # Spawn worker process
-    p = multiprocessing.Process(
-        target=_worker_extract_tex, args=(source_path, return_dict)
-    )
-    p.start()
-    p.join(timeout_seconds)
+def extract_plain_text(
+    source_name, sources_dir, timeout_seconds=30, pool=None, metrics=None
+):
+    source_path = os.path.join(sources_dir, source_name)
 
-    if p.is_alive():
-        print(
-            f"Timeout reached ({timeout_seconds}s) for {source_name}, terminating process"
+    # Run the conversion in a warm worker process
+    with timed(metrics, "convert", os.path.getsize(source_path)):
+        plain_text = _run_conversion(
+            _worker_extract_tex,
+            source_path,
+            source_name,
+            timeout_seconds,
+            pool,
+            metrics,
         )
-        p.terminate()
-        p.join()
-        plain_text = ""  # fallback empty
-    else:
-        plain_text = return_dict.get("text", "")
 
     # Remove the source file
     try:
         os.remove(source_path)
-        print(f"Removed {source_path}")
+        log_debug("Removed {path}", path=source_path)
     except Exception as e:
-        print(f"Failed to remove {source_path}: {e}")
+        log_warning("Failed to remove {path}: {error}", path=source_path, error=str(e))
 
     return plain_text
+
+
+def convert_plain_text(
+    tex_content, source_name, timeout_seconds=30, pool=None, metrics=None
+):
+    """Convert .tex content held in memory into plain text."""
+    with timed(metrics, "convert", len(tex_content)):
+        return _run_conversion(
+            _worker_convert_tex,
+            tex_content,
+            source_name,
+            timeout_seconds,
+            pool,
+            metrics,
+        )
@@ -0,0 +1,74 @@
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from rich import print
+from rich.markup import escape
+
+from src.aesthetics import (
+    link,
+)
+from src.http_cache import (
+    ResponseCache,
+    request_key,
+)
+
+
+def make_handler(cache):
+    """Create a request handler serving the responses from the cache."""
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        """Serve the OAI-PMH and arXiv API responses recorded in the cache."""
+
+        def do_GET(self):
+            response = cache.load(request_key(self.path))
+            if response is None:
+                self.send_error(404, "Response not recorded")
+                return
+
+            self.send_response(response.status_code)
+            for name, value in response.headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(response.content)))
+            self.end_headers()
+            self.wfile.write(response.content)
+
+        def log_message(self, format, *args):
+            # Keep the console quiet, the pipeline prints enough
+            pass
+
+    return StandInHandler
+
+
+def serve(cache_dir="cache/http", host="127.0.0.1", port=8080):
+    """Serve the recorded responses until interrupted."""
+
+    server = ThreadingHTTPServer((host, port), make_handler(ResponseCache(cache_dir)))
+    url = escape(f"http://{host}:{port}")
+    print(
+        f"Serving {link(escape(cache_dir))} at {link(url)}, "
+        f"run papers.py with ARXIV_EXPORT_URL={url}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    """Local stand-in for export.arxiv.org."""
+
+    parser = argparse.ArgumentParser(
+        description="Serve recorded arXiv responses for offline runs."
+    )
+    parser.add_argument("--cache-dir", default="cache/http", help="Response cache")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=8080, help="Port to bind")
+    args = parser.parse_args()
+
+    serve(args.cache_dir, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import queue
+import threading
+
+
+# Marks the end of the resolved entries
+_DONE = object()
+
+
+class MetadataFetcher(threading.Thread):
+    """Resolve the metadata of a bucket in a background thread.
+
+    `resolve` is called with a callback which receives every entry as soon
+    as its metadata is known. Iterating over the fetcher yields the entries
+    in that order and stops once `resolve` has returned."""
+
+    def __init__(self, resolve):
+        super().__init__(name="metadata-fetcher", daemon=True)
+        self._resolve = resolve
+        self._queue = queue.Queue()
+        self.count = 0
+        self.error = None
+
+    def run(self):
+        try:
+            self._resolve(self._queue.put)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._queue.put(_DONE)
+
+    def __iter__(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _DONE:
+                return
+            self.count += 1
+            yield entry
@@ -4,10 +4,12 @@ import tarfile
 import shutil
 import re
 
-from rich import print
-
-from src.aesthetics import (
-  link,
+from src.log import (
+  log_info,
+)
+from amazon_s3.bucket_access import (
+  BUCKET,
+  get_s3_client,
 )
 
 
@@ -32,6 +34,18 @@ def get_bucket_year_month(bucket_name):
     return None, None
 
 
+def paper_id_from_member(member_name):
+  '''Get the true arXiv id from the name of a bucket member.'''
+
+  original_name = os.path.basename(member_name)
+  arxiv_id = original_name.replace('.gz', '')
+  match  = re.match(r'^([a-zA-Z\-]+)(\d+)$', arxiv_id)
+  if match:
+    arxiv_id = f"{match.group(1)}/{match.group(2)}"
+
+  return arxiv_id
+
+
 def extract_bucket_archive(bucket_name, bucket_dir='amazon_s3/files',
                                         archive_dir='papers/archives'):
   '''Extract the contents of the bucket tarball.'''
@@ -53,13 +67,111 @@ def extract_bucket_archive(bucket_name, bucket_dir='amazon_s3/files',
             shutil.copyfileobj(f_in, f_out)
 
         # Obtain the true arXiv id
-        arxiv_id = original_name.replace('.gz', '')
-        match  = re.match(r'^([a-zA-Z\-]+)(\d+)$', arxiv_id)
-        if match:
-          arxiv_id = f"{match.group(1)}/{match.group(2)}"
+        papers.append(paper_id_from_member(member.name))
 
-        papers.append(arxiv_id)
-
-    print(f'Successfully extracted {link(len(papers))} papers from {link(bucket_name)}')
+    log_info(
+      "Successfully extracted {count} papers from {bucket}",
+      count=len(papers),
+      bucket=bucket_name,
+    )
 
     return papers
+
+
+def list_bucket_archive(bucket_name, bucket_dir='amazon_s3/files'):
+  '''List the papers in the bucket tarball without extracting them.'''
+
+  papers = []
+  bucket_path = os.path.join(bucket_dir, bucket_name)
+
+  # Only the member headers are read here
+  with tarfile.open(bucket_path, 'r') as tar:
+    for member in tar.getmembers():
+      if member.isfile() and member.name.endswith('.gz'):
+        papers.append(paper_id_from_member(member.name))
+
+  log_info(
+    "Successfully listed {count} papers in {bucket}",
+    count=len(papers),
+    bucket=bucket_name,
+  )
+
+  return papers
+
+
+def iter_bucket_archive(bucket_name, bucket_dir='amazon_s3/files'):
+  '''Yield the arXiv id and the gzip bytes of every paper in the bucket.'''
+
+  bucket_path = os.path.join(bucket_dir, bucket_name)
+
+  with tarfile.open(bucket_path, 'r') as tar:
+    for member in tar:
+      if member.isfile() and member.name.endswith('.gz'):
+        # Keep only the gzip files in memory, do not process pdfs
+        with tar.extractfile(member) as f_in:
+          yield paper_id_from_member(member.name), f_in.read()
+
+
+class TeeReader:
+  '''File-like reader copying everything it reads into another file.'''
+
+  def __init__(self, source, copy):
+    self.source = source
+    self.copy   = copy
+
+  def read(self, size=-1):
+    data = self.source.read(size)
+    self.copy.write(data)
+    return data
+
+
+def iter_s3_bucket_archive(bucket_name, bucket_dir='amazon_s3/files',
+                                        keep_tarball=False):
+  '''Yield the arXiv id and the gzip bytes of every paper while the bucket
+     tarball streams from S3. The tarball is stored in the bucket directory
+     on the way through if `keep_tarball` is set.'''
+
+  s3 = get_s3_client()
+  response = s3.get_object(
+    Bucket=BUCKET, Key=f'src/{bucket_name}', RequestPayer='requester'
+  )
+  body = response['Body']
+  log_info("Streaming {bucket} from S3", bucket=bucket_name)
+
+  copy = None
+  bucket_path = os.path.join(bucket_dir, bucket_name)
+  if keep_tarball:
+    os.makedirs(bucket_dir, exist_ok=True)
+    copy = open(bucket_path + '.part', 'wb')
+    body = TeeReader(body, copy)
+
+  try:
+    # Non-seekable reader, every paper is handed over as soon as it arrives
+    with tarfile.open(fileobj=body, mode='r|') as tar:
+      for member in tar:
+        if member.isfile() and member.name.endswith('.gz'):
+          # Keep only the gzip files in memory, do not process pdfs
+          with tar.extractfile(member) as f_in:
+            yield paper_id_from_member(member.name), f_in.read()
+
+    if copy:
+      # Read whatever follows the end of the archive, then keep the tarball
+      while body.read(1024 * 1024):
+        pass
+      copy.close()
+      if os.path.getsize(bucket_path + '.part') != response['ContentLength']:
+        raise RuntimeError(f'Incomplete copy of {bucket_name}')
+      os.replace(bucket_path + '.part', bucket_path)
+      log_info("Stored {bucket} in {path}", bucket=bucket_name, path=bucket_dir)
+  finally:
+    if copy and not copy.closed:
+      copy.close()
+    response['Body'].close()
+
+
+def remove_archive(arxiv_id, archive_dir='papers/archives'):
+  '''Remove the extracted gzip archive of a paper, if there is one.'''
+
+  archive_path = os.path.join(archive_dir, arxiv_id.replace('/', '') + '.gz')
+  if os.path.exists(archive_path):
+    os.remove(archive_path)
@@ -1,35 +1,41 @@
+import collections
+
+
 class GraphError(Exception):
     """Exception raised if the graph tools fail."""
     pass
 
 
+def topological_order(graph):
+  '''Order the nodes so that every node comes before its children.
+     Nodes on or behind a cycle are left out.'''
+
+  # Count the incoming edges of every node
+  in_degree = {node: 0 for node in graph}
+  for children in graph.values():
+    for child in children:
+      in_degree[child] = in_degree.get(child, 0) + 1
+
+  # Peel off the nodes without any remaining parents (Kahn's algorithm)
+  queue = collections.deque(node for node, degree in in_degree.items() if degree == 0)
+  order = []
+  while queue:
+    node = queue.popleft()
+    order.append(node)
+    for child in graph.get(node, []):
+      in_degree[child] -= 1
+      if in_degree[child] == 0:
+        queue.append(child)
+
+  return order
+
+
 def has_cycle(graph):
   '''Find a cycle in a graph.'''
-  visited = set()
-  in_recursion_stack = set()
-
-  def dfs(node):
-    '''Depth-First Search.'''
-    if node in in_recursion_stack:
-      return True  # Found a cycle
-    if node in visited:
-      return False # Already processed this node
-
-    visited.add(node)
-    in_recursion_stack.add(node)
-        
-    for neighbor in graph.get(node, []):
-      if dfs(neighbor):
-        return True
-        
-    in_recursion_stack.remove(node)
-    return False
-
-  for node in graph:
-    if node not in visited:
-      if dfs(node):
-        return True
-  return False
+
+  # A cycle keeps some of the nodes from ever being ordered
+  nodes = set(graph).union(*graph.values())
+  return len(topological_order(graph)) < len(nodes)
 
 
 def find_main_key(graph):
@@ -1,31 +1,168 @@
 import os
+import io
 import gzip
+import struct
 import tarfile
 import shutil
 
-from rich import print
-import magic
-
-from src.aesthetics import (
-  link,
+from src.log import (
+  log_debug,
+  log_warning,
 )
 
 
+# Number of leading bytes needed to tell the formats apart
+SNIFF_SIZE = 512
+
+# File extensions of the payloads which are not TeX sources
+NON_TEX_EXTENSIONS = {'pdf': '.pdf', 'postscript': '.ps', None: '.bin'}
+
+# Gzip header flags (RFC 1952)
+FHCRC    = 0x02
+FEXTRA   = 0x04
+FNAME    = 0x08
+FCOMMENT = 0x10
+
+
+def parse_gzip_header(data):
+  '''Parse the gzip header (RFC 1952).
+     Return the original filename (or None) and the length of the header,
+     None if the data does not start with a complete gzip header.'''
+
+  if len(data) < 10 or data[:3] != b'\x1f\x8b\x08':
+    return None
+  flags = data[3]
+  pos   = 10
+
+  # Optional extra field, preceded by its length
+  if flags & FEXTRA:
+    if len(data) < pos + 2:
+      return None
+    (extra_length,) = struct.unpack_from('<H', data, pos)
+    pos += 2 + extra_length
+
+  # Optional null-terminated original filename and comment
+  filename = None
+  for flag in (FNAME, FCOMMENT):
+    if flags & flag:
+      end = data.find(b'\0', pos)
+      if end == -1:
+        return None
+      if flag == FNAME:
+        filename = data[pos:end].decode('latin-1') or None
+      pos = end + 1
+
+  # Optional header checksum
+  if flags & FHCRC:
+    pos += 2
+
+  if pos > len(data):
+    return None
+
+  return filename, pos
+
+
+def is_tar_header(block):
+  '''Check if the block is a valid tar header by its checksum.'''
+
+  if len(block) < 512:
+    return False
+  try:
+    stored = int(block[148:156].split(b'\0', 1)[0].strip() or b'-1', 8)
+  except ValueError:
+    return False
+
+  # The checksum field itself counts as spaces, some tools used signed bytes
+  unsigned = sum(block[:148]) + 8 * 32 + sum(block[156:512])
+  signed   = unsigned - 256 * sum(1 for b in block[:148] + block[156:512] if b > 127)
+
+  return stored in (unsigned, signed)
+
+
+def sniff_format(data):
+  '''Classify the data by its first bytes.
+     Return 'gzip', 'tar', 'pdf', 'postscript', 'tex' or None.'''
+
+  head = data[:SNIFF_SIZE]
+
+  if head.startswith(b'\x1f\x8b'):
+    return 'gzip'
+  if head.startswith(b'%PDF-'):
+    return 'pdf'
+  if head.startswith(b'%!'):
+    return 'postscript'
+  if is_tar_header(head):
+    return 'tar'
+
+  # Anything else without binary bytes is taken as plain TeX
+  if head and b'\0' not in head:
+    return 'tex'
+
+  return None
+
+
 def check_gzip(file_path):
   '''Check if the downloaded file is a gzip archive.'''
 
-  # Get the MIME type of the file
-  mime = magic.Magic(mime=True)
-  mime_type = mime.from_file(file_path)
+  # Only the first bytes of the file are needed
+  with open(file_path, 'rb') as f:
+    head = f.read(SNIFF_SIZE)
+
+  if sniff_format(head) == 'gzip':
+    log_debug("File {path} is a gzip archive", path=file_path)
+    return True
+  else:
+    log_warning("File {path} is an unknown type", path=file_path)
+    return None
+
+
+def check_gzip_bytes(archive_name, data):
+  '''Check if the archive held in memory is a gzip archive.'''
 
-  if "gzip" in mime_type:
-    print(f"File {link(file_path)} is a gzip archive")
+  if sniff_format(data) == 'gzip':
+    log_debug("File {path} is a gzip archive", path=archive_name)
     return True
   else:
-    print(f"File {link(file_path)} is an unknown type")
+    log_warning("File {path} is an unknown type", path=archive_name)
     return None
 
 
+def unpack_gzip(data):
+  '''Decompress the gzip archive once and unpack its contents.
+     Return a dictionary mapping relative file paths to their bytes.'''
+
+  content = gzip.decompress(data)
+  files   = {}
+  kind    = sniff_format(content)
+
+  if kind == 'tar':
+    # Read the tarball straight from the decompressed bytes
+    with tarfile.open(fileobj=io.BytesIO(content), mode='r:') as tar:
+      for member in tar.getmembers():
+        if member.isfile():
+          with tar.extractfile(member) as f_in:
+            files[os.path.normpath(member.name)] = f_in.read()
+  elif kind in NON_TEX_EXTENSIONS:
+    # Some papers only have a PDF or PostScript, never parse them as TeX
+    name = get_original_filename_from_gzip_bytes(data) or 'source'
+    if name.endswith('.tex'):
+      name = name[:-4]
+    if not name.endswith(NON_TEX_EXTENSIONS[kind]):
+      name += NON_TEX_EXTENSIONS[kind]
+    log_warning(
+      "Archive holds a {kind} file {name}, not a TeX source",
+      kind=kind or 'binary',
+      name=name,
+    )
+    files[name] = content
+  else:
+    # A single compressed file, keep its original name
+    original_name = get_original_filename_from_gzip_bytes(data)
+    files[original_name or "source.tex"] = content
+
+  return files
+
+
 def extract_gzip(archive_name, archive_dir, extracted_dir):
   '''Extract the contents of the gzip archive.'''
 
@@ -38,48 +175,59 @@ def extract_gzip(archive_name, archive_dir, extracted_dir):
     # Create the directory to extract the contents to
     os.makedirs(paper_dir, exist_ok=False)
 
-    with gzip.open(archive_path, 'rb') as f_in:
-      try:
-        # Attempt to extract the tarball
-        with tarfile.open(fileobj=f_in, mode='r:') as tar:
-          tar.extractall(path=paper_dir)
-          print(f"Extracted contents of {link(archive_path)} to {link(paper_dir)}")
-        # Extraction complete, remove the archive
-        os.remove(archive_path)
-        return paper_name
-      except tarfile.TarError:
-        # If the file is not a tarball, extract the single file
-        original_name = get_original_filename_from_gzip(archive_path)
-        if original_name:
-          file_path = os.path.join(paper_dir, original_name)
-        else:
-          file_path = os.path.join(paper_dir, "source.tex")
-        with gzip.open(archive_path, 'rb') as f_in:
-          with open(file_path, 'wb') as f_out:
-            f_out.write(f_in.read())
-            print(f"Extracted contents of {link(archive_path)} to {link(paper_dir)}")
-        # Extraction complete, remove the archive
-        os.remove(archive_path)
-        return paper_name
+    with open(archive_path, 'rb') as f_in:
+      data = f_in.read()
+    for name, content in unpack_gzip(data).items():
+      # Never write outside of the paper directory
+      if os.path.isabs(name) or name.split(os.sep)[0] == '..':
+        continue
+      file_path = os.path.join(paper_dir, name)
+      os.makedirs(os.path.dirname(file_path), exist_ok=True)
+      with open(file_path, 'wb') as f_out:
+        f_out.write(content)
+    log_debug(
+      "Extracted contents of {path} to {target}", path=archive_path, target=paper_dir
+    )
+
+    # Extraction complete, remove the archive
+    os.remove(archive_path)
+    return paper_name
   except Exception as e:
     # Something went wrong, remove the empty folder
-    shutil.rmtree(paper_dir)
-    print(f'Error extracting {link(archive_path)}: {e}')
+    shutil.rmtree(paper_dir, ignore_errors=True)
+    log_warning("Error extracting {path}: {error}", path=archive_path, error=str(e))
     return None
 
 
 def get_original_filename_from_gzip(gz_file_path):
   '''Extract the original filename from the gzip file header.'''
 
+  # The extra field is at most 64 KiB, the name follows it
   with open(gz_file_path, 'rb') as f:
-    # Skip the first 10 bytes of the gzip header
-    f.seek(10)
-    # Read the filename length byte (null-terminated)
-    filename = bytearray()
-    while True:
-      byte = f.read(1)
-      if byte == b'\0':  # Null byte indicates end of filename
-        break
-      filename.extend(byte)
-
-  return filename.decode('utf-8') if filename else None
+    header = f.read(65536 + 1024)
+
+  return get_original_filename_from_gzip_bytes(header)
+
+
+def extract_gzip_bytes(archive_name, data):
+  '''Extract the contents of the gzip archive held in memory.
+     Return a dictionary mapping relative file paths to their bytes.'''
+
+  try:
+    files = unpack_gzip(data)
+    log_debug("Extracted contents of {path} in memory", path=archive_name)
+    return files
+  except Exception as e:
+    log_warning("Error extracting {path}: {error}", path=archive_name, error=str(e))
+    return None
+
+
+def get_original_filename_from_gzip_bytes(data):
+  '''Extract the original filename from the gzip header held in memory.'''
+
+  header = parse_gzip_header(data)
+  if not header or not header[0]:
+    return None
+
+  # Keep only the name, the header could hold any path
+  return os.path.basename(header[0]) or None
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import threading
+import hashlib
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+
+
+# Identify ourselves to arXiv
+HEADERS = {"User-Agent": "arXivPhysicsPapers/0.1 (mailto:kajetan.niewczas@gmail.com)"}
+
+# Base URL of the arXiv export services, can point to a local stand-in server
+ARXIV_EXPORT_URL = os.environ.get("ARXIV_EXPORT_URL", "http://export.arxiv.org")
+
+# Response headers worth keeping in the cache
+KEPT_HEADERS = ("Content-Type", "Content-Disposition")
+
+
+class CacheMissError(Exception):
+    """Exception raised if a response is missing from the cache in replay mode."""
+
+    pass
+
+
+class HttpResponse:
+    """Minimal response shared by the network and the cache."""
+
+    def __init__(self, status_code, content, headers, from_cache=False):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+
+def request_key(url, params=None):
+    """Canonical cache key of a request, independent of the host."""
+
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query) + list((params or {}).items())
+    return f"{parts.path}?{urlencode(sorted(query))}"
+
+
+class ResponseCache:
+    """On-disk, content-addressed response cache.
+
+    Bodies are stored once under their sha256, every request key points to
+    the body together with the status code and the kept headers."""
+
+    def __init__(self, cache_dir="cache/http"):
+        self.cache_dir = cache_dir
+        os.makedirs(os.path.join(cache_dir, "keys"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+
+    def _key_path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "keys", digest + ".json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def load(self, key):
+        """Return the cached response of the request key, or None."""
+        try:
+            with open(self._key_path(key), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._object_path(meta["body"]), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        return HttpResponse(meta["status"], content, meta["headers"], from_cache=True)
+
+    def store(self, key, response):
+        """Save the response under the request key."""
+
+        # Write the body once, identical bodies share the object
+        digest = hashlib.sha256(response.content).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            _atomic_write(object_path, response.content)
+
+        meta = {
+            "request": key,
+            "status": response.status_code,
+            "headers": {
+                name: response.headers[name]
+                for name in KEPT_HEADERS
+                if name in response.headers
+            },
+            "body": digest,
+        }
+        _atomic_write(self._key_path(key), json.dumps(meta).encode("utf-8"))
+
+
+def _atomic_write(path, data):
+    """Write the file so that readers never see a partial one."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class RateLimiter:
+    """Process-wide politeness limiter for the network requests.
+
+    Requests from all the threads go out one at a time, each one at least
+    the requested delay after the previous one has finished."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def request(self, delay_seconds, func, *args, **kwargs):
+        """Call `func` once the delay since the previous request has passed."""
+        with self._lock:
+            wait = self._last_request + delay_seconds - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._last_request = time.monotonic()
+
+
+# Cache used by all the requests, off by default
+_cache = None
+_cache_mode = "off"
+
+# Limiter shared by all the threads of the process
+_limiter = RateLimiter()
+
+
+def configure_http_cache(mode="off", cache_dir="cache/http"):
+    """Set the cache mode: 'off', 'record' (read-through) or 'replay' (offline)."""
+    global _cache, _cache_mode
+    if mode not in ("off", "record", "replay"):
+        raise ValueError(f"Unknown cache mode: {mode}")
+    _cache_mode = mode
+    _cache = ResponseCache(cache_dir) if mode != "off" else None
+
+
+def http_get(url, params=None, timeout=10, delay_seconds=0):
+    """GET the url through the response cache.
+
+    Requests which go to the network wait at least `delay_seconds` since the
+    previous network request, cached responses are returned immediately."""
+
+    key = request_key(url, params)
+    if _cache is not None:
+        response = _cache.load(key)
+        if response is not None:
+            return response
+        if _cache_mode == "replay":
+            raise CacheMissError(f"No cached response for {key}")
+
+    # Respect the arXiv guidelines between the network requests
+    raw = _limiter.request(
+        delay_seconds,
+        requests.get,
+        url,
+        params=params,
+        headers=HEADERS,
+        timeout=timeout,
+    )
+    response = HttpResponse(raw.status_code, raw.content, raw.headers)
+
+    # Keep only the successful responses
+    if _cache is not None and response.status_code == 200:
+        _cache.store(key, response)
+
+    return response
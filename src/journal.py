@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import threading
+
+from src.log import (
+    log_warning,
+)
+
+
+# Database lines start with the arXiv id, no need to decode the content
+ARXIV_ID_PATTERN = re.compile(rb'^\{"arxiv_id": "([^"]+)"')
+
+# Outcomes which are final, failed papers are tried again on resume
+FINAL_OUTCOMES = ("written", "empty")
+
+
+def repair_jsonl(file_path):
+    """Cut off a half-written last line of a JSONL file."""
+
+    if not os.path.exists(file_path):
+        return False
+
+    with open(file_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return False
+
+        # Find the end of the last complete line
+        f.seek(max(0, size - 1))
+        if f.read(1) == b"\n":
+            return False
+        end = size
+        while end > 0:
+            chunk = min(end, 65536)
+            f.seek(end - chunk)
+            block = f.read(chunk)
+            pos = block.rfind(b"\n")
+            if pos != -1:
+                end = end - chunk + pos + 1
+                break
+            end -= chunk
+        f.truncate(end)
+
+    log_warning("Removed a half-written last line from {path}", path=file_path)
+    return True
+
+
+def read_written_ids(database_file):
+    """Get the arXiv ids of the entries already saved to the database."""
+
+    written = set()
+    if not os.path.exists(database_file):
+        return written
+
+    with open(database_file, "rb") as f:
+        for line in f:
+            match = ARXIV_ID_PATTERN.match(line)
+            if match:
+                written.add(match.group(1).decode("utf-8"))
+            elif line.strip():
+                written.add(json.loads(line)["arxiv_id"])
+
+    return written
+
+
+def is_journal_complete(journal_file):
+    """Check if the last run recorded in the journal finished the bucket."""
+
+    if not os.path.exists(journal_file):
+        return False
+
+    last = None
+    with open(journal_file, "rb") as f:
+        for line in f:
+            if line.strip():
+                last = line
+
+    # A half-written last line means the run was cut short
+    try:
+        return last is not None and json.loads(last)["stage"] == "complete"
+    except (ValueError, KeyError):
+        return False
+
+
+class JsonlSink:
+    """Append-only JSONL database file, every entry reaches the disk at once.
+
+    `write` and `close` return the arXiv ids of the papers they saved."""
+
+    def __init__(self, database_file):
+        self.database_file = database_file
+        self._file = open(database_file, "a", encoding="utf-8")
+
+    def write(self, entry):
+        """Append the entry to the database file."""
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        return [entry["arxiv_id"]]
+
+    def close(self):
+        """Close the database file, nothing is left to save."""
+        self._file.close()
+        return []
+
+
+class ProgressJournal:
+    """Durable per-bucket journal of the progress of every paper.
+
+    Every line records either the resolved metadata of a paper or the
+    final outcome of its processing ('written', 'empty' or 'failed'). A
+    last 'complete' line marks a run which went through the whole bucket."""
+
+    def __init__(self, journal_file, resume=False):
+        self.journal_file = journal_file
+        self.metadata = {}
+        self.finished = {}
+        self.complete = False
+        self._lock = threading.Lock()
+
+        if resume:
+            # Load the previous progress, a crash could have cut the last line
+            repair_jsonl(journal_file)
+            if os.path.exists(journal_file):
+                with open(journal_file, "r", encoding="utf-8") as f:
+                    for line in f:
+                        self._load(json.loads(line))
+        self._file = open(journal_file, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self, record):
+        """Apply a single journal record."""
+        self.complete = record["stage"] == "complete"
+        if record["stage"] == "metadata":
+            self.metadata[record["id"]] = record["entry"]
+        elif record["stage"] == "done":
+            self.finished[record["id"]] = record["outcome"]
+
+    def finished_ids(self):
+        """The arXiv ids of the papers with a final outcome."""
+        return {
+            arxiv_id
+            for arxiv_id, outcome in self.finished.items()
+            if outcome in FINAL_OUTCOMES
+        }
+
+    def _write(self, record):
+        """Append a record and push it to the disk."""
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            self._load(record)
+
+    def record_metadata(self, entry):
+        """Remember the resolved metadata of a paper."""
+        record = {"id": entry["arxiv_id"], "stage": "metadata", "entry": dict(entry)}
+        self._write(record)
+
+    def record_outcome(self, arxiv_id, outcome, error=None):
+        """Remember how the processing of a paper ended."""
+        record = {"id": arxiv_id, "stage": "done", "outcome": outcome}
+        if error:
+            record["error"] = error
+        self._write(record)
+
+    def record_complete(self):
+        """Mark the run as finished with the whole bucket."""
+        self._write({"stage": "complete"})
+
+    def close(self):
+        """Flush the journal for good."""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+
+from rich import print
+from rich.markup import escape
+from rich.progress import (
+    Progress,
+    BarColumn,
+    TextColumn,
+    MofNCompleteColumn,
+    TimeElapsedColumn,
+)
+
+from src.aesthetics import (
+    sep_line,
+    header,
+    link,
+)
+
+
+# Levels of the records, by increasing severity
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Number of records kept in memory before they are written to the file
+BUFFER_SIZE = 256
+
+# Seconds between the progress lines when the output is not a terminal
+PROGRESS_INTERVAL = 10
+
+
+class _Config:
+    """Logging configuration of this process."""
+
+    def __init__(self):
+        self.console_level = LEVELS["debug"]
+        self.file_level = LEVELS["debug"]
+        self.log_file = None
+        self.markup = sys.stdout.isatty()
+        self.fd = None
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+
+_config = _Config()
+
+
+def configure_logging(console_level="debug", log_file=None, markup=None):
+    """Set up the console and the JSON-lines file sink of this process.
+
+    Records below `console_level` are not shown, but still written to the
+    `log_file` if given. Markup is rendered only on a terminal by default.
+    Call it with the settings of `get_logging_config` in worker processes."""
+
+    global _config
+    flush_log()
+    if _config.fd is not None:
+        # A forked worker closes only its copy of the file
+        os.close(_config.fd)
+
+    _config = _Config()
+    _config.console_level = LEVELS[console_level]
+    _config.markup = sys.stdout.isatty() if markup is None else markup
+    _config.log_file = log_file
+    if log_file:
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        # Appends of whole lines do not interleave between the processes
+        _config.fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+
+def get_logging_config():
+    """Settings to configure the logging of a worker process the same way."""
+    level = next(k for k, v in LEVELS.items() if v == _config.console_level)
+    return level, _config.log_file, _config.markup
+
+
+def default_log_file(log_dir="logs", name="papers"):
+    """Path of a new JSON-lines log file in the log directory."""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(log_dir, f"{name}-{stamp}.jsonl")
+
+
+def flush_log():
+    """Write the buffered records to the log file."""
+    with _config.lock:
+        # Records inherited by a forked process are written by its parent
+        if _config.pid != os.getpid():
+            _config.buffer.clear()
+        if _config.fd is None or not _config.buffer:
+            return
+        data = "".join(_config.buffer).encode("utf-8")
+        _config.buffer.clear()
+    os.write(_config.fd, data)
+
+
+atexit.register(flush_log)
+
+
+def _write_line(line):
+    """Write a plain line at once, the workers share the output."""
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def _render(message, fields, style):
+    """Show the record on the console, with markup only on a terminal."""
+
+    if not _config.markup:
+        _write_line(message.format(**fields))
+        return
+
+    text = escape(message).format(
+        **{name: link(escape(str(value))) for name, value in fields.items()}
+    )
+    if style == "header":
+        text = header(text)
+    print(text)
+
+
+def log(level, message, style=None, **fields):
+    """Record the message, `fields` fill its {placeholders}.
+
+    The console gets the formatted message, the log file a JSON record
+    with the message, its template and the fields."""
+
+    severity = LEVELS[level]
+    if severity >= _config.console_level:
+        _render(message, fields, style)
+
+    if _config.fd is None or severity < _config.file_level:
+        return
+
+    record = {
+        "time": round(time.time(), 3),
+        "level": level,
+        "message": message.format(**fields),
+        "event": message,
+        "pid": os.getpid(),
+    }
+    record.update(fields)
+    line = json.dumps(record, default=str) + "\n"
+    with _config.lock:
+        _config.buffer.append(line)
+        full = len(_config.buffer) >= BUFFER_SIZE
+    # Errors are written right away
+    if full or severity >= LEVELS["error"]:
+        flush_log()
+
+
+def log_debug(message, style=None, **fields):
+    log("debug", message, style, **fields)
+
+
+def log_info(message, style=None, **fields):
+    log("info", message, style, **fields)
+
+
+def log_warning(message, style=None, **fields):
+    log("warning", message, style, **fields)
+
+
+def log_error(message, style=None, **fields):
+    log("error", message, style, **fields)
+
+
+def log_separator(level="debug"):
+    """Separate the records of consecutive papers on the console."""
+    if LEVELS[level] < _config.console_level:
+        return
+    if _config.markup:
+        print(sep_line())
+    else:
+        _write_line("-" * 80)
+
+
+class ProgressBar:
+    """Compact progress of the papers in place of the per-paper records.
+
+    Draws a bar on a terminal, otherwise prints a plain line from time
+    to time. `total` can be None if the number of papers is unknown."""
+
+    def __init__(self, description, total=None, enabled=True):
+        self.description = description
+        self.total = total
+        self.count = 0
+        self.outcomes = {}
+        self.enabled = enabled
+        self._start = time.monotonic()
+        self._last = self._start
+        self._progress = None
+        if enabled and _config.markup:
+            self._progress = Progress(
+                TextColumn("{task.description}"),
+                BarColumn(),
+                MofNCompleteColumn(),
+                TextColumn("{task.fields[outcomes]}"),
+                TimeElapsedColumn(),
+            )
+            self._task = self._progress.add_task(
+                description, total=total, outcomes=""
+            )
+            self._progress.start()
+
+    def _outcomes(self):
+        return ", ".join(f"{n} {outcome}" for outcome, n in self.outcomes.items())
+
+    def advance(self, outcome):
+        """Count a finished paper with its outcome."""
+        self.count += 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if not self.enabled:
+            return
+
+        if self._progress is not None:
+            self._progress.update(self._task, advance=1, outcomes=self._outcomes())
+            return
+
+        now = time.monotonic()
+        if now - self._last >= PROGRESS_INTERVAL:
+            self._last = now
+            self._print_line()
+
+    def _print_line(self):
+        total = f"/{self.total}" if self.total is not None else ""
+        elapsed = time.monotonic() - self._start
+        _write_line(
+            f"{self.description}: {self.count}{total} papers "
+            f"({self._outcomes() or 'none'}) in {elapsed:.0f}s"
+        )
+
+    def close(self):
+        """Stop the bar and leave a final line."""
+        if not self.enabled:
+            return
+        if self._progress is not None:
+            self._progress.stop()
+            self._progress = None
+        else:
+            self._print_line()
@@ -0,0 +1,347 @@
+import os
+import re
+import json
+import hashlib
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from src.arxiv_api import (
+    harvest_oaipmh,
+)
+from src.log import (
+    log_info,
+)
+
+
+# Snapshot lines start with the id, no need to decode the whole record
+ID_PATTERN = re.compile(rb'^\s*\{\s*"id"\s*:\s*"([^"]+)"')
+
+# Number of rows written in a single transaction
+BATCH_SIZE = 10000
+
+# Number of ids in a single lookup query
+LOOKUP_SIZE = 500
+
+# Days harvested in a single OAI-PMH request range, the progress of a month
+# is saved after every one of them
+HARVEST_WINDOW_DAYS = 7
+
+# Adjacent months share a partition, only one thread harvests it at a time
+_partition_locks = {}
+_partition_locks_lock = threading.Lock()
+
+
+def open_metadata_store(store_path):
+    """Open the metadata store, create the tables if needed."""
+
+    store_dir = os.path.dirname(store_path)
+    if store_dir:
+        os.makedirs(store_dir, exist_ok=True)
+
+    # Buckets can be prefetched while another one reads the store
+    conn = sqlite3.connect(store_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS records ("
+        "id TEXT PRIMARY KEY, digest BLOB NOT NULL, record TEXT NOT NULL"
+        ") WITHOUT ROWID"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sources ("
+        "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL"
+        ")"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS harvested_months ("
+        "month TEXT PRIMARY KEY, until TEXT NOT NULL, start TEXT"
+        ")"
+    )
+    # Older stores have no start column, their months start on the 1st
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(harvested_months)")]
+    if "start" not in columns:
+        conn.execute("ALTER TABLE harvested_months ADD COLUMN start TEXT")
+
+    return conn
+
+
+def _record_id(line):
+    """Get the arXiv id of a snapshot line."""
+    match = ID_PATTERN.match(line)
+    if match:
+        return match.group(1).decode("utf-8")
+    # Unusual layout, decode the whole record
+    return json.loads(line).get("id")
+
+
+def _upsert_records(conn, batch):
+    """Write the (id, digest, record) rows in a single transaction.
+
+    Only new or changed records are written, returns their number."""
+
+    query = (
+        "INSERT INTO records (id, digest, record) VALUES (?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET "
+        "digest = excluded.digest, record = excluded.record "
+        "WHERE digest != excluded.digest"
+    )
+    with conn:
+        before = conn.total_changes
+        conn.executemany(query, batch)
+        return conn.total_changes - before
+
+
+def update_metadata_store(snapshot_path, store_path):
+    """Index the snapshot in the metadata store.
+
+    Only the records which are new or changed since the last update
+    are written. Returns the number of written records."""
+
+    stat = os.stat(snapshot_path)
+    conn = open_metadata_store(store_path)
+    try:
+        # Nothing to do if the snapshot did not change
+        row = conn.execute(
+            "SELECT size, mtime FROM sources WHERE path = ?", (snapshot_path,)
+        ).fetchone()
+        if row == (stat.st_size, stat.st_mtime):
+            log_info("Metadata store {path} is up to date", path=store_path)
+            return 0
+
+        # Upsert the records, rewrite only the changed ones
+        written = 0
+        batch = []
+        with open(snapshot_path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                arxiv_id = _record_id(line)
+                if not arxiv_id:
+                    continue
+                digest = hashlib.blake2b(line, digest_size=16).digest()
+                batch.append((arxiv_id, digest, line.decode("utf-8")))
+                if len(batch) >= BATCH_SIZE:
+                    written += _upsert_records(conn, batch)
+                    batch.clear()
+        if batch:
+            written += _upsert_records(conn, batch)
+
+        # Remember the indexed version of the snapshot
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sources (path, size, mtime) VALUES (?, ?, ?)",
+                (snapshot_path, stat.st_size, stat.st_mtime),
+            )
+
+        log_info(
+            "Indexed {count} new or changed records in {path}",
+            count=written,
+            path=store_path,
+        )
+
+        return written
+
+    finally:
+        conn.close()
+
+
+def _month_partitions(from_date, until_date):
+    """Split the date range into the calendar months it overlaps.
+
+    Returns (month, start, end) with the part of the range in every month."""
+
+    partitions = []
+    first = from_date.replace(day=1)
+    while first <= until_date:
+        following = (first + timedelta(days=32)).replace(day=1)
+        last = following - timedelta(days=1)
+        partitions.append(
+            (first.strftime("%Y-%m"), max(first, from_date), min(last, until_date))
+        )
+        first = following
+
+    return partitions
+
+
+def _harvest_windows(conn, start, end, delay_seconds, on_window=None):
+    """Harvest the records between two datestamps into the store.
+
+    The range is requested a few days at a time, `on_window` is called with
+    the last day of every finished window. Returns the number of written
+    records."""
+
+    written = 0
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + timedelta(days=HARVEST_WINDOW_DAYS - 1), end)
+
+        batch = []
+        for record in harvest_oaipmh(window_start, window_end, delay_seconds):
+            if not record.get("id"):
+                continue
+            line = json.dumps(record).encode("utf-8")
+            digest = hashlib.blake2b(line, digest_size=16).digest()
+            batch.append((record["id"], digest, line.decode("utf-8")))
+            if len(batch) >= BATCH_SIZE:
+                written += _upsert_records(conn, batch)
+                batch.clear()
+        if batch:
+            written += _upsert_records(conn, batch)
+
+        # The records may come in any order, only a finished window counts
+        if on_window:
+            on_window(window_end)
+        window_start = window_end + timedelta(days=1)
+
+    return written
+
+
+def _save_harvested(conn, month, start, until):
+    """Remember the harvested range of datestamps of the month."""
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO harvested_months (month, start, until) "
+            "VALUES (?, ?, ?)",
+            (month, start.strftime("%Y-%m-%d"), until.strftime("%Y-%m-%d")),
+        )
+
+
+def _harvest_partition(conn, store_path, month, first, end, delay_seconds):
+    """Harvest the days between `first` and `end` of the month missing from
+    the store. Returns the number of written records."""
+
+    if first > end:
+        return 0
+
+    row = conn.execute(
+        "SELECT start, until FROM harvested_months WHERE month = ?", (month,)
+    ).fetchone()
+    if row is None:
+        # Nothing of the month yet
+        written = _harvest_windows(
+            conn,
+            first,
+            end,
+            delay_seconds,
+            lambda day: _save_harvested(conn, month, first, day),
+        )
+    else:
+        # Older stores only harvested whole months
+        start = datetime.strptime(row[0] or month + "-01", "%Y-%m-%d")
+        until = datetime.strptime(row[1], "%Y-%m-%d")
+
+        # The last harvested day could have got more records since, unless
+        # the month is over
+        month_first = datetime.strptime(month + "-01", "%Y-%m-%d")
+        following = (month_first + timedelta(days=32)).replace(day=1)
+        finished = until >= following - timedelta(days=1)
+        if first >= start and (end < until or (end == until and finished)):
+            return 0
+
+        # Days before the harvested range, saved once they are all in
+        written = 0
+        if first < start:
+            written += _harvest_windows(
+                conn, first, start - timedelta(days=1), delay_seconds
+            )
+            start = first
+            _save_harvested(conn, month, start, until)
+
+        # Days after it, from the last harvested datestamp
+        if end > until or (end == until and not finished):
+            written += _harvest_windows(
+                conn,
+                until,
+                end,
+                delay_seconds,
+                lambda day: _save_harvested(conn, month, start, day),
+            )
+
+    log_info("Harvested metadata of {month} into {path}", month=month, path=store_path)
+
+    return written
+
+
+def update_harvested_metadata(store_path, from_date, until_date, delay_seconds=5):
+    """Harvest the metadata of the given date range into the store.
+
+    The store is partitioned by calendar months of the OAI-PMH datestamps
+    and remembers the harvested range of every month. Only the days outside
+    of it are harvested, an interrupted harvest continues from the last
+    finished window. Returns the number of written records."""
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    conn = open_metadata_store(store_path)
+    try:
+        written = 0
+        for month, first, last in _month_partitions(from_date, until_date):
+            with _partition_locks_lock:
+                lock = _partition_locks.setdefault(month, threading.Lock())
+            with lock:
+                written += _harvest_partition(
+                    conn, store_path, month, first, min(last, today), delay_seconds
+                )
+
+        return written
+
+    finally:
+        conn.close()
+
+
+def lookup_metadata_record(conn, arxiv_id):
+    """Get the decoded metadata record of an arXiv id from an open store.
+
+    Returns None if the store has no record of the paper."""
+
+    row = conn.execute(
+        "SELECT record FROM records WHERE id = ?", (arxiv_id,)
+    ).fetchone()
+
+    return json.loads(row[0]) if row else None
+
+
+def lookup_metadata_records(store_path, arxiv_ids):
+    """Yield the decoded metadata records of the given arXiv ids."""
+
+    arxiv_ids = list(dict.fromkeys(arxiv_ids))
+    conn = open_metadata_store(store_path)
+    try:
+        for i in range(0, len(arxiv_ids), LOOKUP_SIZE):
+            chunk = arxiv_ids[i : i + LOOKUP_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT record FROM records WHERE id IN ({placeholders})", chunk
+            )
+            # Decode only the records we actually need
+            for (record,) in rows:
+                yield json.loads(record)
+    finally:
+        conn.close()
+
+
+def main():
+    """Build or update the metadata store from the snapshot."""
+
+    parser = argparse.ArgumentParser(
+        description="Index the arXiv metadata snapshot by arXiv id."
+    )
+    parser.add_argument(
+        "--snapshot",
+        default="metadata/arxiv-metadata-oai-snapshot.json",
+        help="Path to the metadata snapshot",
+    )
+    parser.add_argument(
+        "--store",
+        default="metadata/arxiv-metadata.sqlite",
+        help="Path to the metadata store",
+    )
+    args = parser.parse_args()
+
+    update_metadata_store(args.snapshot, args.store)
+
+
+if __name__ == "__main__":
+    main()
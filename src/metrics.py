@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+# Stages of the pipeline, in the order a paper goes through them
+STAGES = ("tar", "gzip", "tex", "merge", "convert", "metadata", "write")
+
+# Percentiles of the stage durations in the summary
+PERCENTILES = (50, 90, 99)
+
+
+def timed(metrics, stage, num_bytes=0):
+    """Time the block as the stage of the metrics, do nothing without them."""
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.stage(stage, num_bytes)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of the sorted values."""
+    if not values:
+        return None
+    rank = max(int(-(-p * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+class PaperMetrics:
+    """Durations and sizes of the stages of a single paper.
+
+    Small and picklable, so the workers can send it back with the result."""
+
+    def __init__(self):
+        self.stages = {}  # stage -> [seconds, bytes]
+        self.timeout = None
+
+    @contextlib.contextmanager
+    def stage(self, name, num_bytes=0):
+        """Add the time spent in the block to the stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, num_bytes)
+
+    def add(self, name, seconds, num_bytes=0):
+        """Add a measured duration to the stage."""
+        record = self.stages.setdefault(name, [0.0, 0])
+        record[0] += seconds
+        record[1] += num_bytes
+
+    def mark_timeout(self, name):
+        """Remember the stage which ran out of time."""
+        self.timeout = name
+
+
+class RunMetrics:
+    """Metrics of processing a single bucket.
+
+    Collects the stage measurements of every paper, the stages done once
+    for the whole bucket and the outcome of every paper. `write` saves the
+    per-paper records with a summary of the throughput and the percentile
+    latencies per stage."""
+
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self._lock = threading.Lock()
+        self._papers = {}  # arxiv_id -> per-paper record
+        self._samples = {}  # stage -> [(seconds, bytes)]
+        self._bucket_stages = {}  # stage -> [seconds, bytes]
+        self._started = None
+        self._start = None
+
+    def start(self):
+        """Start the clock of the throughput."""
+        self._started = time.time()
+        self._start = time.perf_counter()
+
+    def _paper(self, arxiv_id):
+        return self._papers.setdefault(
+            arxiv_id,
+            {"id": arxiv_id, "outcome": None, "stages": {}, "bytes": 0},
+        )
+
+    def record_paper(self, arxiv_id, paper_metrics):
+        """Merge the stage measurements of a paper."""
+        with self._lock:
+            paper = self._paper(arxiv_id)
+            for name, (seconds, num_bytes) in paper_metrics.stages.items():
+                paper["stages"][name] = paper["stages"].get(name, 0.0) + seconds
+                self._samples.setdefault(name, []).append((seconds, num_bytes))
+                # The size of the paper is the size of its archive
+                if name == "gzip":
+                    paper["bytes"] = num_bytes
+            if paper_metrics.timeout:
+                paper["timeout"] = paper_metrics.timeout
+
+    def record_stage(self, name, seconds, num_bytes=0, arxiv_id=None):
+        """Record a stage measured outside of the workers.
+
+        Without an arXiv id the stage was done once for the whole bucket."""
+        if arxiv_id is None:
+            with self._lock:
+                record = self._bucket_stages.setdefault(name, [0.0, 0])
+                record[0] += seconds
+                record[1] += num_bytes
+            return
+
+        paper_metrics = PaperMetrics()
+        paper_metrics.add(name, seconds, num_bytes)
+        self.record_paper(arxiv_id, paper_metrics)
+
+    @contextlib.contextmanager
+    def stage(self, name, num_bytes=0, arxiv_id=None):
+        """Time the block as a stage of the bucket or of a single paper."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start, num_bytes, arxiv_id)
+
+    def timed_sources(self, sources):
+        """Time reading every archive of the bucket, pass the pairs through."""
+        sources = iter(sources)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(sources)
+            except StopIteration:
+                return
+            key, data = item
+            arxiv_id = key["arxiv_id"] if isinstance(key, dict) else key
+            self.record_stage(
+                "tar", time.perf_counter() - start, len(data or b""), arxiv_id
+            )
+            yield item
+
+    def record_outcome(self, arxiv_id, outcome, reason=None):
+        """Record how the processing of the paper ended."""
+        with self._lock:
+            paper = self._paper(arxiv_id)
+            paper["outcome"] = outcome
+            if reason:
+                paper["reason"] = reason
+
+    def summary(self):
+        """Throughput, outcomes and per-stage latencies of the run."""
+
+        elapsed = time.perf_counter() - self._start if self._start else 0.0
+        with self._lock:
+            papers = list(self._papers.values())
+            samples = {name: list(values) for name, values in self._samples.items()}
+            bucket_stages = {k: list(v) for k, v in self._bucket_stages.items()}
+
+        outcomes = {}
+        for paper in papers:
+            if paper["outcome"]:
+                outcomes[paper["outcome"]] = outcomes.get(paper["outcome"], 0) + 1
+        num_papers = sum(outcomes.values())
+        num_bytes = sum(paper["bytes"] for paper in papers)
+
+        # Known stages in the pipeline order, then any others
+        names = [name for name in STAGES if name in samples]
+        names += sorted(name for name in samples if name not in STAGES)
+
+        stages = {}
+        for name in names:
+            seconds = sorted(s for s, _ in samples[name])
+            stage_bytes = sum(b for _, b in samples[name])
+            total = sum(seconds)
+            rate = stage_bytes / 1e6 / total if total and stage_bytes else None
+            stages[name] = {
+                "count": len(seconds),
+                "total_s": round(total, 6),
+                "bytes": stage_bytes,
+                "mb_per_s": round(rate, 3) if rate is not None else None,
+                "max_s": round(seconds[-1], 6),
+            }
+            for p in PERCENTILES:
+                stages[name][f"p{p}_s"] = round(percentile(seconds, p), 6)
+
+        return {
+            "bucket": self.bucket_name,
+            "started": (
+                time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started))
+                if self._started
+                else None
+            ),
+            "elapsed_s": round(elapsed, 3),
+            "papers": num_papers,
+            "outcomes": outcomes,
+            "timeouts": sum(1 for paper in papers if paper.get("timeout")),
+            "bytes": num_bytes,
+            "papers_per_s": round(num_papers / elapsed, 3) if elapsed else None,
+            "mb_per_s": round(num_bytes / 1e6 / elapsed, 3) if elapsed else None,
+            "stages": stages,
+            "bucket_stages": {
+                name: {"total_s": round(seconds, 6), "bytes": num_bytes}
+                for name, (seconds, num_bytes) in bucket_stages.items()
+            },
+        }
+
+    def write(self, metrics_dir):
+        """Save the summary and the per-paper records, return the file path."""
+
+        os.makedirs(metrics_dir, exist_ok=True)
+        base = os.path.splitext(self.bucket_name)[0]
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started))
+        metrics_path = os.path.join(metrics_dir, f"metrics-{base}-{stamp}.json")
+
+        with self._lock:
+            papers = [dict(paper) for paper in self._papers.values()]
+        for paper in papers:
+            paper["stages"] = {k: round(v, 6) for k, v in paper["stages"].items()}
+
+        # Write atomically, a half-written file is not machine-readable
+        tmp_path = metrics_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "papers": papers}, f, indent=1)
+        os.replace(tmp_path, metrics_path)
+
+        return metrics_path
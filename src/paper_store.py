@@ -0,0 +1,227 @@
+import os
+import json
+import sqlite3
+import argparse
+
+from rich import print
+from rich.markup import escape
+
+from src.aesthetics import (
+    link,
+)
+
+
+# Number of papers written in a single transaction
+BATCH_SIZE = 200
+
+# Columns of the papers table, in the order of the entries
+COLUMNS = (
+    "arxiv_id",
+    "pdf_url",
+    "title",
+    "authors",
+    "abstract",
+    "categories",
+    "published",
+    "comments",
+    "license",
+    "content",
+)
+
+
+def open_paper_store(store_path):
+    """Open the paper database, create the tables and the index if needed."""
+
+    store_dir = os.path.dirname(store_path)
+    if store_dir:
+        os.makedirs(store_dir, exist_ok=True)
+
+    conn = sqlite3.connect(store_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS papers ("
+        "id INTEGER PRIMARY KEY, arxiv_id TEXT NOT NULL UNIQUE, pdf_url TEXT, "
+        "title TEXT, authors TEXT, abstract TEXT, categories TEXT, "
+        "published TEXT, comments TEXT, license TEXT, content TEXT"
+        ")"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS paper_categories ("
+        "category TEXT NOT NULL, paper_id INTEGER NOT NULL, "
+        "PRIMARY KEY (category, paper_id)"
+        ") WITHOUT ROWID"
+    )
+    # Full-text index over the papers table, the text is not stored twice
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5("
+        "title, abstract, content, content='papers', content_rowid='id'"
+        ")"
+    )
+
+    return conn
+
+
+def _delete_papers(conn, arxiv_ids):
+    """Remove the papers and their index entries before rewriting them."""
+
+    rows = conn.execute(
+        f"SELECT id, title, abstract, content FROM papers "
+        f"WHERE arxiv_id IN ({', '.join('?' * len(arxiv_ids))})",
+        arxiv_ids,
+    ).fetchall()
+    if not rows:
+        return
+
+    conn.executemany(
+        "INSERT INTO papers_fts (papers_fts, rowid, title, abstract, content) "
+        "VALUES ('delete', ?, ?, ?, ?)",
+        rows,
+    )
+    paper_ids = [(row[0],) for row in rows]
+    conn.executemany("DELETE FROM paper_categories WHERE paper_id = ?", paper_ids)
+    conn.executemany("DELETE FROM papers WHERE id = ?", paper_ids)
+
+
+def _insert_papers(conn, entries):
+    """Write the entries together with their categories and index entries."""
+
+    placeholders = ", ".join("?" * len(COLUMNS))
+    for entry in entries:
+        row = [entry.get(column) for column in COLUMNS]
+        row[COLUMNS.index("authors")] = json.dumps(entry.get("authors", []))
+        row[COLUMNS.index("categories")] = json.dumps(entry.get("categories", []))
+        cursor = conn.execute(
+            f"INSERT INTO papers ({', '.join(COLUMNS)}) VALUES ({placeholders})", row
+        )
+        paper_id = cursor.lastrowid
+
+        conn.executemany(
+            "INSERT OR IGNORE INTO paper_categories (category, paper_id) VALUES (?, ?)",
+            [(category, paper_id) for category in entry.get("categories", [])],
+        )
+        conn.execute(
+            "INSERT INTO papers_fts (rowid, title, abstract, content) "
+            "VALUES (?, ?, ?, ?)",
+            (paper_id, entry.get("title"), entry.get("abstract"), entry.get("content")),
+        )
+
+
+class PaperStore:
+    """SQLite output sink, an alternative to the JSONL database file.
+
+    Entries are written in batched transactions. `write` and `close` return
+    the arXiv ids of the papers committed to the disk by that call."""
+
+    def __init__(self, store_path, batch_size=BATCH_SIZE):
+        self.store_path = store_path
+        self.batch_size = batch_size
+        self._conn = open_paper_store(store_path)
+        self._pending = []
+
+    def write(self, entry):
+        """Queue the entry, commit the batch once it is full."""
+        self._pending.append(entry)
+        if len(self._pending) >= self.batch_size:
+            return self.commit()
+        return []
+
+    def commit(self):
+        """Write the queued entries in a single transaction."""
+        if not self._pending:
+            return []
+
+        # A paper written again replaces the previous version
+        entries = list({entry["arxiv_id"]: entry for entry in self._pending}.values())
+        with self._conn:
+            _delete_papers(self._conn, [entry["arxiv_id"] for entry in entries])
+            _insert_papers(self._conn, entries)
+        self._pending.clear()
+
+        return [entry["arxiv_id"] for entry in entries]
+
+    def close(self):
+        """Commit the remaining entries and close the database."""
+        committed = self.commit()
+        self._conn.close()
+        return committed
+
+
+def read_stored_ids(store_path):
+    """Get the arXiv ids of the papers already saved to the database."""
+
+    if not os.path.exists(store_path):
+        return set()
+
+    conn = open_paper_store(store_path)
+    try:
+        return {arxiv_id for (arxiv_id,) in conn.execute("SELECT arxiv_id FROM papers")}
+    finally:
+        conn.close()
+
+
+def search_papers(store_path, phrase=None, category=None, limit=20):
+    """Find the papers containing the phrase and/or in the category.
+
+    Returns a list of (arxiv_id, title, snippet) tuples, best matches first."""
+
+    columns = "p.arxiv_id, p.title, NULL"
+    tables = "papers p"
+    conditions = []
+    params = []
+    order = "p.arxiv_id"
+
+    if phrase:
+        # Match the words as a phrase, in any of the indexed columns
+        columns = "p.arxiv_id, p.title, snippet(papers_fts, -1, '«', '»', '...', 12)"
+        tables += " JOIN papers_fts ON papers_fts.rowid = p.id"
+        conditions.append("papers_fts MATCH ?")
+        params.append('"' + phrase.replace('"', '""') + '"')
+        order = "papers_fts.rank"
+    if category:
+        conditions.append(
+            "p.id IN (SELECT paper_id FROM paper_categories WHERE category = ?)"
+        )
+        params.append(category)
+
+    query = f"SELECT {columns} FROM {tables}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+
+    conn = open_paper_store(store_path)
+    try:
+        return conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    """Search the paper database from the command line."""
+
+    parser = argparse.ArgumentParser(
+        description="Search the SQLite paper database by phrase and category."
+    )
+    parser.add_argument("database", help="Path to the .sqlite database file")
+    parser.add_argument("phrase", nargs="?", help="Phrase to look for")
+    parser.add_argument("--category", help="Only papers in the category, e.g. hep-th")
+    parser.add_argument(
+        "--limit", type=int, default=20, help="Maximum number of papers to show"
+    )
+    args = parser.parse_args()
+    if not args.phrase and not args.category:
+        parser.error("give a phrase, a --category or both")
+
+    results = search_papers(args.database, args.phrase, args.category, args.limit)
+    for arxiv_id, title, snippet in results:
+        # Titles and snippets are LaTeX, their brackets are not markup
+        print(f"{link(escape(arxiv_id))} {escape(title or '')}")
+        if snippet:
+            print(f"    {escape(' '.join(snippet.split()))}")
+
+    print(f"Found {link(len(results))} papers in {link(escape(args.database))}")
+
+
+if __name__ == "__main__":
+    main()
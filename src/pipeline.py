@@ -0,0 +1,354 @@
+import os
+import collections
+import multiprocessing
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    wait,
+    FIRST_COMPLETED,
+)
+from concurrent.futures.process import (
+    BrokenProcessPool,
+)
+
+from src.arxiv_api import (
+    extract_source,
+    extract_source_bytes,
+    copy_source_tex,
+    merge_source_tex,
+    extract_plain_text,
+    convert_plain_text,
+)
+from src.metrics import (
+    PaperMetrics,
+)
+from src.log import (
+    configure_logging,
+    get_logging_config,
+    flush_log,
+    log_debug,
+    log_separator,
+)
+
+
+def process_entry(
+    entry,
+    archive_dir="papers/archives",
+    extracted_dir="papers/extracted",
+    sources_dir="papers/sources",
+    metrics=None,
+):
+    """Run all the per-paper stages and return the finished entry.
+
+    Returns None if the paper produced no plain text, raises on failure.
+    The stages are timed into `metrics` if given."""
+
+    log_separator()
+    log_debug("Processing paper: {arxiv_id}", "header", arxiv_id=entry["arxiv_id"])
+
+    # Paper source code archive extracted from the bucket
+    archive_name = entry["safe_id"] + ".gz"
+
+    # Unpack the archive containing the paper source code
+    paper_name = extract_source(archive_name, archive_dir, extracted_dir, metrics)
+    if not paper_name:
+        raise RuntimeError(f"Unpacking failed for '{entry['arxiv_id']}'")
+
+    # Copy the source .tex file to the sources directory
+    source_name = copy_source_tex(paper_name, extracted_dir, sources_dir, metrics)
+    if not source_name:
+        raise RuntimeError(
+            f"Copying a source .tex file failed for '{entry['arxiv_id']}'"
+        )
+
+    # Convert the .tex source file into plain text
+    plain_text = extract_plain_text(source_name, sources_dir, metrics=metrics)
+    if not plain_text:
+        return None
+
+    # Add plain text to the paper's content
+    entry["content"] = plain_text
+
+    # Clean the unnecessary fields from the entry
+    del entry["safe_id"]
+
+    return entry
+
+
+def process_entry_bytes(
+    entry,
+    data,
+    archive_dir="papers/archives",
+    extracted_dir="papers/extracted",
+    sources_dir="papers/sources",
+    keep_intermediate=False,
+    metrics=None,
+):
+    """Run all the per-paper stages in memory and return the finished entry.
+
+    The intermediate files are written only if `keep_intermediate` is set.
+    Returns None if the paper produced no plain text, raises on failure.
+    The stages are timed into `metrics` if given."""
+
+    log_separator()
+    log_debug("Processing paper: {arxiv_id}", "header", arxiv_id=entry["arxiv_id"])
+
+    # Paper source code archive streamed from the bucket
+    archive_name = entry["safe_id"] + ".gz"
+    paper_name = entry["safe_id"]
+    if keep_intermediate:
+        _write_intermediate(os.path.join(archive_dir, archive_name), data)
+
+    # Unpack the archive containing the paper source code
+    files = extract_source_bytes(archive_name, data, metrics)
+    if not files:
+        raise RuntimeError(f"Unpacking failed for '{entry['arxiv_id']}'")
+    if keep_intermediate:
+        for name, content in files.items():
+            _write_intermediate(os.path.join(extracted_dir, paper_name, name), content)
+
+    # Merge the source .tex files
+    tex_content = merge_source_tex(paper_name, files, metrics)
+    if not tex_content:
+        raise RuntimeError(
+            f"Merging the source .tex files failed for '{entry['arxiv_id']}'"
+        )
+    if keep_intermediate:
+        source_path = os.path.join(sources_dir, paper_name + ".tex")
+        _write_intermediate(source_path, tex_content.encode("utf-8"))
+
+    # Convert the .tex source into plain text
+    plain_text = convert_plain_text(tex_content, paper_name + ".tex", metrics=metrics)
+    if not plain_text:
+        return None
+
+    # Add plain text to the paper's content
+    entry["content"] = plain_text
+
+    # Clean the unnecessary fields from the entry
+    del entry["safe_id"]
+
+    return entry
+
+
+def _write_intermediate(path, data):
+    """Write an intermediate file for debugging."""
+
+    # Never write outside of the target directory
+    if os.path.isabs(path) or ".." in path.split(os.sep):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _worker_process_entry(entry, data, dirs, keep_intermediate, collect=False):
+    """Worker wrapper isolating the errors of a single paper.
+
+    Returns (entry, result, error, stage metrics or None)."""
+    metrics = PaperMetrics() if collect else None
+    try:
+        if data is None:
+            result = process_entry(entry, *dirs, metrics)
+        else:
+            result = process_entry_bytes(entry, data, *dirs, keep_intermediate, metrics)
+        return entry, result, None, metrics
+    except Exception as e:
+        return entry, None, str(e), metrics
+
+
+def _pool_process_entry(*args):
+    """Pool task, the records of the paper are written before it returns."""
+    try:
+        return _worker_process_entry(*args)
+    finally:
+        flush_log()
+
+
+def _pair_sources(entries, sources):
+    """Pair the entries with their archives in the order of the sources."""
+
+    # The sources come already paired with their entries
+    if entries is None:
+        yield from sources
+        return
+
+    if sources is None:
+        for entry in entries:
+            yield entry, None
+        return
+
+    # Look up the entries by the arXiv id of the streamed archives
+    lookup = {entry["arxiv_id"]: entry for entry in entries}
+    for arxiv_id, data in sources:
+        entry = lookup.pop(arxiv_id, None)
+        if entry is not None:
+            yield entry, data
+
+    # Entries without any archive in the sources
+    for entry in lookup.values():
+        yield entry, False
+
+
+def process_entries(
+    entries,
+    workers=1,
+    ordered=True,
+    archive_dir="papers/archives",
+    extracted_dir="papers/extracted",
+    sources_dir="papers/sources",
+    sources=None,
+    keep_intermediate=False,
+    start_method=None,
+    metrics=None,
+):
+    """Process the entries and yield (entry, result, error) tuples.
+
+    With more than one worker the papers are fanned out over a process pool.
+    A dead worker fails only its own paper, the pool is replaced.
+    Results are yielded in input order if `ordered`, otherwise as they finish.
+    If `sources` yields (arxiv_id, gzip bytes) pairs, the papers are processed
+    in memory in the order of the sources. If `entries` is None, `sources`
+    yields the (entry, gzip bytes or None) pairs itself. Use a `start_method`
+    other than fork if other threads are running while the pool starts.
+    The stage measurements of every paper are recorded into the `metrics`
+    of the run if given."""
+
+    dirs = (archive_dir, extracted_dir, sources_dir)
+    tasks = _pair_sources(entries, sources)
+    collect = metrics is not None
+
+    def finished(entry, result, error, paper_metrics):
+        """Record the stages of the paper and drop them from the result."""
+        if paper_metrics is not None:
+            metrics.record_paper(entry["arxiv_id"], paper_metrics)
+        return entry, result, error
+
+    def missing(entry):
+        """Result of an entry without any archive in the sources."""
+        return entry, None, f"No archive for '{entry['arxiv_id']}' in the bucket"
+
+    # Keep everything in this process
+    if workers <= 1:
+        for entry, data in tasks:
+            if data is False:
+                yield missing(entry)
+            else:
+                yield finished(
+                    *_worker_process_entry(
+                        entry, data, dirs, keep_intermediate, collect
+                    )
+                )
+        return
+
+    # Bound the number of papers in flight
+    max_pending = workers * 4
+
+    mp_context = multiprocessing.get_context(start_method) if start_method else None
+
+    def new_executor(size):
+        """Start a pool, the workers log the same way as this process."""
+        return ProcessPoolExecutor(
+            max_workers=size,
+            mp_context=mp_context,
+            initializer=configure_logging,
+            initargs=get_logging_config(),
+        )
+
+    def succeeded(future):
+        """Check if the result of the paper made it back from the pool."""
+        return future.done() and not future.cancelled() and future.exception() is None
+
+    executor = new_executor(workers)
+    # Papers run one at a time after a worker died, to find the culprit
+    isolating = False
+    try:
+        # Futures in submission order, each mapped to its (entry, data)
+        pending = collections.OrderedDict()
+        skipped = []
+
+        def submit(entry, data):
+            """Hand the paper over to the pool."""
+            try:
+                return executor.submit(
+                    _pool_process_entry, entry, data, dirs, keep_intermediate, collect
+                )
+            except BrokenProcessPool as e:
+                # Dealt with like the papers running when the pool broke
+                future = Future()
+                future.set_exception(e)
+                return future
+
+        def submit_next():
+            """Submit the next entry, return False if there are none left."""
+            for entry, data in tasks:
+                if data is False:
+                    skipped.append(entry)
+                    continue
+                pending[submit(entry, data)] = (entry, data)
+                return True
+            return False
+
+        def fill():
+            """Keep the pipeline full, unless the culprit is being isolated."""
+            nonlocal executor, isolating
+            if isolating:
+                if not all(future.done() for future in pending):
+                    return
+                # All the suspects are done, back to the full pool
+                executor.shutdown()
+                executor = new_executor(workers)
+                isolating = False
+            while len(pending) < max_pending and submit_next():
+                pass
+
+        def recover():
+            """Replace the pool broken by a worker killed e.g. by the system.
+
+            With a single worker the dead one was running the oldest paper
+            without a result, which fails. Otherwise nobody is blamed yet and
+            the papers without a result run again one at a time."""
+            nonlocal executor, isolating, pending
+            executor.shutdown(wait=True, cancel_futures=True)
+            if isolating:
+                culprit = next(f for f in pending if not succeeded(f))
+                entry, _ = pending.pop(culprit)
+                yield entry, None, "Worker process died, e.g. killed by the system"
+
+            executor = new_executor(1)
+            isolating = True
+            # Keep the input order and the results that made it back
+            restarted = collections.OrderedDict()
+            for future, (entry, data) in pending.items():
+                if not succeeded(future):
+                    future = submit(entry, data)
+                restarted[future] = (entry, data)
+            pending = restarted
+
+        fill()
+        while pending:
+            if ordered:
+                # Wait for the oldest paper to keep the input order
+                done = [next(iter(pending))]
+            else:
+                # Take whatever finished first
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if isinstance(future.exception(), BrokenProcessPool):
+                    yield from recover()
+                    # The other finished futures belong to the old pool
+                    break
+                entry, _ = pending.pop(future)
+                try:
+                    yield finished(*future.result())
+                except Exception as e:
+                    # The task could not be sent to the worker or back
+                    yield entry, None, str(e)
+            fill()
+
+        for entry in skipped:
+            yield missing(entry)
+
+    finally:
+        executor.shutdown()
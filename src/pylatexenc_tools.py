@@ -1,37 +1,68 @@
 import re
 import html
+import functools
 
 from pylatexenc.latex2text import LatexNodes2Text
 
 
+# Converter shared by all the calls, it keeps no state between conversions
+CONVERTER = LatexNodes2Text()
+
+# Characters and ligatures pylatexenc would change, anything else stays as is
+LATEX_PATTERN = re.compile(r"[\\$%&{}~`]|--|''")
+
+# Only short strings like titles and abstracts are memoized
+MEMO_MAX_LENGTH = 8192
+MEMO_SIZE = 16384
+
+
+# Braces, skipping the escaped characters like \{ or \\
+BRACE_PATTERN = re.compile(r"\\.|[{}]", re.DOTALL)
+
+# Run of '=' characters in the header separator
+EQUALS_PATTERN = re.compile(r"=+")
+
+# Commands removed together with the rest of their line
+COMMAND_LINE_PATTERN = re.compile(r"\\(?:input|include|def|newcommand)\b")
+
+
 def clean_pylatexenc(text):
     """Extract plain text using pylatexenc."""
 
-    # Extract plain text and ensure no html character issues
-    plain_text = html.unescape(LatexNodes2Text().latex_to_text(text))
+    # Repeated titles and abstracts are converted only once
+    if len(text) <= MEMO_MAX_LENGTH:
+        return _clean_pylatexenc_memo(text)
+
+    return _clean_pylatexenc(text)
+
+
+def _clean_pylatexenc(text):
+    """Extract plain text, skip pylatexenc if there is no LaTeX at all."""
+
+    if LATEX_PATTERN.search(text):
+        text = CONVERTER.latex_to_text(text)
+
+    # Ensure no html character issues
+    plain_text = html.unescape(text)
 
     return plain_text
 
 
+_clean_pylatexenc_memo = functools.lru_cache(maxsize=MEMO_SIZE)(_clean_pylatexenc)
+
+
 def preprocess_pylatexenc(tex_content):
     """Additional preprocessing before using pylatexenc"""
 
     # Remove all hyperlinks
-    tex_content = re.sub(r"\\href\{.*?\}\{(.*?)\}", r"\1", tex_content)
+    tex_content = remove_hyperlinks(tex_content)
 
     # Remove additional user-defined commands
-    tex_content = re.sub(
-        r"^\s*\\(input|include|def|newcommand)\b.*\n?",
-        "",
-        tex_content,
-        flags=re.MULTILINE,
-    )
+    tex_content = remove_command_lines(tex_content)
 
     # Remove any abstract environment
     tex_content = remove_abstract_commands(tex_content)
-    tex_content = re.sub(
-        r"\\begin\{abstract\}.*?\\end\{abstract\}", "", tex_content, flags=re.DOTALL
-    )
+    tex_content = remove_abstract_environments(tex_content)
 
     return tex_content
 
@@ -51,11 +82,16 @@ def postprocess_pylatexenc(plain_text):
 def remove_header(plain_text):
     """Remove the whole header with metadata."""
 
-    # Match a header pattern, at least 5 '=' characters
-    pattern = re.compile(r"^.*?={5,}\n+", re.MULTILINE | re.DOTALL)
-
-    # Remove the header
-    plain_text = re.sub(pattern, "", plain_text, count=1)
+    # Find the first run of at least 5 '=' characters ending a line
+    start = plain_text.find("=====")
+    while start != -1:
+        end = EQUALS_PATTERN.match(plain_text, start).end()
+        if plain_text.startswith("\n", end):
+            # Remove the header together with the empty lines after it
+            while plain_text.startswith("\n", end):
+                end += 1
+            return plain_text[end:]
+        start = plain_text.find("=====", end)
 
     return plain_text
 
@@ -75,30 +111,129 @@ def remove_whitespace(plain_text):
     return plain_text
 
 
-def remove_abstract_commands(tex_content):
+def match_braces(tex_content):
+    """Map the position of every opening brace to its closing brace.
+
+    Escaped braces are skipped, unbalanced braces are left out."""
+
+    pairs = {}
+    stack = []
+    for match in BRACE_PATTERN.finditer(tex_content):
+        brace = match.group()
+        if brace == "{":
+            stack.append(match.start())
+        elif brace == "}" and stack:
+            pairs[stack.pop()] = match.start()
+
+    return pairs
+
+
+def remove_hyperlinks(tex_content):
+    """Replace every \\href{url}{text} with its text, also nested in the text."""
+
+    if "\\href{" not in tex_content:
+        return tex_content
+
+    pairs = match_braces(tex_content)
+    cuts = []  # removed spans, the "\href{url}{" prefixes and closing braces
+    start = tex_content.find("\\href{")
+    while start != -1:
+        # Both arguments have to be balanced and directly adjacent
+        url_open = start + 5
+        url_close = pairs.get(url_open)
+        text_close = pairs.get(url_close + 1) if url_close is not None else None
+        if text_close is None:
+            start = tex_content.find("\\href{", url_open)
+            continue
+        cuts.append((start, url_close + 2))
+        cuts.append((text_close, text_close + 1))
+        # Links in the text are removed as well, the url is skipped
+        start = tex_content.find("\\href{", url_close + 2)
+
+    # Braces are nested, so the spans never overlap
+    cuts.sort()
+    result = []
+    pos = 0
+    for cut_start, cut_end in cuts:
+        result.append(tex_content[pos:cut_start])
+        pos = cut_end
+    result.append(tex_content[pos:])
+
+    return "".join(result)
+
+
+def remove_command_lines(tex_content):
+    """Remove the lines starting with \\input, \\include, \\def or \\newcommand.
+
+    Whitespace before the command is removed up to the first line start,
+    like with the r"^\\s*" regex, the rest of the line with its newline."""
+
     result = []
-    i = 0
-    while i < len(tex_content):
-        if tex_content[i : i + 9] == "\\abstract":
-            if tex_content[i + 9] != "{":
-                result.append(tex_content[i])
-                i += 1
+    pos = 0
+    for match in COMMAND_LINE_PATTERN.finditer(tex_content):
+        command = match.start()
+        if command < pos:
+            continue
+
+        # Walk back over the whitespace in front of the command
+        start = command
+        while start > pos and tex_content[start - 1].isspace():
+            start -= 1
+        # The removal begins at the first line start within that whitespace
+        if start > 0 and tex_content[start - 1] != "\n":
+            newline = tex_content.find("\n", start, command)
+            if newline == -1:
                 continue
+            start = newline + 1
+
+        # Remove until the end of the line, including the newline
+        end = tex_content.find("\n", command)
+        end = len(tex_content) if end == -1 else end + 1
+        result.append(tex_content[pos:start])
+        pos = end
+    result.append(tex_content[pos:])
+
+    return "".join(result)
 
-            # We've found \abstract{, now parse until matching closing }
-            brace_depth = 0
-            j = i + 9
-            while j < len(tex_content):
-                if tex_content[j] == "{":
-                    brace_depth += 1
-                elif tex_content[j] == "}":
-                    brace_depth -= 1
-                    if brace_depth == 0:
-                        break
-                j += 1
-            i = j + 1  # Skip past the closing }
-        else:
-            result.append(tex_content[i])
-            i += 1
+
+def remove_abstract_environments(tex_content):
+    """Remove every abstract environment."""
+
+    begin, end = "\\begin{abstract}", "\\end{abstract}"
+    result = []
+    pos = 0
+    start = tex_content.find(begin)
+    while start != -1:
+        stop = tex_content.find(end, start + len(begin))
+        if stop == -1:
+            break
+        result.append(tex_content[pos:start])
+        pos = stop + len(end)
+        start = tex_content.find(begin, pos)
+    result.append(tex_content[pos:])
+
+    return "".join(result)
+
+
+def remove_abstract_commands(tex_content):
+    """Remove every \\abstract{...} command with its balanced argument."""
+
+    if "\\abstract{" not in tex_content:
+        return tex_content
+
+    pairs = match_braces(tex_content)
+    result = []
+    pos = 0
+    start = tex_content.find("\\abstract{")
+    while start != -1:
+        close = pairs.get(start + 9)
+        if close is None:
+            # Unbalanced argument, keep the text as it is
+            start = tex_content.find("\\abstract{", start + 9)
+            continue
+        result.append(tex_content[pos:start])
+        pos = close + 1
+        start = tex_content.find("\\abstract{", pos)
+    result.append(tex_content[pos:])
 
     return "".join(result)
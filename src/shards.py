@@ -0,0 +1,170 @@
+import os
+import re
+import json
+
+from src.journal import (
+    repair_jsonl,
+)
+
+
+# Default upper bound of the size of a single shard
+SHARD_SIZE = 256 * 1024 * 1024
+
+# Name of the sidecar index in the shard directory
+INDEX_NAME = "index.jsonl"
+
+# Shard files, numbered within their partition
+SHARD_PATTERN = re.compile(r"^part-(\d+)\.jsonl$")
+
+# Year and month of new-style (2101.00001) and old-style (hep-th/9901001) ids
+NEW_ID_PATTERN = re.compile(r"^(\d{2})(\d{2})\.")
+OLD_ID_PATTERN = re.compile(r"/(\d{2})(\d{2})")
+
+
+def partition_key(entry, partition):
+    """Name of the partition of the entry: 'category', 'month' or None."""
+
+    if partition == "category":
+        return entry["categories"][0] if entry.get("categories") else "unknown"
+
+    if partition == "month":
+        arxiv_id = entry["arxiv_id"]
+        match = NEW_ID_PATTERN.match(arxiv_id)
+        if match:
+            return f"20{match.group(1)}-{match.group(2)}"
+        match = OLD_ID_PATTERN.search(arxiv_id)
+        if match:
+            century = "19" if int(match.group(1)) > 90 else "20"
+            return f"{century}{match.group(1)}-{match.group(2)}"
+        return "unknown"
+
+    return None
+
+
+def read_shard_index(shard_dir):
+    """Map the arXiv ids to the (shard, offset, length) of their entries."""
+
+    index = {}
+    index_path = os.path.join(shard_dir, INDEX_NAME)
+    if not os.path.exists(index_path):
+        return index
+
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                index[record["id"]] = (
+                    record["shard"],
+                    record["offset"],
+                    record["length"],
+                )
+
+    return index
+
+
+def lookup_entry(shard_dir, arxiv_id, index=None):
+    """Read a single entry with one seek, None if it is not in the shards."""
+
+    if index is None:
+        index = read_shard_index(shard_dir)
+    if arxiv_id not in index:
+        return None
+
+    shard, offset, length = index[arxiv_id]
+    with open(os.path.join(shard_dir, shard), "rb") as f:
+        f.seek(offset)
+        return json.loads(f.read(length))
+
+
+class ShardedJsonlSink:
+    """JSONL output rolled over into size-bounded shards.
+
+    Shards live in `shard_dir`, optionally in a subdirectory per partition,
+    and a sidecar index keeps the position of every entry. An existing
+    output is continued. `write` and `close` return the arXiv ids of the
+    papers they saved."""
+
+    def __init__(self, shard_dir, shard_size=SHARD_SIZE, partition=None):
+        self.shard_dir = shard_dir
+        self.shard_size = shard_size
+        self.partition = partition
+        os.makedirs(shard_dir, exist_ok=True)
+
+        # Only the indexed entries count, cut off anything written after them
+        index_path = os.path.join(shard_dir, INDEX_NAME)
+        repair_jsonl(index_path)
+        ends = {}
+        for shard, offset, length in read_shard_index(shard_dir).values():
+            ends[shard] = max(ends.get(shard, 0), offset + length + 1)
+        self._shards = {}  # partition -> [shard path, number, size]
+        for root, _, files in os.walk(shard_dir):
+            for name in files:
+                match = SHARD_PATTERN.match(name)
+                if not match:
+                    continue
+                shard = os.path.relpath(os.path.join(root, name), shard_dir)
+                size = ends.get(shard, 0)
+                with open(os.path.join(shard_dir, shard), "rb+") as f:
+                    f.truncate(size)
+                key = os.path.dirname(shard) or None
+                number = int(match.group(1))
+                if key not in self._shards or self._shards[key][1] < number:
+                    self._shards[key] = [shard, number, size]
+
+        self._index = open(index_path, "a", encoding="utf-8")
+        self._files = {}  # shard path -> open file
+
+    def _shard_for(self, key, length):
+        """Open shard of the partition with room for `length` more bytes."""
+
+        current = self._shards.get(key)
+        if current is None or (
+            current[2] > 0 and current[2] + length > self.shard_size
+        ):
+            # Roll over to the next shard of the partition
+            number = current[1] + 1 if current else 0
+            name = f"part-{number:05d}.jsonl"
+            shard = os.path.join(key, name) if key else name
+            if current and current[0] in self._files:
+                self._files.pop(current[0]).close()
+            current = self._shards[key] = [shard, number, 0]
+
+        shard = current[0]
+        if shard not in self._files:
+            path = os.path.join(self.shard_dir, shard)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._files[shard] = open(path, "ab")
+
+        return current
+
+    def write(self, entry):
+        """Append the entry to its shard and index it."""
+
+        line = json.dumps(entry).encode("utf-8")
+        current = self._shard_for(partition_key(entry, self.partition), len(line) + 1)
+        shard, _, offset = current
+
+        # The entry must be in the shard before the index points to it
+        f = self._files[shard]
+        f.write(line + b"\n")
+        f.flush()
+        current[2] += len(line) + 1
+
+        record = {
+            "id": entry["arxiv_id"],
+            "shard": shard,
+            "offset": offset,
+            "length": len(line),
+        }
+        self._index.write(json.dumps(record) + "\n")
+        self._index.flush()
+
+        return [entry["arxiv_id"]]
+
+    def close(self):
+        """Close the shards and the index, nothing is left to save."""
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        self._index.close()
+        return []
@@ -31,16 +31,10 @@ def merge_tex_files(tex_files, paper_path):
   tex_contents = {}
   for tex_file in tex_files:
     with open(os.path.join(paper_path, tex_file), 'r', encoding='utf-8') as f:
-      tex_contents[tex_file] = preprocess_tex_content(f.read())
+      tex_contents[tex_file] = f.read()
 
-  # Detect all the inclusions to build the connections graph
-  connections  = {}
-  for tex_file in tex_files:
-    connections[tex_file] = detect_inclusions(tex_contents[tex_file])
-
-  # Find the main .tex file and resolve the inclusions
-  main_file    = find_main_key(connections)
-  main_content = fix_inclusions(tex_contents, main_file)
+  # Resolve the inclusions
+  main_content = merge_tex_contents(tex_contents)
 
   # Create a temporary file to store the merged content
   merged_path = os.path.join(paper_path, 'merged.tex')
@@ -50,6 +44,31 @@ def merge_tex_files(tex_files, paper_path):
   return merged_path
 
 
+def merge_tex_contents(tex_contents):
+  '''Merge the contents of multiple .tex files into a single string.'''
+
+  # Preprocess the content of all .tex files
+  tex_contents = {
+    tex_file: preprocess_tex_content(content)
+    for tex_file, content in tex_contents.items()
+  }
+
+  # Parse the inclusions of every file once to build the connections graph
+  inclusions   = {}
+  for tex_file in tex_contents:
+    inclusions[tex_file] = resolve_inclusions(tex_file, tex_contents)
+  connections  = {
+    tex_file: [target for _, _, target in resolved]
+    for tex_file, resolved in inclusions.items()
+  }
+
+  # Find the main .tex file and resolve the inclusions
+  main_file    = find_main_key(connections)
+  main_content = fix_inclusions(tex_contents, inclusions, main_file)
+
+  return main_content
+
+
 def preprocess_tex_content(tex_content):
   '''Preprocess the tex file.'''
 
@@ -84,78 +103,56 @@ def normalize_tex(tex_content):
   return tex_content
 
 
+# Interesting tokens: an unescaped comment or the start of an inline verbatim
+COMMENT_SCANNER     = re.compile(r'(?<!\\)%|\\(?:verb|lstinline)\S')
+INLINE_VERB_PATTERN = re.compile(r'(\\(verb|lstinline)\S)(.*?)(?=\1)')
+
+
 def remove_comments_tex(tex_content):
   '''Preprocessing: remove all comments.'''
 
-  # Where % should be treated literally
-  VERBATIM = ['verbatim', 'lstlisting', 'minted']
-
-  # Patterns to match
-  begin_env_pattern   = re.compile(r'\\begin\{(\w+)\}')
-  end_env_pattern     = re.compile(r'\\end\{(\w+)\}')
-  inline_verb_pattern = re.compile(r'(\\(verb|lstinline)\S)(.*?)(?=\1)')
-  comment_pattern     = re.compile(r'(?<!\\)%')
-
-  # Initialize variables
-  i = 0
-  n = len(tex_content)
-  result    = []
-  env_stack = []  # to keep track of nested environments
-
-  # Iterate through the content character by character
-  while i < n:
-    char = tex_content[i]
-
-    # Check for the beginning of an environment
-    begin_match = begin_env_pattern.match(tex_content, i)
-    if begin_match:
-      env_name = begin_match.group(1)
-      if env_name in VERBATIM:
-        env_stack.append(env_name)  # Enter verbatim-like environment
-      result.append(tex_content[i:i + begin_match.end() - begin_match.start()])
-      i += begin_match.end() - begin_match.start()
-      continue
+  # Jump between the interesting tokens, copy everything in between at once.
+  # Environments do not change the outcome, comments in verbatim-like
+  # environments are removed as well.
+  result = []
+  pos    = 0  # start of the text not yet copied
+  scan   = 0  # where to look for the next token
 
-    # Check for the end of an environment
-    end_match = end_env_pattern.match(tex_content, i)
-    if end_match:
-      env_name = end_match.group(1)
-      if env_name in VERBATIM and env_stack:
-        env_stack.pop()             # Exit verbatim-like environment
-      result.append(tex_content[i:i + end_match.end() - end_match.start()])
-      i += end_match.end() - end_match.start()
-      continue
+  while True:
+    token = COMMENT_SCANNER.search(tex_content, scan)
+    if not token:
+      result.append(tex_content[pos:])
+      break
+    start = token.start()
 
     # Check for inline verbatim
-    verb_match = inline_verb_pattern.match(tex_content, i)
-    if verb_match:
-      # Extract verbatim content
-      prefix    = verb_match.group(1)
-      content   = verb_match.group(3)
-      delim     = prefix[-1]
-      result.append(f"{prefix}{content}{delim}")
-      i += len(prefix) + len(content) + len(delim)
-      continue
-
-    # Check for comments
-    comment_pos = comment_pattern.match(tex_content, i)
-    if comment_pos:
-      # Remove any trailing whitespace before `%`
-      while result and result[-1].isspace():
-        result.pop()
-
-      # If the last remaining character is '\n', remove it
-      if result and result[-1] == '\n':
-        result.pop()
-
-      # Skip until the end of the line
-      while i < n and tex_content[i] != '\n':
-        i += 1
+    if tex_content[start] == '\\':
+      verb_match = INLINE_VERB_PATTERN.match(tex_content, start)
+      if verb_match:
+        # Keep the verbatim content, the delimiter replaces the next backslash
+        prefix  = verb_match.group(1)
+        content = verb_match.group(3)
+        result.append(tex_content[pos:start])
+        result.append(f"{prefix}{content}{prefix[-1]}")
+        pos = scan = start + len(prefix) + len(content) + 1
+      else:
+        scan = start + 1
       continue
 
-    # Normal content
-    result.append(char)
-    i += 1
+    # Comment: remove any trailing whitespace before `%`
+    result.append(tex_content[pos:start])
+    while result:
+      stripped = result[-1].rstrip()
+      if stripped:
+        result[-1] = stripped
+        break
+      result.pop()
+
+    # Skip until the end of the line
+    pos = tex_content.find('\n', start)
+    if pos == -1:
+      break
+    scan = pos
 
   # Join the result and remove and trailing empty lines in front
   tex_content = ''.join(result)
@@ -164,74 +161,83 @@ def remove_comments_tex(tex_content):
   return tex_content
 
 
+# Include and input statements, the plain TeX form has no braces
+INCLUSION_PATTERN = re.compile(
+  r'\\(include|input)\s*'             # Match \include or \input
+  r'(?:\[\s*([^\]]*?)\s*\])?\s*'      # Optional [options] (group 2)
+  r'\{\s*([^}]*)\s*\}'                # Mandatory {filename} (group 3)
+  r'|\\input\s+([^\s{}\[\]\\%]+)',    # Or \input filename (group 4)
+  re.MULTILINE | re.DOTALL
+)
+
+
 def detect_inclusions(tex_content):
   '''Detect the include and input statements in the tex content.
-     Return a list of files to which they lead.'''
-
-  # Patterns to detect include and input statements
-  include_input_pattern = re.compile(
-    r'\\(include|input)\s*'             # Match \include or \input
-    r'(?:\[\s*([^\]]*?)\s*\])?\s*'      # Optional [options] (group 2)
-    r'\{\s*([^}]*)\s*\}',               # Mandatory {filename} (group 3)
-    re.MULTILINE | re.DOTALL
-  )
+     Return a list of (start, end, filename, braced) tuples.'''
 
   # Find all matches
   matches = []
-  for match in include_input_pattern.finditer(tex_content):
-    filename = match.group(3).strip()
+  for match in INCLUSION_PATTERN.finditer(tex_content):
+    braced   = match.group(3) is not None
+    filename = (match.group(3) if braced else match.group(4)).strip()
     if not filename.endswith('.tex') and not filename.endswith('.sty'):
       filename += '.tex'
     if filename.endswith('.tex'):
-      matches.append(filename)
+      matches.append((match.start(), match.end(), filename, braced))
 
   return matches
 
 
-def fix_inclusions(tex_contents, main_file):
-  '''Detect the include and input statements in the main tex file.
-     Resolve the commands by pasting the appropriate file.'''
+def resolve_inclusions(tex_file, tex_contents):
+  '''Match the inclusions of a .tex file with the available files.
+     Return a list of (start, end, included file) tuples.'''
 
-  # Prepare the main content
-  main_content = tex_contents.pop(main_file)
+  base_dir = os.path.dirname(tex_file)
 
-  # Patterns to detect include and input statements
-  include_input_pattern = re.compile(
-    r'\\(include|input)\s*'             # Match \include or \input
-    r'(?:\[\s*([^\]]*?)\s*\])?\s*'      # Optional [options] (group 2)
-    r'\{\s*([^}]*)\s*\}',               # Mandatory {filename} (group 3)
-    re.MULTILINE | re.DOTALL
-  )
+  resolved = []
+  for start, end, filename, braced in detect_inclusions(tex_contents[tex_file]):
+    # Paths are relative to the top directory or to the including file
+    candidates = [os.path.normpath(filename)]
+    if base_dir:
+      candidates.append(os.path.normpath(os.path.join(base_dir, filename)))
+    target = next((c for c in candidates if c in tex_contents), None)
 
-  # Replace matches
-  while True:
-    updated     = False
-    new_content = []
-    last_pos    = 0
+    if target is None:
+      # Plain TeX inputs usually load macros installed system-wide, e.g. epsf
+      if not braced:
+        continue
+      # Leave it to the graph tools to report the missing file
+      target = candidates[0]
+    resolved.append((start, end, target))
 
-    for match in include_input_pattern.finditer(main_content):
-      # Get the file to include
-      filename = match.group(3).strip()
-      if not filename.endswith('.tex') and not filename.endswith('.sty'):
-        filename += '.tex'
-      if filename.endswith('.tex'):
+  return resolved
 
-        # Append content before the match
-        new_content.append(main_content[last_pos:match.start()])
 
-        # Insert the included file
-        new_content.append(tex_contents.pop(filename))
+def fix_inclusions(tex_contents, inclusions, main_file):
+  '''Resolve the include and input statements starting from the main
+     tex file by pasting the appropriate files in a single pass.'''
 
-        # Move forward
-        last_pos = match.end()
-        updated = True
+  # Walk the inclusion tree depth-first, without recursion
+  new_content = []
+  stack       = [(main_file, 0, 0)]  # file, next inclusion, copied up to
 
-    # Append the remaining content
-    new_content.append(main_content[last_pos:])
-    main_content = ''.join(new_content)
+  while stack:
+    tex_file, index, last_pos = stack.pop()
+    content = tex_contents[tex_file]
 
-    # Stop if no more replacements were made
-    if not updated:
-      break
+    if index < len(inclusions[tex_file]):
+      start, end, target = inclusions[tex_file][index]
+
+      # Append content before the match
+      new_content.append(content[last_pos:start])
+
+      # Continue after the match once the included file is done
+      stack.append((tex_file, index + 1, end))
+      stack.append((target, 0, 0))
+    else:
+      # Append the remaining content
+      new_content.append(content[last_pos:])
+
+  main_content = ''.join(new_content)
 
   return main_content
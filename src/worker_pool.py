@@ -0,0 +1,101 @@
+import queue
+import multiprocessing
+
+
+class WorkerTimeoutError(Exception):
+    """Exception raised if a task exceeds its time limit."""
+
+    pass
+
+
+def _worker_loop(conn):
+    """Long-lived worker process executing tasks sent through the pipe."""
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        # Shutdown request
+        if task is None:
+            break
+
+        func, args = task
+        try:
+            conn.send(("ok", func(*args)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class WorkerPool:
+    """Pool of warm worker processes with a per-task timeout.
+
+    A task that exceeds its timeout gets its worker killed and replaced,
+    the rest of the pool keeps running."""
+
+    def __init__(self, size=1):
+        self._size = size
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        """Start a new worker process connected with a pipe."""
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_worker_loop, args=(child_conn,), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _replace(self, worker):
+        """Kill the worker and return a fresh one in its place."""
+        process, conn = worker
+        if process.is_alive():
+            process.kill()
+        process.join()
+        conn.close()
+        return self._spawn()
+
+    def run(self, func, *args, timeout=None):
+        """Run `func(*args)` in one of the workers and return the result."""
+
+        worker = self._idle.get()
+        try:
+            # The worker might have died in the meantime
+            if not worker[0].is_alive():
+                worker = self._replace(worker)
+
+            process, conn = worker
+            conn.send((func, args))
+
+            # Wait for the result, a hung worker is killed and replaced
+            if not conn.poll(timeout):
+                worker = self._replace(worker)
+                raise WorkerTimeoutError(f"Task exceeded the {timeout}s time limit")
+
+            status, value = conn.recv()
+        except (EOFError, OSError) as e:
+            worker = self._replace(worker)
+            raise RuntimeError(f"Worker process died: {e}")
+        finally:
+            self._idle.put(worker)
+
+        if status == "error":
+            raise RuntimeError(value)
+
+        return value
+
+    def close(self):
+        """Shut down all the workers."""
+        for _ in range(self._size):
+            process, conn = self._idle.get()
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            process.join(1)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            conn.close()
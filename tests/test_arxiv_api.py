@@ -0,0 +1,212 @@
+import pytest
+
+from src import arxiv_api, http_cache
+from src.entries import (
+    new_entry,
+)
+from src.http_cache import (
+    ARXIV_EXPORT_URL,
+    HttpResponse,
+    ResponseCache,
+    configure_http_cache,
+    request_key,
+)
+from src.arxiv_api import (
+    match_buckets_metadata_json,
+    match_paper_metadata_json,
+    resolve_leftover_metadata,
+)
+
+
+def make_record(arxiv_id, **fields):
+    record = {
+        "id": arxiv_id,
+        "title": "Spin  chains",
+        "authors": "A. Author, B. Author",
+        "authors_parsed": [["Author", "A.", ""], ["Author", "B.", ""]],
+        "abstract": "We study spin chains.",
+        "categories": "hep-th math-ph",
+        "journal-ref": None,
+        "comments": "10 pages",
+        "license": None,
+    }
+    record.update(fields)
+    return record
+
+
+def test_single_pass_matches_every_bucket():
+    buckets = {
+        "0001_001": {"hep-th/0001001", "hep-th/0001002"},
+        "0001_002": {"hep-th/0001002", "hep-th/0001003"},
+    }
+    records = [
+        make_record("hep-th/0001002"),
+        make_record("hep-th/9912001"),
+        make_record("hep-th/0001001", title="Gauge theories"),
+    ]
+
+    entries = match_buckets_metadata_json(buckets, records)
+
+    assert [entry["arxiv_id"] for entry in entries["0001_001"]] == [
+        "hep-th/0001002",
+        "hep-th/0001001",
+    ]
+    assert [entry["arxiv_id"] for entry in entries["0001_002"]] == ["hep-th/0001002"]
+    # The matched papers leave their buckets
+    assert buckets == {"0001_001": set(), "0001_002": {"hep-th/0001003"}}
+
+    # Every bucket gets its own copy of a shared paper
+    assert entries["0001_001"][0] is not entries["0001_002"][0]
+    assert entries["0001_001"][0]["title"] == "Spin chains"
+    assert entries["0001_001"][0]["authors"] == ["A. Author", "B. Author"]
+    assert entries["0001_001"][0]["categories"] == ["hep-th", "math-ph"]
+
+
+def test_incomplete_record_leaves_the_paper_open():
+    papers = {"hep-th/0001001"}
+    records = [
+        make_record("hep-th/0001001", abstract=""),
+        make_record("hep-th/0001001", comments="Revised"),
+    ]
+
+    entries = match_paper_metadata_json(papers, records)
+
+    assert len(entries) == 1
+    assert entries[0]["comments"] == "Revised"
+    assert papers == set()
+
+
+def test_parallel_normalization_keeps_the_order(monkeypatch):
+    monkeypatch.setattr(arxiv_api, "NORMALIZE_BATCH_SIZE", 3)
+    records = [make_record(f"0704.{i:04d}", title=f"Paper  {i}") for i in range(20)]
+    records[5]["abstract"] = ""
+
+    def match(workers):
+        papers = {f"0704.{i:04d}" for i in range(0, 20, 2)}
+        entries = match_paper_metadata_json(
+            papers, records, workers=workers, start_method="fork"
+        )
+        return entries, papers
+
+    sequential = match(1)
+    parallel = match(3)
+
+    assert parallel == sequential
+    entries, left = parallel
+    assert [entry["title"] for entry in entries[:2]] == ["Paper 0", "Paper 2"]
+    assert len(entries) == 10
+    assert left == set()
+
+    # The incomplete record is never matched
+    papers = {"0704.0005"}
+    assert match_paper_metadata_json(papers, records, 3, "fork") == []
+    assert papers == {"0704.0005"}
+
+
+def feed_entry(arxiv_id, title):
+    return f"""
+  <entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v2</id>
+    <title>{title}</title>
+    <summary>We study spin chains.</summary>
+    <author><name>A. Author</name></author>
+    <category term="hep-th" scheme="http://arxiv.org/schemas/atom"/>
+    <arxiv:comment xmlns:arxiv="http://arxiv.org/schemas/atom">10 pages</arxiv:comment>
+  </entry>"""
+
+
+def feed(*entries):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom">'
+        + "".join(entries)
+        + "</feed>"
+    ).encode("utf-8")
+
+
+OAI_RECORD = b"""<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <GetRecord><record><metadata>
+    <arXiv xmlns="http://arxiv.org/OAI/arXiv/">
+      <title>Lattice gauge theories</title>
+      <authors>
+        <author><keyname>Author</keyname><forenames>C.</forenames></author>
+      </authors>
+      <categories>hep-lat</categories>
+      <abstract>We study lattices.</abstract>
+    </arXiv>
+  </metadata></record></GetRecord>
+</OAI-PMH>"""
+
+
+@pytest.fixture
+def replay(tmp_path, monkeypatch):
+    """Serve the stored responses only, every other request fails."""
+    monkeypatch.setattr(http_cache, "_cache", None)
+    monkeypatch.setattr(http_cache, "_cache_mode", "off")
+    configure_http_cache("replay", str(tmp_path))
+    cache = ResponseCache(str(tmp_path))
+
+    def store(path, params, content):
+        key = request_key(f"{ARXIV_EXPORT_URL}{path}", params)
+        cache.store(key, HttpResponse(200, content, {"Content-Type": "text/xml"}))
+
+    return store
+
+
+def test_leftovers_are_resolved_in_batches(replay):
+    papers = [new_entry(f"0704.000{i}") for i in range(1, 4)]
+    replay(
+        "/api/query",
+        {"id_list": "0704.0001,0704.0002", "max_results": 2},
+        feed(feed_entry("0704.0002", "Second"), feed_entry("0704.0001", "First")),
+    )
+    # The last paper is missing from its batch, it falls back to OAI-PMH
+    replay("/api/query", {"id_list": "0704.0003", "max_results": 1}, feed())
+    replay(
+        "/oai2",
+        {
+            "verb": "GetRecord",
+            "metadataPrefix": "arXiv",
+            "identifier": "oai:arXiv.org:0704.0003",
+        },
+        OAI_RECORD,
+    )
+
+    order = []
+    resolved = resolve_leftover_metadata(
+        papers,
+        batch_size=2,
+        on_resolved=lambda paper: order.append(paper["arxiv_id"]),
+    )
+
+    assert order == ["0704.0001", "0704.0002", "0704.0003"]
+    assert [paper["arxiv_id"] for paper in resolved] == order
+    assert [paper["title"] for paper in papers] == [
+        "First",
+        "Second",
+        "Lattice gauge theories",
+    ]
+    assert papers[0]["authors"] == ["A. Author"]
+    assert papers[0]["categories"] == ["hep-th"]
+    assert papers[0]["comments"] == "10 pages"
+    assert papers[2]["authors"] == ["C. Author"]
+
+
+def test_failed_batch_falls_back_to_single_requests(replay):
+    papers = [new_entry("0704.0001"), new_entry("0704.0002")]
+    replay(
+        "/oai2",
+        {
+            "verb": "GetRecord",
+            "metadataPrefix": "arXiv",
+            "identifier": "oai:arXiv.org:0704.0002",
+        },
+        OAI_RECORD,
+    )
+
+    # Nothing recorded for the batch nor for the first paper
+    resolved = resolve_leftover_metadata(papers, batch_size=100)
+
+    assert [paper["arxiv_id"] for paper in resolved] == ["0704.0002"]
+    assert papers[0]["title"] is None
@@ -0,0 +1,38 @@
+import threading
+
+from src.background import (
+    MetadataFetcher,
+)
+
+
+def test_entries_arrive_while_resolving():
+    release = threading.Event()
+
+    def resolve(on_resolved):
+        on_resolved({"arxiv_id": "0704.0001"})
+        # The leftovers are still waiting on the network
+        release.wait(5)
+        on_resolved({"arxiv_id": "0704.0002"})
+
+    fetcher = MetadataFetcher(resolve)
+    fetcher.start()
+    entries = iter(fetcher)
+
+    assert next(entries)["arxiv_id"] == "0704.0001"
+    release.set()
+    assert [entry["arxiv_id"] for entry in entries] == ["0704.0002"]
+    assert fetcher.count == 2
+    assert fetcher.error is None
+
+
+def test_error_is_kept_after_the_resolved_entries():
+    def resolve(on_resolved):
+        on_resolved({"arxiv_id": "0704.0001"})
+        raise RuntimeError("HTTP response: 503")
+
+    fetcher = MetadataFetcher(resolve)
+    fetcher.start()
+
+    assert [entry["arxiv_id"] for entry in fetcher] == ["0704.0001"]
+    fetcher.join()
+    assert str(fetcher.error) == "HTTP response: 503"
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from amazon_s3 import bucket_access
+from amazon_s3.bucket_access import (
+    BUCKET,
+    DownloadError,
+    get_s3_client,
+    download_object,
+)
+from amazon_s3.s3_stand_in import (
+    make_handler,
+)
+
+
+KEY = "src/arXiv_src_0001_001.tar"
+PART_SIZE = 1024
+CONTENT = os.urandom(5 * PART_SIZE + 100)
+
+
+class RecordingClient:
+    """Wrap the S3 client, remember the requested ranges and optionally
+    corrupt the received bytes."""
+
+    def __init__(self, s3, corrupt=False):
+        self.s3 = s3
+        self.corrupt = corrupt
+        self.ranges = []
+
+    def head_object(self, **kwargs):
+        return self.s3.head_object(**kwargs)
+
+    def get_object(self, **kwargs):
+        self.ranges.append(kwargs["Range"])
+        response = self.s3.get_object(**kwargs)
+        if self.corrupt:
+            data = bytes(b ^ 0xFF for b in response["Body"].read())
+            response["Body"] = CorruptedBody(data)
+        return response
+
+
+class CorruptedBody:
+    def __init__(self, data):
+        self.data = data
+
+    def iter_chunks(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i : i + chunk_size]
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    root = tmp_path / "s3root"
+    (root / BUCKET / "src").mkdir(parents=True)
+    (root / BUCKET / KEY).write_bytes(CONTENT)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setenv("AWS_ENDPOINT_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("AWS_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_SECRET_KEY", "test")
+    monkeypatch.setattr(bucket_access, "_s3_clients", {})
+    try:
+        yield get_s3_client()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_clients_are_cached_per_pool_size(s3):
+    assert get_s3_client() is s3
+    larger = get_s3_client(64)
+    assert larger is not s3
+    assert larger.meta.config.max_pool_connections == 64
+    assert get_s3_client(64) is larger
+
+
+def test_download_in_ranged_parts(s3, tmp_path):
+    client = RecordingClient(s3)
+    local_file = str(tmp_path / "files" / "arXiv_src_0001_001.tar")
+
+    download_object(client, KEY, local_file, part_size=PART_SIZE, workers=3)
+
+    with open(local_file, "rb") as f:
+        assert f.read() == CONTENT
+    assert sorted(client.ranges) == sorted(
+        f"bytes={start}-{min(start + PART_SIZE, len(CONTENT)) - 1}"
+        for start in range(0, len(CONTENT), PART_SIZE)
+    )
+    assert not os.path.exists(local_file + ".part")
+    assert not os.path.exists(local_file + ".progress.json")
+
+
+def test_resume_downloads_only_the_missing_parts(s3, tmp_path):
+    local_file = str(tmp_path / "arXiv_src_0001_001.tar")
+
+    # An interrupted download finished the first two parts
+    with open(local_file + ".part", "wb") as f:
+        f.write(CONTENT[: 2 * PART_SIZE])
+    with open(local_file + ".progress.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "etag": hashlib.md5(CONTENT).hexdigest(),
+                "size": len(CONTENT),
+                "part_size": PART_SIZE,
+                "done": [0, 1],
+            },
+            f,
+        )
+
+    client = RecordingClient(s3)
+    download_object(client, KEY, local_file, part_size=PART_SIZE, workers=2)
+
+    with open(local_file, "rb") as f:
+        assert f.read() == CONTENT
+    assert len(client.ranges) == 4
+    assert f"bytes=0-{PART_SIZE - 1}" not in client.ranges
+
+
+def test_etag_mismatch_starts_from_scratch(s3, tmp_path):
+    local_file = str(tmp_path / "arXiv_src_0001_001.tar")
+
+    client = RecordingClient(s3, corrupt=True)
+    with pytest.raises(DownloadError):
+        download_object(client, KEY, local_file, part_size=PART_SIZE)
+
+    assert not os.path.exists(local_file)
+    assert not os.path.exists(local_file + ".part")
+    assert not os.path.exists(local_file + ".progress.json")
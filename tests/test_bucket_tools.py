@@ -0,0 +1,182 @@
+import io
+import os
+import gzip
+import tarfile
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from amazon_s3 import bucket_access
+from amazon_s3.bucket_access import (
+    BUCKET,
+    get_s3_client,
+)
+from amazon_s3.s3_stand_in import (
+    make_handler,
+)
+from src import bucket_tools
+from src.bucket_tools import (
+    paper_id_from_member,
+    list_bucket_archive,
+    iter_bucket_archive,
+    iter_s3_bucket_archive,
+)
+from src.arxiv_api import (
+    extract_source_bytes,
+    merge_source_tex,
+)
+from src.pipeline import (
+    process_entry_bytes,
+)
+
+
+BUCKET_NAME = "arXiv_src_0001_001.tar"
+
+
+def make_tar(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def make_paper(files):
+    """Gzipped source tarball of a single paper."""
+    return gzip.compress(make_tar(files))
+
+
+PAPERS = {
+    "0001/hep-th0001001.gz": make_paper(
+        {
+            "main.tex": b"\\documentclass{article}\n\\begin{document}\n"
+            b"\\input{sections/intro}\n\\end{document}\n",
+            "sections/intro.tex": b"Spin chains are integrable.\n",
+        }
+    ),
+    "0001/hep-th0001002.gz": gzip.compress(b"Gauge theories on the lattice.\n"),
+    "0001/hep-th0001003.pdf": b"%PDF-1.4\n",
+}
+
+
+@pytest.fixture
+def bucket_dir(tmp_path):
+    with open(tmp_path / BUCKET_NAME, "wb") as f:
+        f.write(make_tar(PAPERS))
+    return str(tmp_path)
+
+
+def test_paper_id_from_member():
+    assert paper_id_from_member("0001/hep-th0001001.gz") == "hep-th/0001001"
+    assert paper_id_from_member("1501/1501.00001.gz") == "1501.00001"
+
+
+def test_list_and_stream_the_bucket(bucket_dir):
+    assert list_bucket_archive(BUCKET_NAME, bucket_dir) == [
+        "hep-th/0001001",
+        "hep-th/0001002",
+    ]
+    assert dict(iter_bucket_archive(BUCKET_NAME, bucket_dir)) == {
+        "hep-th/0001001": PAPERS["0001/hep-th0001001.gz"],
+        "hep-th/0001002": PAPERS["0001/hep-th0001002.gz"],
+    }
+
+
+def test_sources_are_merged_in_memory():
+    files = extract_source_bytes("hep-th0001001.gz", PAPERS["0001/hep-th0001001.gz"])
+    assert set(files) == {"main.tex", os.path.join("sections", "intro.tex")}
+
+    tex_content = merge_source_tex("hep-th0001001", files)
+    assert "Spin chains are integrable." in tex_content
+    assert "\\input" not in tex_content
+
+
+def test_stream_processing_writes_no_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dirs = ("archives", "extracted", "sources")
+    entry = {"arxiv_id": "hep-th/0001001", "safe_id": "hep-th0001001"}
+
+    result = process_entry_bytes(entry, PAPERS["0001/hep-th0001001.gz"], *dirs)
+
+    assert "Spin chains are integrable." in result["content"]
+    assert "safe_id" not in result
+    assert not any(os.path.exists(path) for path in dirs)
+
+
+def test_intermediate_files_are_kept_on_request(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dirs = ("archives", "extracted", "sources")
+    entry = {"arxiv_id": "hep-th/0001002", "safe_id": "hep-th0001002"}
+
+    process_entry_bytes(
+        entry, PAPERS["0001/hep-th0001002.gz"], *dirs, keep_intermediate=True
+    )
+
+    assert os.path.exists(os.path.join("archives", "hep-th0001002.gz"))
+    assert os.path.exists(os.path.join("extracted", "hep-th0001002", "source.tex"))
+    assert os.path.exists(os.path.join("sources", "hep-th0001002.tex"))
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    """S3 stand-in serving the bucket tarball."""
+    root = tmp_path / "s3root"
+    (root / BUCKET / "src").mkdir(parents=True)
+    (root / BUCKET / "src" / BUCKET_NAME).write_bytes(make_tar(PAPERS))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv("AWS_ENDPOINT_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("AWS_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_SECRET_KEY", "test")
+    monkeypatch.setattr(bucket_access, "_s3_clients", {})
+    try:
+        yield get_s3_client()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class LongerObjectClient:
+    """S3 client announcing more bytes than the object stream holds."""
+
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def get_object(self, **kwargs):
+        response = self.s3.get_object(**kwargs)
+        response["ContentLength"] += 512
+        return response
+
+
+def test_stream_from_s3_keeps_the_tarball(s3, tmp_path):
+    files_dir = str(tmp_path / "files")
+
+    papers = dict(iter_s3_bucket_archive(BUCKET_NAME, files_dir, keep_tarball=True))
+
+    assert papers == {
+        "hep-th/0001001": PAPERS["0001/hep-th0001001.gz"],
+        "hep-th/0001002": PAPERS["0001/hep-th0001002.gz"],
+    }
+    with open(os.path.join(files_dir, BUCKET_NAME), "rb") as f:
+        assert f.read() == make_tar(PAPERS)
+    assert not os.path.exists(os.path.join(files_dir, BUCKET_NAME + ".part"))
+
+
+def test_stream_from_s3_without_a_copy(s3, tmp_path):
+    files_dir = str(tmp_path / "files")
+    assert len(list(iter_s3_bucket_archive(BUCKET_NAME, files_dir))) == 2
+    assert not os.path.exists(files_dir)
+
+
+def test_incomplete_copy_is_not_kept(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(bucket_tools, "get_s3_client", lambda: LongerObjectClient(s3))
+    files_dir = str(tmp_path / "files")
+
+    with pytest.raises(RuntimeError, match="Incomplete copy"):
+        list(iter_s3_bucket_archive(BUCKET_NAME, files_dir, keep_tarball=True))
+    assert not os.path.exists(os.path.join(files_dir, BUCKET_NAME))
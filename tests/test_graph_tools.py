@@ -0,0 +1,45 @@
+import pytest
+
+from src.graph_tools import (
+    GraphError,
+    topological_order,
+    has_cycle,
+    find_main_key,
+)
+
+
+def test_topological_order():
+    graph = {"main": ["a", "b"], "a": ["c"], "b": ["c"], "c": []}
+    order = topological_order(graph)
+
+    assert sorted(order) == ["a", "b", "c", "main"]
+    for node, children in graph.items():
+        for child in children:
+            assert order.index(node) < order.index(child)
+
+
+def test_cycles():
+    assert not has_cycle({"main": ["a"], "a": []})
+    assert has_cycle({"main": ["a"], "a": ["b"], "b": ["a"]})
+    assert has_cycle({"a": ["a"]})
+    # The nodes behind a cycle are never ordered
+    assert topological_order({"a": ["b"], "b": ["a", "c"], "c": []}) == []
+
+
+def test_long_chain_has_no_recursion_limit():
+    graph = {f"{i}.tex": [f"{i + 1}.tex"] for i in range(5000)}
+    graph["5000.tex"] = []
+    assert find_main_key(graph) == "0.tex"
+
+
+@pytest.mark.parametrize(
+    "graph, message",
+    [
+        ({"main": ["missing"]}, "Missing tex files"),
+        ({"main": ["a"], "a": ["main"]}, "cycle"),
+        ({"main": [], "other": []}, "Multiple potential main"),
+    ],
+)
+def test_ambiguous_structures(graph, message):
+    with pytest.raises(GraphError, match=message):
+        find_main_key(graph)
@@ -0,0 +1,73 @@
+import io
+import gzip
+import tarfile
+
+from src.gzip_tools import (
+    sniff_format,
+    unpack_gzip,
+    extract_gzip_bytes,
+    get_original_filename_from_gzip_bytes,
+)
+
+
+def make_tar(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def make_gzip(content, filename=None):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(filename=filename or "", mode="wb", fileobj=buffer) as f:
+        f.write(content)
+    return buffer.getvalue()
+
+
+def test_sniff_format():
+    assert sniff_format(gzip.compress(b"data")) == "gzip"
+    assert sniff_format(make_tar({"main.tex": b"\\section{A}"})) == "tar"
+    assert sniff_format(b"%PDF-1.4\n") == "pdf"
+    assert sniff_format(b"%!PS-Adobe-2.0\n") == "postscript"
+    assert sniff_format(b"\\documentclass{article}") == "tex"
+    assert sniff_format(b"\x00\x01\x02") is None
+    assert sniff_format(b"") is None
+
+
+def test_original_filename_from_header():
+    data = make_gzip(b"\\section{A}", filename="/tmp/paper.tex")
+    assert get_original_filename_from_gzip_bytes(data) == "paper.tex"
+    assert get_original_filename_from_gzip_bytes(gzip.compress(b"A")) is None
+    assert get_original_filename_from_gzip_bytes(b"\x1f\x8b") is None
+
+
+def test_unpack_tarball():
+    tar = make_tar({"main.tex": b"\\input{sec}", "sub/sec.tex": b"\\section{A}"})
+    files = unpack_gzip(gzip.compress(tar))
+    assert files == {"main.tex": b"\\input{sec}", "sub/sec.tex": b"\\section{A}"}
+
+
+def test_unpack_single_tex_file():
+    files = unpack_gzip(make_gzip(b"\\section{A}", filename="paper.tex"))
+    assert files == {"paper.tex": b"\\section{A}"}
+
+    files = unpack_gzip(gzip.compress(b"\\section{A}"))
+    assert files == {"source.tex": b"\\section{A}"}
+
+
+def test_non_tex_payloads_are_not_stored_as_tex():
+    files = unpack_gzip(gzip.compress(b"%PDF-1.4\n\xff\xfe"))
+    assert list(files) == ["source.pdf"]
+
+    files = unpack_gzip(make_gzip(b"%!PS-Adobe-2.0\n", filename="paper.tex"))
+    assert list(files) == ["paper.ps"]
+
+    files = unpack_gzip(gzip.compress(b"\x00\x01\x02"))
+    assert list(files) == ["source.bin"]
+
+
+def test_corrupted_archive():
+    assert extract_gzip_bytes("0001.0001.gz", b"\x1f\x8b\x08\x00broken") is None
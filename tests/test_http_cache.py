@@ -0,0 +1,138 @@
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from src import http_cache
+from src.http_cache import (
+    CacheMissError,
+    HttpResponse,
+    RateLimiter,
+    ResponseCache,
+    configure_http_cache,
+    http_get,
+    request_key,
+)
+from src.arxiv_stand_in import (
+    make_handler,
+)
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    """Answer every request with its path, unknown paths with a 404."""
+
+    requests = []
+
+    def do_GET(self):
+        CountingHandler.requests.append(self.path)
+        status = 404 if self.path.startswith("/missing") else 200
+        body = self.path.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def server():
+    CountingHandler.requests = []
+    server = start_server(CountingHandler)
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def cache_off(monkeypatch):
+    # Every test starts and ends with the cache turned off
+    monkeypatch.setattr(http_cache, "_cache", None)
+    monkeypatch.setattr(http_cache, "_cache_mode", "off")
+
+
+def test_request_key_ignores_host_and_parameter_order():
+    assert request_key(
+        "http://export.arxiv.org/api/query", {"id_list": "a", "max_results": 1}
+    ) == request_key("http://127.0.0.1:8080/api/query?max_results=1&id_list=a")
+
+
+def test_identical_bodies_share_the_object(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    response = HttpResponse(200, b"<feed/>", {"Content-Type": "text/xml"})
+    cache.store("/api/query?id_list=a", response)
+    cache.store("/api/query?id_list=b", response)
+
+    objects = [path for path in (tmp_path / "objects").rglob("*") if path.is_file()]
+    assert len(objects) == 1
+    loaded = cache.load("/api/query?id_list=b")
+    assert loaded.content == b"<feed/>"
+    assert loaded.headers == {"Content-Type": "text/xml"}
+    assert loaded.from_cache
+    assert cache.load("/api/query?id_list=c") is None
+
+
+def test_record_then_replay(server, tmp_path):
+    configure_http_cache("record", str(tmp_path))
+    first = http_get(f"{server}/oai", {"verb": "ListRecords"})
+    second = http_get(f"{server}/oai", {"verb": "ListRecords"})
+    assert not first.from_cache and second.from_cache
+    assert second.content == first.content
+    assert len(CountingHandler.requests) == 1
+
+    # Failed responses are never cached
+    assert http_get(f"{server}/missing").status_code == 404
+    assert http_get(f"{server}/missing").status_code == 404
+    assert len(CountingHandler.requests) == 3
+
+    # Replay works offline, a missing response is an error
+    configure_http_cache("replay", str(tmp_path))
+    assert http_get("http://nowhere.invalid/oai", {"verb": "ListRecords"}).ok
+    with pytest.raises(CacheMissError):
+        http_get(f"{server}/oai", {"verb": "Identify"})
+    assert len(CountingHandler.requests) == 3
+
+
+def test_stand_in_serves_the_recorded_responses(server, tmp_path):
+    configure_http_cache("record", str(tmp_path))
+    recorded = http_get(f"{server}/api/query", {"id_list": "hep-th/0001001"})
+
+    stand_in = start_server(make_handler(ResponseCache(str(tmp_path))))
+    try:
+        url = f"http://127.0.0.1:{stand_in.server_port}/api/query"
+        response = requests.get(url, params={"id_list": "hep-th/0001001"})
+        assert response.status_code == 200
+        assert response.content == recorded.content
+        assert response.headers["Content-Type"] == "text/xml"
+
+        assert requests.get(url, params={"id_list": "other"}).status_code == 404
+    finally:
+        stand_in.shutdown()
+        stand_in.server_close()
+
+
+def test_rate_limiter_spaces_requests_from_all_threads():
+    limiter = RateLimiter()
+    finished = []
+
+    def request():
+        limiter.request(0.2, lambda: finished.append(time.monotonic()))
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    finished.sort()
+    assert all(b - a >= 0.19 for a, b in zip(finished, finished[1:]))
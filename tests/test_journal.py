@@ -0,0 +1,82 @@
+import json
+
+from src.journal import (
+    JsonlSink,
+    ProgressJournal,
+    is_journal_complete,
+    read_written_ids,
+    repair_jsonl,
+)
+
+
+def test_failed_papers_are_not_finished(tmp_path):
+    journal_file = str(tmp_path / "bucket.jsonl.progress.jsonl")
+
+    journal = ProgressJournal(journal_file)
+    journal.record_outcome("0001.0001", "written")
+    journal.record_outcome("0001.0002", "empty")
+    journal.record_outcome("0001.0003", "failed", "Timed out")
+    journal.close()
+
+    resumed = ProgressJournal(journal_file, resume=True)
+    assert resumed.finished_ids() == {"0001.0001", "0001.0002"}
+
+    # A retried paper is finished once it succeeds
+    resumed.record_outcome("0001.0003", "written")
+    assert resumed.finished_ids() == {"0001.0001", "0001.0002", "0001.0003"}
+    resumed.close()
+
+
+def test_half_written_line_is_cut_off(tmp_path):
+    database_file = str(tmp_path / "bucket.jsonl")
+    sink = JsonlSink(database_file)
+    sink.write({"arxiv_id": "0001.0001", "content": "A"})
+    sink.write({"arxiv_id": "hep-th/0001002", "content": "B"})
+    sink.close()
+    with open(database_file, "a", encoding="utf-8") as f:
+        f.write('{"arxiv_id": "0001.0003", "cont')
+
+    assert repair_jsonl(database_file)
+    assert read_written_ids(database_file) == {"0001.0001", "hep-th/0001002"}
+    # Nothing left to repair
+    assert not repair_jsonl(database_file)
+    assert not repair_jsonl(str(tmp_path / "missing.jsonl"))
+
+
+def test_written_ids_of_unusual_lines(tmp_path):
+    database_file = tmp_path / "bucket.jsonl"
+    database_file.write_text(
+        json.dumps({"content": "A", "arxiv_id": "0001.0001"}) + "\n\n"
+    )
+    assert read_written_ids(str(database_file)) == {"0001.0001"}
+    assert read_written_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_resume_keeps_the_metadata_and_the_outcomes(tmp_path):
+    journal_file = str(tmp_path / "bucket.jsonl.progress.jsonl")
+
+    journal = ProgressJournal(journal_file)
+    journal.record_metadata({"arxiv_id": "0001.0001", "title": "Paper"})
+    journal.record_outcome("0001.0001", "written")
+    journal.close()
+    # The run was killed while writing a record
+    with open(journal_file, "a", encoding="utf-8") as f:
+        f.write('{"id": "0001.0002", "sta')
+    assert not is_journal_complete(journal_file)
+
+    resumed = ProgressJournal(journal_file, resume=True)
+    assert resumed.metadata == {
+        "0001.0001": {"arxiv_id": "0001.0001", "title": "Paper"}
+    }
+    assert resumed.finished_ids() == {"0001.0001"}
+    assert not resumed.complete
+    resumed.record_complete()
+    resumed.close()
+    assert is_journal_complete(journal_file)
+
+    # A new run starts from scratch
+    ProgressJournal(journal_file).close()
+    assert not is_journal_complete(journal_file)
+    resumed = ProgressJournal(journal_file, resume=True)
+    assert resumed.finished_ids() == set()
+    resumed.close()
@@ -0,0 +1,153 @@
+import os
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import metadata_store
+from src.metadata_store import (
+    open_metadata_store,
+    update_metadata_store,
+    update_harvested_metadata,
+    lookup_metadata_record,
+    lookup_metadata_records,
+)
+
+
+class FakeHarvester:
+    """Stand-in for the OAI-PMH harvest, one record per requested day."""
+
+    def __init__(self, fail_after=None):
+        self.requests = []
+        self.fail_after = fail_after
+
+    def __call__(self, from_date, until_date, delay_seconds=5):
+        if self.fail_after is not None and len(self.requests) >= self.fail_after:
+            raise RuntimeError("HTTP response: 503")
+        self.requests.append((from_date, until_date))
+        day = from_date
+        while day <= until_date:
+            yield {"id": day.strftime("%y%m.%d"), "title": "Paper"}
+            day += timedelta(days=1)
+
+
+def harvested(store_path):
+    conn = open_metadata_store(store_path)
+    try:
+        return dict(
+            (month, (start, until))
+            for month, start, until in conn.execute(
+                "SELECT month, start, until FROM harvested_months"
+            )
+        )
+    finally:
+        conn.close()
+
+
+def write_snapshot(path, records, mtime):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def harvester(monkeypatch):
+    fake = FakeHarvester()
+    monkeypatch.setattr(metadata_store, "harvest_oaipmh", fake)
+    return fake
+
+
+def test_harvest_starts_at_the_requested_day(tmp_path, harvester):
+    store_path = str(tmp_path / "store.sqlite")
+
+    update_harvested_metadata(store_path, datetime(2020, 1, 25), datetime(2020, 2, 29))
+
+    # The previous month is harvested only from the 25th
+    assert harvester.requests[0][0] == datetime(2020, 1, 25)
+    assert harvested(store_path) == {
+        "2020-01": ("2020-01-25", "2020-01-31"),
+        "2020-02": ("2020-02-01", "2020-02-29"),
+    }
+
+
+def test_harvest_fills_only_the_missing_days(tmp_path, harvester):
+    store_path = str(tmp_path / "store.sqlite")
+    update_harvested_metadata(store_path, datetime(2020, 1, 25), datetime(2020, 1, 31))
+    harvester.requests.clear()
+
+    # Whole month, only the days before the 25th are missing
+    update_harvested_metadata(store_path, datetime(2020, 1, 1), datetime(2020, 1, 31))
+    assert harvester.requests[0][0] == datetime(2020, 1, 1)
+    assert max(until for _, until in harvester.requests) == datetime(2020, 1, 24)
+    assert harvested(store_path) == {"2020-01": ("2020-01-01", "2020-01-31")}
+
+    # Nothing left to harvest
+    harvester.requests.clear()
+    update_harvested_metadata(store_path, datetime(2020, 1, 25), datetime(2020, 1, 31))
+    assert harvester.requests == []
+
+
+def test_interrupted_harvest_continues(tmp_path, monkeypatch):
+    store_path = str(tmp_path / "store.sqlite")
+
+    # The third request of the month fails
+    failing = FakeHarvester(fail_after=2)
+    monkeypatch.setattr(metadata_store, "harvest_oaipmh", failing)
+    with pytest.raises(RuntimeError):
+        update_harvested_metadata(
+            store_path, datetime(2020, 3, 1), datetime(2020, 3, 31)
+        )
+    assert harvested(store_path) == {"2020-03": ("2020-03-01", "2020-03-14")}
+
+    # The next harvest continues from the last finished window
+    harvester = FakeHarvester()
+    monkeypatch.setattr(metadata_store, "harvest_oaipmh", harvester)
+    update_harvested_metadata(store_path, datetime(2020, 3, 1), datetime(2020, 3, 31))
+    assert harvester.requests[0][0] == datetime(2020, 3, 14)
+    assert harvested(store_path) == {"2020-03": ("2020-03-01", "2020-03-31")}
+
+    records = list(lookup_metadata_records(store_path, ["2003.01", "2003.28"]))
+    assert len(records) == 2
+
+
+def test_snapshot_updates_only_the_changed_records(tmp_path):
+    snapshot_path = str(tmp_path / "snapshot.json")
+    store_path = str(tmp_path / "store.sqlite")
+    records = [{"id": f"0704.000{i}", "title": f"Paper {i}"} for i in range(5)]
+
+    write_snapshot(snapshot_path, records, 1000)
+    assert update_metadata_store(snapshot_path, store_path) == 5
+
+    # The same snapshot is not read again
+    assert update_metadata_store(snapshot_path, store_path) == 0
+
+    # A newer snapshot with one changed and one new record
+    records[2]["title"] = "Revised paper"
+    records.append({"id": "0704.0005", "title": "Paper 5"})
+    write_snapshot(snapshot_path, records, 2000)
+    assert update_metadata_store(snapshot_path, store_path) == 2
+
+    conn = open_metadata_store(store_path)
+    try:
+        assert lookup_metadata_record(conn, "0704.0002")["title"] == "Revised paper"
+        assert lookup_metadata_record(conn, "0704.0005")["title"] == "Paper 5"
+        assert lookup_metadata_record(conn, "0704.9999") is None
+    finally:
+        conn.close()
+
+
+def test_lookup_skips_unknown_and_repeated_ids(tmp_path, monkeypatch):
+    snapshot_path = str(tmp_path / "snapshot.json")
+    store_path = str(tmp_path / "store.sqlite")
+    records = [{"id": f"0704.{i:04d}", "title": "Paper"} for i in range(30)]
+    write_snapshot(snapshot_path, records, 1000)
+    update_metadata_store(snapshot_path, store_path)
+
+    # Several lookup queries
+    monkeypatch.setattr(metadata_store, "LOOKUP_SIZE", 7)
+    arxiv_ids = [f"0704.{i:04d}" for i in range(0, 40, 2)] + ["0704.0000"]
+    found = sorted(
+        record["id"] for record in lookup_metadata_records(store_path, arxiv_ids)
+    )
+    assert found == [f"0704.{i:04d}" for i in range(0, 30, 2)]
@@ -0,0 +1,89 @@
+import json
+
+from src.paper_store import (
+    PaperStore,
+    open_paper_store,
+    read_stored_ids,
+    search_papers,
+)
+
+
+def make_entry(arxiv_id, title, content, categories=("hep-th",)):
+    return {
+        "arxiv_id": arxiv_id,
+        "pdf_url": f"https://arxiv.org/pdf/{arxiv_id}",
+        "title": title,
+        "authors": ["A. Author"],
+        "abstract": "Abstract",
+        "categories": list(categories),
+        "published": None,
+        "comments": None,
+        "license": None,
+        "content": content,
+    }
+
+
+def test_batches_are_committed_when_full(tmp_path):
+    store_path = str(tmp_path / "bucket.sqlite")
+    store = PaperStore(store_path, batch_size=2)
+
+    assert store.write(make_entry("0001.0001", "A", "a")) == []
+    assert store.write(make_entry("0001.0002", "B", "b")) == ["0001.0001", "0001.0002"]
+    assert store.write(make_entry("0001.0003", "C", "c")) == []
+    assert read_stored_ids(store_path) == {"0001.0001", "0001.0002"}
+
+    assert store.close() == ["0001.0003"]
+    assert read_stored_ids(store_path) == {"0001.0001", "0001.0002", "0001.0003"}
+    assert read_stored_ids(str(tmp_path / "missing.sqlite")) == set()
+
+
+def test_search_by_phrase_and_category(tmp_path):
+    store_path = str(tmp_path / "bucket.sqlite")
+    store = PaperStore(store_path)
+    store.write(make_entry("0001.0001", "Spin chains", "the spin chain is integrable"))
+    store.write(
+        make_entry("0001.0002", "Lattices", "a lattice spin model", ("hep-lat",))
+    )
+    store.write(make_entry("0001.0003", "Strings", "chain of strings"))
+    store.close()
+
+    found = search_papers(store_path, "spin chain")
+    assert [arxiv_id for arxiv_id, _, _ in found] == ["0001.0001"]
+    assert found[0][2] == "the «spin chain» is integrable"
+
+    found = search_papers(store_path, "spin", category="hep-lat")
+    assert [arxiv_id for arxiv_id, _, _ in found] == ["0001.0002"]
+
+    found = search_papers(store_path, category="hep-th")
+    assert [(arxiv_id, snippet) for arxiv_id, _, snippet in found] == [
+        ("0001.0001", None),
+        ("0001.0003", None),
+    ]
+
+    # Quotes in the phrase are not FTS5 syntax
+    assert search_papers(store_path, 'spin "chain')[0][0] == "0001.0001"
+    assert search_papers(store_path, "chain AND NOT") == []
+
+
+def test_rewritten_paper_replaces_its_index_entries(tmp_path):
+    store_path = str(tmp_path / "bucket.sqlite")
+    store = PaperStore(store_path)
+    store.write(make_entry("0001.0001", "Old", "old content"))
+    store.close()
+
+    store = PaperStore(store_path)
+    store.write(make_entry("0001.0001", "New", "new content", ("hep-th", "gr-qc")))
+    store.close()
+
+    assert search_papers(store_path, "old") == []
+    assert [title for _, title, _ in search_papers(store_path, "new")] == ["New"]
+    assert search_papers(store_path, category="gr-qc")[0][0] == "0001.0001"
+
+    conn = open_paper_store(store_path)
+    try:
+        rows = conn.execute("SELECT authors, categories FROM papers").fetchall()
+        count = conn.execute("SELECT COUNT(*) FROM paper_categories").fetchone()[0]
+    finally:
+        conn.close()
+    assert rows == [(json.dumps(["A. Author"]), json.dumps(["hep-th", "gr-qc"]))]
+    assert count == 2
@@ -0,0 +1,84 @@
+import os
+
+from src import pipeline
+from src.pipeline import (
+    process_entries,
+)
+
+
+def fake_process_entry_bytes(entry, data, *args):
+    """Stand-in for the paper stages, a paper can kill its worker."""
+    if data == b"die":
+        os._exit(1)
+    if data == b"fail":
+        raise RuntimeError(f"Unpacking failed for '{entry['arxiv_id']}'")
+    entry["content"] = data.decode("utf-8")
+    return entry
+
+
+def make_sources(payloads):
+    return [
+        ({"arxiv_id": arxiv_id, "safe_id": arxiv_id}, data)
+        for arxiv_id, data in payloads
+    ]
+
+
+def test_dead_worker_fails_only_its_paper(monkeypatch):
+    monkeypatch.setattr(pipeline, "process_entry_bytes", fake_process_entry_bytes)
+    payloads = [(f"0001.000{i}", b"text") for i in range(8)]
+    payloads[3] = ("0001.0003", b"die")
+    payloads[5] = ("0001.0005", b"fail")
+
+    results = list(
+        process_entries(
+            None, workers=2, sources=make_sources(payloads), start_method="fork"
+        )
+    )
+
+    # Every paper has a result, in the input order
+    assert [entry["arxiv_id"] for entry, _, _ in results] == [
+        arxiv_id for arxiv_id, _ in payloads
+    ]
+    errors = {entry["arxiv_id"]: error for entry, _, error in results if error}
+    assert set(errors) == {"0001.0003", "0001.0005"}
+    assert "Worker process died" in errors["0001.0003"]
+    assert all(
+        result["content"] == "text"
+        for entry, result, error in results
+        if not error
+    )
+
+
+def test_unordered_results_after_a_dead_worker(monkeypatch):
+    monkeypatch.setattr(pipeline, "process_entry_bytes", fake_process_entry_bytes)
+    payloads = [(f"0001.000{i}", b"text") for i in range(6)]
+    payloads[0] = ("0001.0000", b"die")
+
+    results = list(
+        process_entries(
+            None,
+            workers=3,
+            ordered=False,
+            sources=make_sources(payloads),
+            start_method="fork",
+        )
+    )
+
+    assert sorted(entry["arxiv_id"] for entry, _, _ in results) == [
+        arxiv_id for arxiv_id, _ in payloads
+    ]
+    assert [entry["arxiv_id"] for entry, _, error in results if error] == [
+        "0001.0000"
+    ]
+
+
+def test_entries_without_an_archive(monkeypatch):
+    monkeypatch.setattr(pipeline, "process_entry_bytes", fake_process_entry_bytes)
+    entries = [{"arxiv_id": arxiv_id, "safe_id": arxiv_id} for arxiv_id in "ab"]
+
+    results = list(process_entries(entries, sources=[("a", b"text")]))
+
+    assert [(entry["arxiv_id"], bool(error)) for entry, _, error in results] == [
+        ("a", False),
+        ("b", True),
+    ]
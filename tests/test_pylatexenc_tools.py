@@ -0,0 +1,172 @@
+import re
+import time
+import random
+
+import pytest
+
+from src.pylatexenc_tools import (
+    remove_header,
+    remove_hyperlinks,
+    remove_command_lines,
+    remove_abstract_commands,
+    remove_abstract_environments,
+)
+
+
+# Upper bound on the seconds of a single call on the pathological inputs,
+# the regexes these functions replaced took from seconds to minutes
+TIME_LIMIT = 2.0
+
+
+def reference_remove_header(plain_text):
+    """Frozen copy of the regex implementation."""
+    pattern = re.compile(r"^.*?={5,}\n+", re.MULTILINE | re.DOTALL)
+    return re.sub(pattern, "", plain_text, count=1)
+
+
+def reference_remove_command_lines(tex_content):
+    """Frozen copy of the regex implementation."""
+    return re.sub(
+        r"^\s*\\(input|include|def|newcommand)\b.*\n?",
+        "",
+        tex_content,
+        flags=re.MULTILINE,
+    )
+
+
+def reference_remove_abstract_environments(tex_content):
+    """Frozen copy of the regex implementation."""
+    return re.sub(
+        r"\\begin\{abstract\}.*?\\end\{abstract\}", "", tex_content, flags=re.DOTALL
+    )
+
+
+def random_text(rng, fragments, max_fragments=30):
+    return "".join(rng.choice(fragments) for _ in range(rng.randint(0, max_fragments)))
+
+
+@pytest.mark.parametrize(
+    "function, reference, fragments",
+    [
+        (
+            remove_header,
+            reference_remove_header,
+            ["=", "=====", "======\n", "\n", "\n\n", " ", "a", "title", "\t"],
+        ),
+        (
+            remove_command_lines,
+            reference_remove_command_lines,
+            [
+                "\\input", "\\include", "\\def", "\\newcommand", "\\definition",
+                "\\inputs", "{x}", " ", "\t", "\n", "\n\n", "\r", "\x0b", "a",
+                "\\", "%",
+            ],
+        ),
+        (
+            remove_abstract_environments,
+            reference_remove_abstract_environments,
+            [
+                "\\begin{abstract}", "\\end{abstract}", "\\begin{", "\\end{",
+                "abstract}", "\n", " ", "text", "\\",
+            ],
+        ),
+    ],
+    ids=["remove_header", "remove_command_lines", "remove_abstract_environments"],
+)
+def test_matches_reference(function, reference, fragments):
+    rng = random.Random(1729)
+    for _ in range(20000):
+        text = random_text(rng, fragments)
+        assert function(text) == reference(text), repr(text)
+
+
+@pytest.mark.parametrize(
+    "tex_content, expected",
+    [
+        ("see \\href{http://a.b}{the page}.", "see the page."),
+        ("\\href{u}{a {b} c} d", "a {b} c d"),
+        ("\\href{a}{\\href{b}{c}} d", "c d"),
+        ("\\href{u}{\\href{v}{\\textbf{w}}}", "\\textbf{w}"),
+        ("\\href{\\href{x}{y}}{t}", "t"),
+        ("\\href{u\\}}{t}", "t"),
+        ("\\href{u}{unclosed", "\\href{u}{unclosed"),
+        ("\\href{u} {t}", "\\href{u} {t}"),
+        ("\\href{u}", "\\href{u}"),
+    ],
+)
+def test_remove_hyperlinks(tex_content, expected):
+    assert remove_hyperlinks(tex_content) == expected
+
+
+@pytest.mark.parametrize(
+    "tex_content, expected",
+    [
+        ("a \\abstract{text} b", "a  b"),
+        ("a \\abstract{x {y} z} b", "a  b"),
+        ("a \\abstract{x \\} y} b", "a  b"),
+        # An unbalanced argument keeps the rest of the text
+        ("a \\abstract{open and more text", "a \\abstract{open and more text"),
+        ("\\abstract{x} \\abstract{open", " \\abstract{open"),
+        ("\\abstracts{x}", "\\abstracts{x}"),
+        # A trailing command without an argument is kept
+        ("text \\abstract", "text \\abstract"),
+    ],
+)
+def test_remove_abstract_commands(tex_content, expected):
+    assert remove_abstract_commands(tex_content) == expected
+
+
+def test_remove_header():
+    assert remove_header("Title\nAuthors\n=====\n\nBody") == "Body"
+    assert remove_header("a ==== b\n======\nBody") == "Body"
+    assert remove_header("no header\nBody") == "no header\nBody"
+
+
+def _nested_hrefs(depth):
+    return "\\href{u}{" * depth + "text" + "}" * depth
+
+
+# Inputs on which the regexes backtracked, with the expected output
+PATHOLOGICAL = [
+    # No header separator in a large text
+    ("header_without_separator", remove_header, "line ====\n" * 50000, None),
+    # Long whitespace runs in front of a command in the middle of a line
+    (
+        "whitespace_before_def",
+        remove_command_lines,
+        (" \n" * 50000 + "x\\def\n") * 2,
+        None,
+    ),
+    # Many abstract environments which are never closed
+    (
+        "unclosed_abstract_environments",
+        remove_abstract_environments,
+        "\\begin{abstract} text " * 50000,
+        None,
+    ),
+    # Deeply nested links
+    ("nested_hrefs", remove_hyperlinks, _nested_hrefs(20000), "text"),
+    # Many unbalanced links
+    ("unclosed_hrefs", remove_hyperlinks, "\\href{u}{" * 50000, None),
+    # Many unbalanced abstract commands and a trailing one
+    (
+        "unclosed_abstract_commands",
+        remove_abstract_commands,
+        "\\abstract{" * 50000 + "\\abstract",
+        None,
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    "function, text, expected",
+    [case[1:] for case in PATHOLOGICAL],
+    ids=[case[0] for case in PATHOLOGICAL],
+)
+def test_pathological_inputs(function, text, expected):
+    start = time.perf_counter()
+    result = function(text)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < TIME_LIMIT
+    assert result == (text if expected is None else expected)
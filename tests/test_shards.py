@@ -0,0 +1,81 @@
+import os
+
+from src.shards import (
+    INDEX_NAME,
+    ShardedJsonlSink,
+    lookup_entry,
+    partition_key,
+    read_shard_index,
+)
+
+
+def make_entry(arxiv_id, categories=("hep-th",), content="x" * 50):
+    return {"arxiv_id": arxiv_id, "categories": list(categories), "content": content}
+
+
+def test_partition_keys():
+    assert partition_key(make_entry("2101.00001"), "month") == "2021-01"
+    assert partition_key(make_entry("hep-th/9901001"), "month") == "1999-01"
+    assert partition_key(make_entry("hep-th/0001001"), "month") == "2000-01"
+    assert partition_key(make_entry("2101.00001", ("gr-qc",)), "category") == "gr-qc"
+    assert partition_key(make_entry("2101.00001", ()), "category") == "unknown"
+    assert partition_key(make_entry("2101.00001"), None) is None
+
+
+def test_shards_roll_over_and_entries_are_found(tmp_path):
+    shard_dir = str(tmp_path / "bucket")
+    sink = ShardedJsonlSink(shard_dir, shard_size=250)
+    entries = [make_entry(f"0001.{i:04d}") for i in range(5)]
+    for entry in entries:
+        assert sink.write(entry) == [entry["arxiv_id"]]
+    sink.close()
+
+    shards = sorted(name for name in os.listdir(shard_dir) if name != INDEX_NAME)
+    assert shards == ["part-00000.jsonl", "part-00001.jsonl", "part-00002.jsonl"]
+    for size in (os.path.getsize(os.path.join(shard_dir, s)) for s in shards):
+        assert size <= 250
+
+    index = read_shard_index(shard_dir)
+    assert set(index) == {entry["arxiv_id"] for entry in entries}
+    for entry in entries:
+        assert lookup_entry(shard_dir, entry["arxiv_id"], index) == entry
+    assert lookup_entry(shard_dir, "0001.9999") is None
+
+
+def test_partitions_get_their_own_shards(tmp_path):
+    shard_dir = str(tmp_path / "bucket")
+    sink = ShardedJsonlSink(shard_dir, partition="category")
+    sink.write(make_entry("0001.0001", ("hep-th",)))
+    sink.write(make_entry("0001.0002", ("gr-qc",)))
+    sink.close()
+
+    index = read_shard_index(shard_dir)
+    assert index["0001.0001"][0] == os.path.join("hep-th", "part-00000.jsonl")
+    assert index["0001.0002"][0] == os.path.join("gr-qc", "part-00000.jsonl")
+    assert lookup_entry(shard_dir, "0001.0002")["categories"] == ["gr-qc"]
+
+
+def test_reopen_cuts_off_the_unindexed_entries(tmp_path):
+    shard_dir = str(tmp_path / "bucket")
+    sink = ShardedJsonlSink(shard_dir)
+    sink.write(make_entry("0001.0001"))
+    sink.close()
+    shard_path = os.path.join(shard_dir, "part-00000.jsonl")
+    indexed_size = os.path.getsize(shard_path)
+
+    # A crash between the shard and the index writes
+    with open(shard_path, "ab") as f:
+        f.write(b'{"arxiv_id": "0001.0002", "cont')
+    with open(os.path.join(shard_dir, INDEX_NAME), "a", encoding="utf-8") as f:
+        f.write('{"id": "0001.00')
+
+    sink = ShardedJsonlSink(shard_dir)
+    assert os.path.getsize(shard_path) == indexed_size
+    sink.write(make_entry("0001.0002"))
+    sink.close()
+
+    index = read_shard_index(shard_dir)
+    assert set(index) == {"0001.0001", "0001.0002"}
+    assert lookup_entry(shard_dir, "0001.0002", index)["arxiv_id"] == "0001.0002"
+    with open(shard_path, "rb") as f:
+        assert len(f.read().splitlines()) == 2
@@ -0,0 +1,140 @@
+import re
+import random
+
+import pytest
+
+from src.tex_tools import (
+    remove_comments_tex,
+    merge_tex_contents,
+)
+
+
+def reference_remove_comments_tex(tex_content):
+    """Frozen copy of the character-by-character implementation."""
+
+    VERBATIM = ["verbatim", "lstlisting", "minted"]
+
+    begin_env_pattern = re.compile(r"\\begin\{(\w+)\}")
+    end_env_pattern = re.compile(r"\\end\{(\w+)\}")
+    inline_verb_pattern = re.compile(r"(\\(verb|lstinline)\S)(.*?)(?=\1)")
+    comment_pattern = re.compile(r"(?<!\\)%")
+
+    i = 0
+    n = len(tex_content)
+    result = []
+    env_stack = []
+
+    while i < n:
+        char = tex_content[i]
+
+        begin_match = begin_env_pattern.match(tex_content, i)
+        if begin_match:
+            env_name = begin_match.group(1)
+            if env_name in VERBATIM:
+                env_stack.append(env_name)
+            result.append(tex_content[i : i + begin_match.end() - begin_match.start()])
+            i += begin_match.end() - begin_match.start()
+            continue
+
+        end_match = end_env_pattern.match(tex_content, i)
+        if end_match:
+            env_name = end_match.group(1)
+            if env_name in VERBATIM and env_stack:
+                env_stack.pop()
+            result.append(tex_content[i : i + end_match.end() - end_match.start()])
+            i += end_match.end() - end_match.start()
+            continue
+
+        verb_match = inline_verb_pattern.match(tex_content, i)
+        if verb_match:
+            prefix = verb_match.group(1)
+            content = verb_match.group(3)
+            delim = prefix[-1]
+            result.append(f"{prefix}{content}{delim}")
+            i += len(prefix) + len(content) + len(delim)
+            continue
+
+        comment_pos = comment_pattern.match(tex_content, i)
+        if comment_pos:
+            while result and result[-1].isspace():
+                result.pop()
+            if result and result[-1] == "\n":
+                result.pop()
+            while i < n and tex_content[i] != "\n":
+                i += 1
+            continue
+
+        result.append(char)
+        i += 1
+
+    tex_content = "".join(result)
+    tex_content = tex_content.lstrip("\n")
+
+    return tex_content
+
+
+@pytest.mark.parametrize(
+    "tex_content, expected",
+    [
+        # Escaped percent signs are kept
+        ("a 50\\% b % comment\nnext", "a 50\\% b\nnext"),
+        ("a \\\\% b\n", "a \\\\% b\n"),
+        # A single \verb is not recognised, its % starts a comment
+        ("\\verb|%| kept % gone\nx", "\\verb|\nx"),
+        ("\\lstinline!a%b! and % c\nd", "\\lstinline!a\nd"),
+        ("\\verb|% unterminated\nline % c\n", "\\verb|\nline\n"),
+        # Inline verbatim needs a second \verb<delim> on the line, whose
+        # backslash is replaced by the delimiter
+        ("\\verb|a%b|\\verb|c| % x\nz", "\\verb|a%b||verb|c|\nz"),
+        ("\\lstinline!50%!\\lstinline!x! % y\n", "\\lstinline!50%!!lstinline!x!\n"),
+        # Verbatim environments do not protect their comments
+        (
+            "\\begin{verbatim}\n% inside\nx % y\n\\end{verbatim}\n",
+            "\\begin{verbatim}\nx\n\\end{verbatim}\n",
+        ),
+        # Trailing whitespace and comment-only lines disappear
+        ("line one   % c1\n   % c2\nline two\t% c3\nend", "line one\nline two\nend"),
+        ("\n\n% top\n\ntext", "text"),
+        ("no comments at all\n", "no comments at all\n"),
+        ("%", ""),
+        ("", ""),
+    ],
+)
+def test_remove_comments_tex_golden(tex_content, expected):
+    assert remove_comments_tex(tex_content) == expected
+    assert reference_remove_comments_tex(tex_content) == expected
+
+
+# Fragments the random sources are built from, rich in the tricky tokens
+FRAGMENTS = [
+    "%", "\\%", "\\\\", "\\", " ", "\t", "\n", "\n\n", "a", "text ",
+    "\\verb", "\\lstinline", "|", "!", "+", "{", "}",
+    "\\begin{verbatim}", "\\end{verbatim}", "\\begin{lstlisting}",
+    "\\end{lstlisting}", "\\begin{minted}", "\\end{minted}",
+    "\\begin{itemize}", "\\end{itemize}", "\\begin{", "\\end{",
+    "\\verb|", "\\verb|x|", "\\lstinline!y!", "é", "\r\n",
+]
+
+
+def test_remove_comments_tex_matches_reference():
+    rng = random.Random(20240521)
+    for _ in range(20000):
+        tex_content = "".join(
+            rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 40))
+        )
+        assert remove_comments_tex(tex_content) == reference_remove_comments_tex(
+            tex_content
+        ), repr(tex_content)
+
+
+def test_merge_resolves_nested_inclusions():
+    tex_contents = {
+        "main.tex": "Start \\input{sections/a}\nEnd \\include{b}\n",
+        "sections/a.tex": "A \\input{c} A\n",
+        "sections/c.tex": "C\n",
+        "b.tex": "B\n",
+    }
+
+    merged = merge_tex_contents(tex_contents)
+
+    assert merged.split() == ["Start", "A", "C", "A", "End", "B"]
@@ -0,0 +1,61 @@
+import os
+import time
+
+import pytest
+
+from src.worker_pool import (
+    WorkerPool,
+    WorkerTimeoutError,
+)
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def divide(a, b):
+    return a / b
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+
+def die():
+    os._exit(1)
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(1)
+    yield pool
+    pool.close()
+
+
+def test_workers_are_reused(pool):
+    pid = pool.run(worker_pid)
+    assert pid != os.getpid()
+    assert pool.run(worker_pid) == pid
+    assert pool.run(divide, 1, 2) == 0.5
+
+
+def test_task_errors_keep_the_worker(pool):
+    pid = pool.run(worker_pid)
+    with pytest.raises(RuntimeError, match="ZeroDivisionError"):
+        pool.run(divide, 1, 0)
+    assert pool.run(worker_pid) == pid
+
+
+def test_timeout_replaces_the_worker(pool):
+    pid = pool.run(worker_pid)
+    with pytest.raises(WorkerTimeoutError):
+        pool.run(sleep, 10, timeout=0.5)
+    assert pool.run(worker_pid) != pid
+    assert pool.run(divide, 4, 2) == 2
+
+
+def test_dead_worker_is_respawned(pool):
+    pid = pool.run(worker_pid)
+    with pytest.raises(RuntimeError, match="Worker process died"):
+        pool.run(die)
+    assert pool.run(worker_pid) != pid